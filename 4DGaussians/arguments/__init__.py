@@ -52,17 +52,22 @@ class ModelParams(ParamGroup):
         self._images = "images"
         self._resolution = -1
         self._white_background = True
-        self.data_device = "cuda"
+        self.device = "cuda" # device of the Gaussians, the deformation network and the renders; "cpu" runs load, training, rendering and export without CUDA (gaussian_renderer/cpu_rasterizer.py).
+        self.data_device = "" # device of the camera images, the one of --device when empty.
         self.eval = True
         self.render_process=False
         self.add_points=False
         self.extension=".png"
         self.llffhold=8
+        self.packed_checkpoint = "model.pack" # single-file checkpoint in point_cloud/iteration_*/ that Scene loads instead of the ply and .pth files when present.
         super().__init__(parser, "Loading Parameters", sentinel)
 
     def extract(self, args):
         g = super().extract(args)
         g.source_path = os.path.abspath(g.source_path)
+        # cfg_args of models trained before the device setting do not have it
+        g.device = getattr(g, "device", None) or "cuda"
+        g.data_device = getattr(g, "data_device", None) or g.device
         return g
 
 class PipelineParams(ParamGroup):
@@ -70,6 +75,10 @@ class PipelineParams(ParamGroup):
         self.convert_SHs_python = False
         self.compute_cov3D_python = False
         self.debug = False
+        self.use_trajectory = False # deform with the closed-form trajectories of distill_trajectories.py (trajectory.pth) instead of the HexPlane field.
+        self.frustum_culling = False # renders without gradients only deform and rasterize the Gaussians that may be in the camera frustum (grid of deformation bounds from GaussianModel.build_spatial_index(), which render.py calls; without it everything is rendered). Pays off for zoomed-in or partial views.
+        self.frustum_culling_max_visible = 0.8 # frustum_culling renders everything when more than this share of the Gaussians may be visible, as the gather and scatter then cost more than culling saves.
+        self.lod_pixel_error = 0.0 # > 0 renders without gradients from a level-of-detail cut (scene/lod.py): merged Gaussians whose projected size stays below this many pixels replace their children.
         super().__init__(parser, "Pipeline Parameters")
 class ModelHiddenParams(ParamGroup):
     def __init__(self, parser):
@@ -102,6 +111,8 @@ class ModelHiddenParams(ParamGroup):
         self.grid_pe=0 # useless, I was trying to add positional encoding to hexplane's features
         self.static_mlp=False # useless
         self.apply_rotation=False # useless
+        self.fused_heads=False # run the enabled deformation heads as one wide Linear + one block-diagonal matmul, checkpoints keep the per-head layout.
+        self.state_cache_mb=256 # memory budget (MB) of the per-timestamp cache of deformed Gaussians used by no-grad renders, 0 disables it.
 
         
         super().__init__(parser, "ModelHiddenParams")
@@ -146,7 +157,15 @@ class OptimizationParams(ParamGroup):
         self.opacity_threshold_fine_init = 0.005
         self.opacity_threshold_fine_after = 0.005
         self.batch_size=1
-        self.add_point=False
+        self.batch_timestamps = 0 # > 0 draws each batch from about this many timestamps, so its cameras share deformations (render_batch), 0 samples cameras independently.
+        self.static_threshold = 0.0 # Gaussians whose mean per-axis displacement stays below this are marked static and skip the deformation field, 0 keeps every Gaussian dynamic.
+        self.static_from_iter = 5000 # fine-stage iteration from which the static/dynamic classification is updated (every densification_interval).
+        self.capacity_growth = 0.0 # > 0 keeps the per-Gaussian parameters and Adam moments in buffers over-allocated by this factor (e.g. 1.5) that densification appends to and pruning compacts in place, 0 reallocates them every time.
+        self.sparse_adam = False # only update the Adam moments and values of the Gaussians visible in the current iteration (dense Adam for the deformation network).
+        self.max_gaussians = 360_000 # Gaussian budget: densification admits the highest-gradient candidates up to it, the least important Gaussians (opacity, screen footprint, gradient) are pruned above it.
+        self.max_gaussian_bytes = 0 # > 0 also caps the Gaussians by memory: parameters, Adam moments and statistics (GaussianModel.bytes_per_gaussian).
+        self.min_gaussians = 200_000 # opacity / size pruning only runs above this many Gaussians.
+        self.budget_turnover = 0.02 # at the budget, this fraction of it is replaced per densification (least important Gaussians out, highest-gradient candidates in).
         super().__init__(parser, "Optimization Parameters")
 
 def get_combined_args(parser : ArgumentParser):
@@ -0,0 +1,97 @@
+#
+# Compress a trained model (SH codebooks, quantized attributes and grids, see
+# utils/compression.py) into a packed checkpoint and report its size and PSNR
+# against the uncompressed model.
+#
+#   python compress_model.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py
+#   python render.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py --packed_checkpoint model_compressed.pack
+#
+import os
+import json
+import torch
+from tqdm import tqdm
+from argparse import ArgumentParser
+from scene import Scene
+from gaussian_renderer import render, GaussianModel
+from arguments import ModelParams, PipelineParams, get_combined_args, ModelHiddenParams
+from utils.general_utils import safe_state
+from utils.image_utils import psnr
+from utils.compression import compress_gaussians
+from utils.packed_checkpoint import save_packed
+
+UNCOMPRESSED_FILES = ["point_cloud.ply", "deformation.pth", "deformation_table.pth", "deformation_accum.pth"]
+
+
+@torch.no_grad()
+def mean_psnr(views, gaussians, pipeline, background, cam_type):
+    gaussians.clear_state_cache()
+    psnrs = []
+    for view in tqdm(views, desc="Evaluating"):
+        image = render(view, gaussians, pipeline, background, cam_type=cam_type)["render"]
+        if cam_type != "PanopticSports":
+            gt = view.original_image[0:3, :, :].to(image.device)
+        else:
+            gt = view["image"].to(image.device)
+        psnrs.append(psnr(image.clamp(0.0, 1.0)[None], gt[None]).mean().item())
+    return sum(psnrs) / len(psnrs)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compressed model export")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--output", default="model_compressed.pack", type=str)
+    parser.add_argument("--sh_codebook_size", default=4096, type=int, help="k-means clusters of the SH rest coefficients, 0 stores them directly")
+    parser.add_argument("--scale_rotation_codebook_size", default=0, type=int)
+    parser.add_argument("--kmeans_iterations", default=10, type=int)
+    parser.add_argument("--position_bits", default=16, type=int, choices=[8, 16, 32])
+    parser.add_argument("--opacity_bits", default=8, type=int, choices=[8, 16, 32])
+    parser.add_argument("--attribute_bits", default=16, type=int, choices=[8, 16, 32])
+    parser.add_argument("--grid_bits", default=16, type=int, choices=[8, 16, 32])
+    parser.add_argument("--skip_eval", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--configs", type=str)
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    safe_state(args.quiet)
+
+    dataset, hyper, pipe = model.extract(args), hyperparam.extract(args), pipeline.extract(args)
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, hyper, dataset.device)
+        scene = Scene(dataset, gaussians, load_iteration=args.iteration, shuffle=False)
+        path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(scene.loaded_iter))
+        bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+        views = scene.getTestCameras() if len(scene.getTestCameras()) else scene.getTrainCameras()
+        if not args.skip_eval:
+            full_psnr = mean_psnr(views, gaussians, pipe, background, scene.dataset_type)
+
+        sections, metadata = compress_gaussians(gaussians, args.sh_codebook_size, args.scale_rotation_codebook_size,
+                                                args.kmeans_iterations, args.position_bits, args.opacity_bits,
+                                                args.attribute_bits, args.grid_bits)
+        output_path = os.path.join(path, args.output)
+        save_packed(output_path, sections, metadata)
+        gaussians.load_packed(output_path)
+
+        uncompressed_size = sum(os.path.getsize(os.path.join(path, name)) for name in UNCOMPRESSED_FILES
+                                if os.path.exists(os.path.join(path, name)))
+        compressed_size = os.path.getsize(output_path)
+        report = {"iteration": scene.loaded_iter, "num_gaussians": gaussians.get_xyz.shape[0],
+                  "uncompressed_mb": uncompressed_size / 2**20, "compressed_mb": compressed_size / 2**20,
+                  "ratio": uncompressed_size / compressed_size, "settings": {key: getattr(args, key) for key in
+                  ["sh_codebook_size", "scale_rotation_codebook_size", "position_bits", "opacity_bits",
+                   "attribute_bits", "grid_bits"]}}
+        if not args.skip_eval:
+            compressed_psnr = mean_psnr(views, gaussians, pipe, background, scene.dataset_type)
+            report.update({"psnr": full_psnr, "compressed_psnr": compressed_psnr, "psnr_loss": full_psnr - compressed_psnr})
+        with open(os.path.join(dataset.model_path, "compression_report.json"), "w") as f:
+            json.dump(report, f, indent=True)
+        print(f"{dataset.model_path}: {report['uncompressed_mb']:.1f} MB -> {report['compressed_mb']:.1f} MB "
+              f"({report['ratio']:.1f}x)" + ("" if args.skip_eval else f", PSNR {full_psnr:.3f} -> {compressed_psnr:.3f} dB "
+                                                                     f"(loss {report['psnr_loss']:.3f} dB)"))
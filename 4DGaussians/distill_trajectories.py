@@ -0,0 +1,90 @@
+#
+# Distill the HexPlane deformation field of a trained model into per-Gaussian
+# closed-form trajectories (scene/trajectory.py) for playback-only deployments.
+#
+#   python distill_trajectories.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py --basis polynomial --degree 4
+#   python render.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py --use_trajectory
+#
+import os
+import torch
+from tqdm import tqdm
+from argparse import ArgumentParser
+from time import time
+from scene import Scene
+from scene.trajectory import GaussianTrajectory
+from gaussian_renderer import render, GaussianModel
+from arguments import ModelParams, PipelineParams, get_combined_args, ModelHiddenParams
+from utils.general_utils import safe_state
+from utils.image_utils import psnr
+from utils.render_utils import get_camera_times
+
+
+def evaluate(views, gaussians, pipeline, background, cam_type):
+    """Mean PSNR of the full model and of the trajectories, plus the deformation + render time of each."""
+    results = {}
+    for use_trajectory in [False, True]:
+        pipeline.use_trajectory = use_trajectory
+        gaussians.clear_state_cache()
+        psnrs = []
+        elapsed = 0.
+        for view in tqdm(views, desc="trajectory" if use_trajectory else "deformation field"):
+            if gaussians.device.type == "cuda":
+                torch.cuda.synchronize()
+            start = time()
+            image = render(view, gaussians, pipeline, background, cam_type=cam_type)["render"]
+            if gaussians.device.type == "cuda":
+                torch.cuda.synchronize()
+            elapsed += time() - start
+            if cam_type != "PanopticSports":
+                gt = view.original_image[0:3, :, :].to(image.device)
+            else:
+                gt = view["image"].to(image.device)
+            psnrs.append(psnr(image.clamp(0.0, 1.0)[None], gt[None]).mean().item())
+        results[use_trajectory] = (sum(psnrs) / len(psnrs), elapsed / len(psnrs))
+    pipeline.use_trajectory = False
+    gaussians.clear_state_cache()
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Closed-form trajectory distillation")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--basis", default="polynomial", choices=["polynomial", "fourier"])
+    parser.add_argument("--degree", default=4, type=int, help="polynomial degree or number of Fourier harmonics")
+    parser.add_argument("--skip_eval", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--configs", type=str)
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    safe_state(args.quiet)
+
+    dataset, hyper, pipe = model.extract(args), hyperparam.extract(args), pipeline.extract(args)
+    if not (hyper.no_do and hyper.no_dshs):
+        print("Warning: only position, scaling and rotation are distilled, opacity and SH deformations are dropped.")
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, hyper, dataset.device)
+        scene = Scene(dataset, gaussians, load_iteration=args.iteration, shuffle=False)
+        timestamps = sorted(set(get_camera_times(scene.getTrainCameras())))
+        print(f"Fitting {args.basis} trajectories of degree {args.degree} to {len(timestamps)} timestamps")
+        trajectory = GaussianTrajectory.fit(gaussians, timestamps, args.basis, args.degree)
+        path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(scene.loaded_iter), "trajectory.pth")
+        trajectory.save(path)
+        gaussians._trajectory = trajectory
+        print(f"Saved {trajectory.num_points} trajectories ({trajectory.coefficients.numel() * 4 / 2**20:.1f} MB) to {path}")
+
+        if not args.skip_eval:
+            bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+            background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+            views = scene.getTestCameras() if len(scene.getTestCameras()) else scene.getTrainCameras()
+            results = evaluate(views, gaussians, pipe, background, scene.dataset_type)
+            (full_psnr, full_time), (trajectory_psnr, trajectory_time) = results[False], results[True]
+            print(f"deformation field: PSNR {full_psnr:.3f} dB, {1000 * full_time:.2f} ms/frame")
+            print(f"trajectory:        PSNR {trajectory_psnr:.3f} dB, {1000 * trajectory_time:.2f} ms/frame")
+            print(f"PSNR loss: {full_psnr - trajectory_psnr:.3f} dB")
@@ -0,0 +1,125 @@
+#
+# Export the deformation network (MLPs and HexPlane grids) of a trained model as a
+# self-contained TorchScript module, optionally also as ONNX, for serving without the
+# training stack. Load it with utils/deformation_runtime.py.
+#
+#   python export_deformation.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py --onnx
+#
+import os
+import json
+import torch
+from argparse import ArgumentParser
+from arguments import ModelParams, ModelHiddenParams, get_combined_args
+from scene.deformation import deform_network
+from utils.system_utils import searchForMaxIteration
+from utils.deformation_runtime import load_deformation
+
+
+class ExportedDeformation(torch.nn.Module):
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def forward(self, xyz, scales, rotations, opacity, shs, t):
+        return self.network(xyz, scales, rotations, opacity, shs, t)
+
+
+def example_inputs(network, num_points, device):
+    aabb_max, aabb_min = network.get_aabb
+    xyz = aabb_min + torch.rand(num_points, 3, device=device) * (aabb_max - aabb_min)
+    scales = torch.randn(num_points, 3, device=device) - 4
+    rotations = torch.nn.functional.normalize(torch.randn(num_points, 4, device=device))
+    opacity = torch.randn(num_points, 1, device=device)
+    shs = torch.randn(num_points, 16, 3, device=device)
+    t = torch.rand(num_points, 1, device=device)
+    return xyz, scales, rotations, opacity, shs, t
+
+
+def prepare_for_export(network):
+    # the inference caches and per-frame shortcuts key on Python-side state that a
+    # trace would freeze, so the traced graph is the plain lean forward
+    grid = network.deformation_net.grid
+    grid.cache_space_features = False
+    grid.slice_time_planes = False
+    grid.fused_sampling = False
+    network.lean_inference = True
+    return ExportedDeformation(network).eval()
+
+
+@torch.no_grad()
+def check_parity(path, network, device, num_points=4096, tolerance=1e-4):
+    runtime = load_deformation(path, device)
+    max_error = 0.
+    for _ in range(4):
+        inputs = example_inputs(network, num_points, device)
+        with torch.enable_grad():
+            reference = network(*inputs)
+        exported = runtime(*inputs)
+        max_error = max(max_error, max((a - b).abs().max().item() for a, b in zip(reference, exported)))
+    print(f"parity against deform_network.forward: max abs difference {max_error:.3e}")
+    assert max_error < tolerance, "exported deformation does not match deform_network.forward"
+
+
+@torch.no_grad()
+def check_onnx_parity(path, network, device, num_points=4096, tolerance=1e-4):
+    try:
+        import onnxruntime
+    except ImportError:
+        print("onnxruntime not installed, skipping the ONNX parity check")
+        return
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    names = [i.name for i in session.get_inputs()]
+    inputs = example_inputs(network, num_points, device)
+    with torch.enable_grad():
+        reference = network(*inputs)
+    exported = session.run(None, {name: value.cpu().numpy() for name, value in zip(names, inputs)})
+    max_error = max((a.detach().cpu() - torch.from_numpy(b)).abs().max().item() for a, b in zip(reference, exported))
+    print(f"ONNX parity against deform_network.forward: max abs difference {max_error:.3e}")
+    assert max_error < tolerance, "ONNX deformation does not match deform_network.forward"
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Deformation network export")
+    model = ModelParams(parser, sentinel=True)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--export_device", default="cpu", type=str, help="device the exported module is traced for")
+    parser.add_argument("--onnx", action="store_true", help="also write deformation.onnx")
+    parser.add_argument("--configs", type=str)
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+
+    iteration = args.iteration
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(args.model_path, "point_cloud"))
+    path = os.path.join(args.model_path, "point_cloud", "iteration_" + str(iteration))
+    hyper = hyperparam.extract(args)
+    network = deform_network(hyper)
+    network.load_state_dict(torch.load(os.path.join(path, "deformation.pth"), map_location="cpu"))
+    network = network.to(args.export_device).eval()
+    module = prepare_for_export(network)
+
+    inputs = example_inputs(network, 1024, args.export_device)
+    with torch.no_grad():
+        traced = torch.jit.trace(module, inputs, check_trace=False)
+    config = {"no_dx": hyper.no_dx, "no_ds": hyper.no_ds, "no_dr": hyper.no_dr,
+              "no_do": hyper.no_do, "no_dshs": hyper.no_dshs, "iteration": iteration}
+    output_path = os.path.join(path, "deformation_ts.pt")
+    torch.jit.save(traced, output_path, _extra_files={"config.json": json.dumps(config)})
+    print("TorchScript module saved to", output_path)
+    check_parity(output_path, network, args.export_device)
+
+    if args.onnx:
+        onnx_path = os.path.join(path, "deformation.onnx")
+        names = ["xyz", "scales", "rotations", "opacity", "shs", "t"]
+        output_names = ["means3D", "scales_deformed", "rotations_deformed", "opacity_deformed", "shs_deformed"]
+        with torch.no_grad():
+            torch.onnx.export(module, inputs, onnx_path, input_names=names, output_names=output_names,
+                              dynamic_axes={name: {0: "num_points"} for name in names + output_names},
+                              opset_version=16)
+        print("ONNX model saved to", onnx_path)
+        check_onnx_parity(onnx_path, network, args.export_device)
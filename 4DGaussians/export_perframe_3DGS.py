@@ -14,18 +14,18 @@ from arguments import ModelParams, PipelineParams, get_combined_args, ModelHidde
 from gaussian_renderer import GaussianModel
 from time import time
 import open3d as o3d
-from plyfile import PlyData, PlyElement
+from utils.ply_utils import write_ply
 # import torch.multiprocessing as mp
 import threading
-from utils.render_utils import get_state_at_time
+from utils.render_utils import get_camera_times
 import concurrent.futures
 def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, skip_video: bool):
     with torch.no_grad():
-        gaussians = GaussianModel(dataset.sh_degree, hyperparam)
+        gaussians = GaussianModel(dataset.sh_degree, hyperparam, dataset.device)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
-        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
 
     return gaussians, scene
 
@@ -52,7 +52,7 @@ def construct_list_of_attributes(feature_dc_shape, feature_rest_shape, scaling_s
         l.append('rot_{}'.format(i))
     # breakpoint()
     return l
-def init_3DGaussians_ply(points, scales, rotations, opactiy, shs, feature_shape):
+def save_3DGaussians_ply(path, points, scales, rotations, opactiy, shs, feature_shape):
     xyz = points.detach().cpu().numpy()
     normals = np.zeros_like(xyz)
     feature_dc = shs[:,0:feature_shape[0],:]
@@ -64,13 +64,8 @@ def init_3DGaussians_ply(points, scales, rotations, opactiy, shs, feature_shape)
     scale = scales.detach().cpu().numpy()
     rotation = rotations.detach().cpu().numpy()
 
-    dtype_full = [(attribute, 'f4') for attribute in construct_list_of_attributes(feature_dc.shape, feature_rest.shape, scales.shape, rotations.shape)]
-    elements = np.empty(xyz.shape[0], dtype=dtype_full)
     attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-    elements[:] = list(map(tuple, attributes))
-    el = PlyElement.describe(elements, 'vertex')
-    # breakpoint()
-    return PlyData([el])
+    write_ply(path, attributes.astype(np.float32), construct_list_of_attributes(feature_dc.shape, feature_rest.shape, scales.shape, rotations.shape))
     
 parser = ArgumentParser(description="Testing script parameters")
 model = ModelParams(parser, sentinel=True)
@@ -97,11 +92,12 @@ gaussians, scene = render_sets(model.extract(args), hyperparam.extract(args), ar
 output_path = os.path.join(args.model_path,"gaussian_pertimestamp")
 os.makedirs(output_path,exist_ok=True)
 print("Computing Gaussians.")
-for index, viewpoint in enumerate(scene.getTestCameras()):
-    
-    points, scales_final, rotations_final, opacity_final, shs_final = get_state_at_time(gaussians, viewpoint)
+# all timestamps go through the deformation field in a few batched passes
+times = get_camera_times(scene.getTestCameras())
+for index, (_, state) in enumerate(gaussians.states_at_times(times)):
+    points, scales_final, rotations_final, _, shs_final = state
+    opacity_final = gaussians._opacity
     feature_dc_shape = gaussians._features_dc.shape[1]
     feature_rest_shape = gaussians._features_rest.shape[1]
-    gs_ply = init_3DGaussians_ply(points, scales_final, rotations_final, opacity_final, shs_final, [feature_dc_shape, feature_rest_shape])
-    gs_ply.write(os.path.join(output_path,"time_{0:05d}.ply".format(index)))
+    save_3DGaussians_ply(os.path.join(output_path,"time_{0:05d}.ply".format(index)), points, scales_final, rotations_final, opacity_final, shs_final, [feature_dc_shape, feature_rest_shape])
 print("done")
\ No newline at end of file
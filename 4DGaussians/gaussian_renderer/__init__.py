@@ -11,23 +11,92 @@
 
 import torch
 import math
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+import warnings
+from gaussian_renderer import cpu_rasterizer
+try:
+    from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+except ImportError:
+    # no CUDA extension: everything renders with the PyTorch rasterizer
+    from gaussian_renderer.cpu_rasterizer import GaussianRasterizationSettings
+    GaussianRasterizer = None
 from scene.gaussian_model import GaussianModel
+from scene.cameras import device_matrices
 from utils.sh_utils import eval_sh
 from time import time as get_time
-def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None, stage="fine", cam_type=None):
+
+# rasterizer backends by device type of the Gaussians, all with the (image, radii, depth)
+# contract of diff_gaussian_rasterization; other devices use the PyTorch rasterizer
+rasterizer_backends = {"cpu": cpu_rasterizer.GaussianRasterizer}
+if GaussianRasterizer is not None:
+    rasterizer_backends["cuda"] = GaussianRasterizer
+
+def get_rasterizer(raster_settings, device):
+    backend = rasterizer_backends.get(torch.device(device).type, cpu_rasterizer.GaussianRasterizer)
+    return backend(raster_settings=raster_settings)
+
+def camera_time(viewpoint_camera, cam_type=None):
+    if cam_type == "PanopticSports":
+        return float(viewpoint_camera['time'])
+    return float(viewpoint_camera.time)
+
+def deform_gaussians(pc : GaussianModel, pipe, time_value, stage, means3D, scales, rotations, opacity, shs, culled=None, lod_table=None):
+    """Gaussians at time_value, activated: (means3D, scales, rotations, opacity, shs)."""
+    if "coarse" in stage:
+        means3D_final, scales_final, rotations_final, opacity_final, shs_final = means3D, scales, rotations, opacity, shs
+    elif "fine" in stage and pipe.use_trajectory and pc.trajectory is not None:
+        # closed-form trajectories distilled from the deformation field, no HexPlane or MLP query
+        means3D_final, scales_final, rotations_final = pc.trajectory(time_value)
+        if culled is not None:
+            means3D_final, scales_final, rotations_final = means3D_final[culled], scales_final[culled], rotations_final[culled]
+        opacity_final, shs_final = opacity, shs
+    elif "fine" in stage:
+        if torch.is_grad_enabled():
+            # autograd keeps it for the backward pass, and render_batch() has several times in flight
+            time = torch.full((means3D.shape[0], 1), time_value, dtype=means3D.dtype, device=means3D.device)
+        else:
+            time = pc.workspace.time(time_value, means3D)
+        # only the Gaussians marked dynamic in pc._deformation_table go through the deformation field
+        means3D_final, scales_final, rotations_final, opacity_final, shs_final = pc.deform(means3D, scales,
+                                                                 rotations, opacity, shs,
+                                                                 time, culled, lod_table)
+    else:
+        raise NotImplementedError
+    return means3D_final, pc.scaling_activation(scales_final), pc.rotation_activation(rotations_final), \
+        pc.opacity_activation(opacity_final), shs_final
+
+def render_batch(viewpoint_cameras, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, stage="fine", cam_type=None):
+    """
+    Render several cameras, one render() package each. Cameras with the same timestamp share
+    a single deformation of the Gaussians; every camera keeps its own viewspace_points, so
+    their gradients stay per camera as with separate render() calls.
+    """
+    states = {}
+    packages = []
+    for viewpoint_camera in viewpoint_cameras:
+        time_value = camera_time(viewpoint_camera, cam_type)
+        if time_value not in states:
+            states[time_value] = deform_gaussians(pc, pipe, time_value, stage, pc.get_xyz, pc._scaling, pc._rotation,
+                                                  pc._opacity, pc.get_features)
+        packages.append(render(viewpoint_camera, pc, pipe, bg_color, scaling_modifier, stage=stage, cam_type=cam_type,
+                               state=states[time_value]))
+    return packages
+
+def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None, stage="fine", cam_type=None,
+           state=None):
     """
     Render the scene. 
     
     Background tensor (bg_color) must be on GPU!
+    state: Gaussians already deformed to the camera time by deform_gaussians(), see render_batch().
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
-    try:
-        screenspace_points.retain_grad()
-    except:
-        pass
+    device = pc.get_xyz.device
+    if torch.is_grad_enabled():
+        screenspace_points = torch.zeros_like(pc.get_xyz, requires_grad=True)
+    else:
+        # nothing to differentiate, the zeros of the render workspace are reused
+        screenspace_points = pc.workspace.screenspace_points(pc.get_xyz)
 
     # Set up rasterization configuration
     
@@ -35,6 +104,7 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     if cam_type != "PanopticSports":
         tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
         tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
+        viewmatrix, projmatrix, campos = device_matrices(viewpoint_camera, device)
         raster_settings = GaussianRasterizationSettings(
             image_height=int(viewpoint_camera.image_height),
             image_width=int(viewpoint_camera.image_width),
@@ -42,20 +112,19 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
             tanfovy=tanfovy,
             bg=bg_color,
             scale_modifier=scaling_modifier,
-            viewmatrix=viewpoint_camera.world_view_transform.cuda(),
-            projmatrix=viewpoint_camera.full_proj_transform.cuda(),
+            viewmatrix=viewmatrix,
+            projmatrix=projmatrix,
             sh_degree=pc.active_sh_degree,
-            campos=viewpoint_camera.camera_center.cuda(),
+            campos=campos,
             prefiltered=False,
             debug=pipe.debug
         )
-        time = torch.tensor(viewpoint_camera.time).to(means3D.device).repeat(means3D.shape[0],1)
     else:
         raster_settings = viewpoint_camera['camera']
-        time=torch.tensor(viewpoint_camera['time']).to(means3D.device).repeat(means3D.shape[0],1)
+    time_value = camera_time(viewpoint_camera, cam_type)
         
 
-    rasterizer = GaussianRasterizer(raster_settings=raster_settings)
+    rasterizer = get_rasterizer(raster_settings, device)
 
     # means3D = pc.get_xyz
     # add deformation to each points
@@ -76,27 +145,60 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     else:
         scales = pc._scaling
         rotations = pc._rotation
-    deformation_point = pc._deformation_table
-    if "coarse" in stage:
-        means3D_final, scales_final, rotations_final, opacity_final, shs_final = means3D, scales, rotations, opacity, shs
-    elif "fine" in stage:
-        # time0 = get_time()
-        # means3D_deform, scales_deform, rotations_deform, opacity_deform = pc._deformation(means3D[deformation_point], scales[deformation_point], 
-        #                                                                  rotations[deformation_point], opacity[deformation_point],
-        #                                                                  time[deformation_point])
-        means3D_final, scales_final, rotations_final, opacity_final, shs_final = pc._deformation(means3D, scales, 
-                                                                 rotations, opacity, shs,
-                                                                 time)
+    # Renders without autograd (viewer, evaluation, render.py) reuse the deformed state of
+    # an already rendered timestamp; the cache is cleared whenever the parameters change.
+    use_trajectory = pipe.use_trajectory and pc.trajectory is not None
+    # Renders without autograd can also skip the Gaussians outside the camera frustum (with
+    # their deformation bounds), only the others are deformed and rasterized.
+    culled = None
+    lod_table = None
+    reduced = state is None and "fine" in stage and not torch.is_grad_enabled() and cam_type != "PanopticSports" and cov3D_precomp is None \
+        and not pipe.convert_SHs_python
+    if reduced and pipe.lod_pixel_error > 0 and override_color is None and not use_trajectory:
+        # preview / distant views: a cut through the level-of-detail hierarchy replaces the Gaussians
+        nodes = pc.lod.cut(viewpoint_camera, pipe.lod_pixel_error)
+        (means3D, scales, rotations, opacity, shs, lod_table), culled = pc.lod.attributes(
+            nodes, means3D, scales, rotations, opacity, shs, pc._deformation_table)
+        means2D = torch.zeros_like(means3D)
+    elif reduced and pipe.frustum_culling and pc.spatial_index is None:
+        warnings.warn("frustum_culling without a spatial index, call GaussianModel.build_spatial_index() first; rendering all Gaussians")
+    elif reduced and pipe.frustum_culling:
+        # widen the frustum by a few pixels for the screen-space dilation of the rasterizer
+        margin = 8 / min(viewpoint_camera.image_width, viewpoint_camera.image_height)
+        culled = pc.spatial_index.query(viewpoint_camera.full_proj_transform, margin)
+        if culled.shape[0] == 0:
+            # nothing in the frustum: the background, and no deformation of 0 Gaussians
+            height, width = int(viewpoint_camera.image_height), int(viewpoint_camera.image_width)
+            radii = torch.zeros(pc.get_xyz.shape[0], dtype=torch.int32, device=device)
+            return {"render": bg_color.view(3, 1, 1).expand(3, height, width).clone(),
+                    "viewspace_points": screenspace_points,
+                    "visibility_filter" : radii > 0,
+                    "radii": radii,
+                    "depth": torch.zeros((1, height, width), device=device),
+                    "means3D": pc.get_xyz}
+        if culled.shape[0] > pipe.frustum_culling_max_visible * pc.get_xyz.shape[0]:
+            # gathering most of the Gaussians and scattering them back costs more than it saves
+            culled = None
+        else:
+            means3D, opacity, shs, scales, rotations = means3D[culled], opacity[culled], shs[culled], scales[culled], rotations[culled]
+            means2D = screenspace_points[culled]
+            if override_color is not None:
+                override_color = override_color[culled]
+    state_cache = pc.state_cache
+    state_key = (float(time_value), use_trajectory)
+    use_state_cache = state is None and "fine" in stage and state_cache.enabled and cov3D_precomp is None and not torch.is_grad_enabled() and culled is None \
+        and lod_table is None
+    if use_state_cache:
+        state = state_cache.get(state_key)
+    if state is not None:
+        means3D_final, scales_final, rotations_final, opacity, shs_final = state
     else:
-        raise NotImplementedError
-
-
-
-    # time2 = get_time()
-    # print("asset value:",time2-time1)
-    scales_final = pc.scaling_activation(scales_final)
-    rotations_final = pc.rotation_activation(rotations_final)
-    opacity = pc.opacity_activation(opacity_final)
+        means3D_final, scales_final, rotations_final, opacity, shs_final = deform_gaussians(
+            pc, pipe, time_value, stage, means3D, scales, rotations, opacity, shs, culled, lod_table)
+        if use_state_cache:
+            # cached states outlive the render workspace (the features pass through undeformed heads)
+            state_cache.put(state_key, tuple(value.clone() if pc.workspace.owns(value) else value
+                                             for value in (means3D_final, scales_final, rotations_final, opacity, shs_final)))
     # print(opacity.max())
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
@@ -104,8 +206,8 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     colors_precomp = None
     if override_color is None:
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
-            dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.cuda().repeat(pc.get_features.shape[0], 1))
+            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, pc.get_features.shape[1])
+            dir_pp = (pc.get_xyz - campos.repeat(pc.get_features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
             sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
@@ -129,11 +231,16 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     # time4 = get_time()
     # print("rasterization:",time4-time3)
     # breakpoint()
+    if culled is not None:
+        # back to one entry per Gaussian; LOD nodes come leaves first, merged nodes count as not visible
+        radii = torch.zeros(pc.get_xyz.shape[0], dtype=radii.dtype, device=radii.device).index_put((culled,), radii[:culled.shape[0]])
+        means3D_final = pc.get_xyz.detach().index_put((culled,), means3D_final[:culled.shape[0]])
     # Those Gaussians that were frustum culled or had a radius of 0 were not visible.
     # They will be excluded from value updates used in the splitting criteria.
     return {"render": rendered_image,
             "viewspace_points": screenspace_points,
             "visibility_filter" : radii > 0,
             "radii": radii,
-            "depth":depth}
+            "depth":depth,
+            "means3D": means3D_final}
 
@@ -0,0 +1,241 @@
+#
+# Tile-based Gaussian rasterizer in plain PyTorch, the CPU backend of gaussian_renderer.
+#
+# Follows the forward pass of the CUDA diff_gaussian_rasterization extension: EWA
+# projection of the 3D covariances (with the 0.3 pixel low-pass), 16x16 tile binning of
+# the 3-sigma screen rectangles, per-tile depth sort and front-to-back alpha compositing
+# (alpha capped at 0.99, skipped below 1/255, a pixel stops once its transmittance would
+# fall under 1e-4), with the colors from the SH coefficients. Tiles are rendered in
+# groups on a thread pool, each group walking its depth-sorted Gaussians in batches.
+#
+# Everything is differentiable with autograd: means2D is added to the projected NDC
+# positions, so its gradient is the one the CUDA backward writes for the densification
+# statistics, and with gradients enabled every tile group is checkpointed, which bounds
+# the memory to the per-Gaussian tensors plus one group's batch.
+#
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import torch
+from torch.utils.checkpoint import checkpoint
+from utils.sh_utils import eval_sh
+
+BLOCK = 16
+
+
+class GaussianRasterizationSettings(NamedTuple):
+    image_height: int
+    image_width: int
+    tanfovx: float
+    tanfovy: float
+    bg: torch.Tensor
+    scale_modifier: float
+    viewmatrix: torch.Tensor
+    projmatrix: torch.Tensor
+    sh_degree: int
+    campos: torch.Tensor
+    prefiltered: bool
+    debug: bool
+
+
+def quaternion_to_matrix(q):
+    q = torch.nn.functional.normalize(q, dim=-1)
+    r, x, y, z = q.unbind(-1)
+    return torch.stack([1 - 2 * (y * y + z * z), 2 * (x * y - r * z), 2 * (x * z + r * y),
+                        2 * (x * y + r * z), 1 - 2 * (x * x + z * z), 2 * (y * z - r * x),
+                        2 * (x * z - r * y), 2 * (y * z + r * x), 1 - 2 * (x * x + y * y)], dim=-1).view(-1, 3, 3)
+
+
+def covariance_3d(scales, rotations, scale_modifier=1.0):
+    L = quaternion_to_matrix(rotations) * (scale_modifier * scales)[:, None, :]
+    return L @ L.transpose(1, 2)
+
+
+def unpack_covariance(cov3D_precomp):
+    """[N, 6] upper triangles (xx, xy, xz, yy, yz, zz) to [N, 3, 3]."""
+    xx, xy, xz, yy, yz, zz = cov3D_precomp.unbind(-1)
+    return torch.stack([xx, xy, xz, xy, yy, yz, xz, yz, zz], dim=-1).view(-1, 3, 3)
+
+
+def preprocess(settings, means3D, means2D, opacities, shs, colors_precomp, scales, rotations, cov3D_precomp):
+    """Per-Gaussian screen-space quantities, as computed by the CUDA preprocess step.
+
+    Returns a dict of [N, ...] tensors: pixel position, depth, conic (inverse 2D
+    covariance), integer radius (0 when not visible), tile rectangle and RGB color.
+    Gaussians behind the near plane or with a singular 2D covariance get placeholder
+    values, so their (unused) gradients stay finite.
+    """
+    height, width = int(settings.image_height), int(settings.image_width)
+    view, proj = settings.viewmatrix.to(means3D), settings.projmatrix.to(means3D)
+    view, proj = view.reshape(4, 4), proj.reshape(4, 4)
+    # row vectors, like the matrices of Camera
+    p_view = means3D @ view[:3, :3] + view[3, :3]
+    in_front = p_view[:, 2].detach() > 0.2
+    p_hom = means3D @ proj[:3] + proj[3]
+    p_proj = p_hom[:, :3] / (torch.where(in_front[:, None], p_hom[:, 3:], 1.0) + 1e-7)
+
+    if cov3D_precomp is not None:
+        cov3D = unpack_covariance(cov3D_precomp)
+    else:
+        cov3D = covariance_3d(scales, rotations, settings.scale_modifier)
+    focal_x = width / (2 * settings.tanfovx)
+    focal_y = height / (2 * settings.tanfovy)
+    tz = torch.where(in_front, p_view[:, 2], 1.0)
+    tx = (p_view[:, 0] / tz).clamp(-1.3 * settings.tanfovx, 1.3 * settings.tanfovx) * tz
+    ty = (p_view[:, 1] / tz).clamp(-1.3 * settings.tanfovy, 1.3 * settings.tanfovy) * tz
+    zeros = torch.zeros_like(tz)
+    J = torch.stack([focal_x / tz, zeros, -focal_x * tx / (tz * tz),
+                     zeros, focal_y / tz, -focal_y * ty / (tz * tz)], dim=-1).view(-1, 2, 3)
+    T = J @ view[:3, :3].T
+    cov2D = T @ cov3D @ T.transpose(1, 2)
+    a, b, c = cov2D[:, 0, 0] + 0.3, cov2D[:, 0, 1], cov2D[:, 1, 1] + 0.3
+    det = a * c - b * b
+    nonsingular = det.detach() != 0
+    det = torch.where(nonsingular, det, 1.0)
+    conic = torch.stack([c, -b, a], dim=-1) / det[:, None]
+    mid = 0.5 * (a + c)
+    radius = torch.ceil(3 * torch.sqrt(mid + torch.sqrt((mid * mid - det).clamp_min(0.1)))).detach()
+    ndc = p_proj[:, :2] if means2D is None else p_proj[:, :2] + means2D[:, :2]
+    xy = ((ndc + 1) * p_proj.new_tensor([width, height]) - 1) * 0.5
+
+    grid = torch.tensor([(width + BLOCK - 1) // BLOCK, (height + BLOCK - 1) // BLOCK], device=means3D.device)
+    pixel, r = xy.detach(), radius[:, None]
+    rect_min = torch.minimum(((pixel - r) / BLOCK).long().clamp_min(0), grid)
+    rect_max = torch.minimum(((pixel + r + BLOCK - 1) / BLOCK).long().clamp_min(0), grid)
+    visible = in_front & nonsingular & ((rect_max - rect_min).prod(dim=1) > 0)
+    visible = visible & torch.isfinite(radius)
+    radius = torch.where(visible, radius, torch.zeros_like(radius)).int()
+
+    if colors_precomp is None:
+        directions = torch.nn.functional.normalize(means3D - settings.campos.to(means3D), dim=-1)
+        colors_precomp = (eval_sh(settings.sh_degree, shs.transpose(1, 2), directions) + 0.5).clamp_min(0.0)
+    return {"xy": xy, "depth": tz, "conic": conic, "opacity": opacities.view(-1), "color": colors_precomp,
+            "radii": radius, "rect_min": rect_min, "rect_max": rect_max, "visible": visible, "grid": grid}
+
+
+def bin_tiles(points):
+    """Gaussian indices of every (tile, Gaussian) overlap, sorted by tile then depth, and
+    the start and count of each tile in that list."""
+    index = points["visible"].nonzero(as_tuple=True)[0]
+    extent = (points["rect_max"] - points["rect_min"])[index]
+    num_tiles = extent.prod(dim=1)
+    gaussians = index.repeat_interleave(num_tiles)
+    offset = torch.arange(gaussians.shape[0], device=index.device) - \
+        (num_tiles.cumsum(0) - num_tiles).repeat_interleave(num_tiles)
+    columns = extent[:, 0].repeat_interleave(num_tiles)
+    tile_x = points["rect_min"][gaussians, 0] + offset % columns
+    tile_y = points["rect_min"][gaussians, 1] + offset // columns
+    tiles = tile_y * points["grid"][0] + tile_x
+    # stable sorts: depth first, then tile, for the CUDA (tile, depth) key order
+    order = points["depth"].detach()[gaussians].argsort(stable=True)
+    order = order[tiles[order].argsort(stable=True)]
+    gaussians, tiles = gaussians[order], tiles[order]
+    counts = torch.bincount(tiles, minlength=int(points["grid"].prod()))
+    return gaussians, counts.cumsum(0) - counts, counts
+
+
+def render_tiles(points, gaussians, starts, counts, tiles, width, height, batch_size=256):
+    """Color and depth [T, 256, 4] and transmittance [T, 256] of the pixels of tiles, with
+    their pixel index and whether it is inside the image."""
+    local = torch.arange(BLOCK * BLOCK, device=tiles.device)
+    dtype = points["xy"].dtype
+    lx, ly = (local % BLOCK).to(dtype) - (BLOCK - 1) / 2, (local // BLOCK).to(dtype) - (BLOCK - 1) / 2
+    # the exponent is a quadratic in the pixel position relative to the tile center,
+    # evaluated for a whole batch of Gaussians with one matmul
+    monomials = torch.stack([torch.ones_like(lx), lx, ly, lx * lx, ly * ly, lx * ly], dim=-1)
+    grid_x = points["grid"][0]
+    corner = torch.stack([tiles % grid_x, tiles // grid_x], dim=-1) * BLOCK
+    center = corner.to(dtype) + (BLOCK - 1) / 2
+    transmittance = torch.ones((tiles.shape[0], BLOCK * BLOCK), dtype=dtype, device=tiles.device)
+    done = torch.zeros_like(transmittance, dtype=torch.bool)
+    color_depth = transmittance.new_zeros((tiles.shape[0], BLOCK * BLOCK, 4))
+    starts, counts = starts[tiles], counts[tiles]
+    slot = torch.arange(batch_size, device=tiles.device)
+    for batch_start in range(0, int(counts.max()) if tiles.shape[0] else 0, batch_size):
+        # only the tiles with Gaussians left and pixels not saturated yet
+        rows = ((counts > batch_start) & ~done.all(dim=-1)).nonzero(as_tuple=True)[0]
+        if rows.shape[0] == 0:
+            break
+        position = batch_start + slot
+        index = gaussians[(starts[rows, None] + position[None]).clamp_max(gaussians.shape[0] - 1)]
+        gx, gy = (points["xy"][index] - center[rows, None]).unbind(-1)
+        a, b, c = points["conic"][index].unbind(-1)
+        # log opacity goes into the constant term, -inf for the padding of shorter lists
+        log_opacity = torch.where(position[None] < counts[rows, None], points["opacity"][index].clamp_min(1e-30).log(), -math.inf)
+        coefficients = torch.stack([-0.5 * (a * gx * gx + c * gy * gy) - b * gx * gy + log_opacity, a * gx + b * gy,
+                                    c * gy + b * gx, -0.5 * a, -0.5 * c, -b], dim=1)
+        log_alpha = monomials @ coefficients
+        # the CUDA conditions: exponent <= 0, alpha >= 1/255
+        keep = (log_alpha <= log_opacity[:, None]) & (log_alpha >= -math.log(255))
+        alpha = torch.where(keep, torch.exp(log_alpha).clamp_max(0.99), 0.0)
+        # transmittance after each Gaussian; a pixel stops before the one taking it below 1e-4
+        one_minus_alpha = 1 - alpha
+        row_T, row_done = transmittance[rows], done[rows]
+        test_T = torch.where(row_done, 0.0, row_T)[..., None] * torch.cumprod(one_minus_alpha, dim=-1)
+        contributes = test_T >= 1e-4
+        weight = torch.where(contributes, alpha * test_T / one_minus_alpha, 0.0)
+        color_depth = color_depth.index_add(0, rows, weight @ points["features"][index])
+        count = contributes.sum(dim=-1, keepdim=True)
+        row_T = torch.where(count[..., 0] > 0, test_T.gather(-1, (count - 1).clamp_min(0))[..., 0], row_T)
+        transmittance = transmittance.index_copy(0, rows, row_T)
+        done = done.index_copy(0, rows, row_done | (test_T[..., -1] < 1e-4))
+    pix_x, pix_y = corner[:, :1] + local % BLOCK, corner[:, 1:] + local // BLOCK
+    return color_depth, transmittance, pix_y * width + pix_x, (pix_x < width) & (pix_y < height)
+
+
+def rasterize_gaussians(settings, means3D, means2D, opacities, shs, colors_precomp, scales, rotations, cov3D_precomp,
+                        num_threads=None, max_elements=2 ** 24, batch_size=256):
+    height, width = int(settings.image_height), int(settings.image_width)
+    points = preprocess(settings, means3D, means2D, opacities, shs, colors_precomp, scales, rotations, cov3D_precomp)
+    points["features"] = torch.cat([points["color"], points["depth"][:, None]], dim=1)
+    gaussians, starts, counts = bin_tiles(points)
+    # longest lists first, so tiles of a group need about the same number of batches
+    tiles = counts.argsort(descending=True)
+    tiles = tiles[counts[tiles] > 0]
+    # tile groups bounded by the [tiles, 256, batch] intermediates, at least one per thread
+    num_threads = num_threads or torch.get_num_threads()
+    group_size = max(1, min(max_elements // (BLOCK * BLOCK * batch_size), math.ceil(tiles.shape[0] / num_threads)))
+    groups = tiles.split(group_size)
+    # grad mode is per thread
+    grad_enabled = torch.is_grad_enabled()
+
+    def render_group(group):
+        with torch.set_grad_enabled(grad_enabled):
+            if grad_enabled:
+                return checkpoint(render_tiles, points, gaussians, starts, counts, group, width, height, batch_size,
+                                  use_reentrant=False)
+            return render_tiles(points, gaussians, starts, counts, group, width, height, batch_size)
+    if num_threads > 1 and len(groups) > 1:
+        with ThreadPoolExecutor(num_threads) as pool:
+            results = list(pool.map(render_group, groups))
+    else:
+        results = [render_group(group) for group in groups]
+
+    bg = settings.bg.to(means3D)
+    image = bg[:, None].repeat(1, height * width)
+    out_depth = means3D.new_zeros(height * width)
+    if results:
+        color_depth, transmittance, pixel, inside = (torch.cat(values).flatten(0, 1) for values in zip(*results))
+        color_depth, transmittance, pixel = color_depth[inside], transmittance[inside], pixel[inside]
+        color = (color_depth[:, :3] + transmittance[:, None] * bg).T
+        image = image.index_put((torch.arange(3, device=image.device)[:, None], pixel[None]), color)
+        out_depth = out_depth.index_put((pixel,), color_depth[:, 3])
+    return image.view(3, height, width), points["radii"], out_depth.view(1, height, width)
+
+
+class GaussianRasterizer(torch.nn.Module):
+    """Drop-in for diff_gaussian_rasterization.GaussianRasterizer on any device."""
+    def __init__(self, raster_settings, num_threads=None):
+        super().__init__()
+        self.raster_settings = raster_settings
+        self.num_threads = num_threads
+
+    def forward(self, means3D, means2D, opacities, shs=None, colors_precomp=None, scales=None, rotations=None, cov3D_precomp=None):
+        if (shs is None) == (colors_precomp is None):
+            raise Exception('Please provide excatly one of either SHs or precomputed colors!')
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or \
+                ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+        return rasterize_gaussians(self.raster_settings, means3D, means2D, opacities, shs, colors_precomp, scales, rotations,
+                                   cov3D_precomp, self.num_threads)
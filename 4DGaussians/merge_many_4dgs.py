@@ -30,7 +30,7 @@ from copy import deepcopy
 #
 import torch
 import math
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+from gaussian_renderer import GaussianRasterizationSettings, get_rasterizer
 from scene.gaussian_model import GaussianModel
 from utils.render_utils import get_state_at_time
 from tqdm import tqdm
@@ -72,11 +72,12 @@ def render(viewpoint_camera, gaussians, bg_color : torch.Tensor, scaling_modifie
     tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
     tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
     screenspace_points = None
+    device = gaussians[0].get_xyz.device
     for pc in gaussians:
         if screenspace_points is None:
-            screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+            screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True) + 0
         else:
-            screenspace_points1 = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+            screenspace_points1 = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True) + 0
             screenspace_points = torch.cat([screenspace_points,screenspace_points1],dim=0)
     try:
         screenspace_points.retain_grad()
@@ -89,15 +90,15 @@ def render(viewpoint_camera, gaussians, bg_color : torch.Tensor, scaling_modifie
         tanfovy=tanfovy,
         bg=bg_color,
         scale_modifier=scaling_modifier,
-        viewmatrix=viewpoint_camera.world_view_transform.cuda(),
-        projmatrix=viewpoint_camera.full_proj_transform.cuda(),
+        viewmatrix=viewpoint_camera.world_view_transform.to(device),
+        projmatrix=viewpoint_camera.full_proj_transform.to(device),
         sh_degree=gaussians[0].active_sh_degree,
-        campos=viewpoint_camera.camera_center.cuda(),
+        campos=viewpoint_camera.camera_center.to(device),
         prefiltered=False,
         debug=False
     )
 
-    rasterizer = GaussianRasterizer(raster_settings=raster_settings)
+    rasterizer = get_rasterizer(raster_settings, device)
     # means3D = pc.get_xyz
     # add deformation to each points
     # deformation = pc.get_deformation
@@ -143,11 +144,11 @@ def render(viewpoint_camera, gaussians, bg_color : torch.Tensor, scaling_modifie
 
 def init_gaussians(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, skip_video: bool):
     with torch.no_grad():
-        gaussians = GaussianModel(dataset.sh_degree, hyperparam)
+        gaussians = GaussianModel(dataset.sh_degree, hyperparam, dataset.device)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
-        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
 
         print("hello!!")
     return gaussians, scene, background
@@ -53,8 +53,11 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
     gt_list = []
     render_list = []
     print("point nums:",gaussians._xyz.shape[0])
+    cuda = gaussians.get_xyz.is_cuda
     for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
-        if idx == 0:time1 = time()
+        if idx == 0:
+            time1 = time()
+            allocations = torch.cuda.memory_stats().get("allocation.all.allocated", 0) if cuda else 0
         
         rendering = render(view, gaussians, pipeline, background,cam_type=cam_type)["render"]
         render_images.append(to8b(rendering).transpose(1,2,0))
@@ -63,11 +66,15 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
             if cam_type != "PanopticSports":
                 gt = view.original_image[0:3, :, :]
             else:
-                gt  = view['image'].cuda()
+                gt  = view['image'].to(rendering.device)
             gt_list.append(gt)
 
     time2=time()
     print("FPS:",(len(views)-1)/(time2-time1))
+    if cuda:
+        # outputs and gt images included, render() itself reuses the workspace of the model
+        allocations = torch.cuda.memory_stats().get("allocation.all.allocated", 0) - allocations
+        print("allocations per frame:", allocations / max(len(views) - 1, 1))
 
     multithread_write(gt_list, gts_path)
 
@@ -77,11 +84,14 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
     imageio.mimwrite(os.path.join(model_path, name, "ours_{}".format(iteration), 'video_rgb.mp4'), render_images, fps=30)
 def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, skip_video: bool):
     with torch.no_grad():
-        gaussians = GaussianModel(dataset.sh_degree, hyperparam)
+        gaussians = GaussianModel(dataset.sh_degree, hyperparam, dataset.device)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
         cam_type=scene.dataset_type
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
-        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
+        if pipeline.frustum_culling:
+            # deformation bounds of the Gaussians, once before timing the renders
+            gaussians.build_spatial_index()
 
         if not skip_train:
             render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background,cam_type)
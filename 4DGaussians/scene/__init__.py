@@ -29,6 +29,7 @@ class Scene:
         :param path: Path to colmap scene main folder.
         """
         self.model_path = args.model_path
+        self.packed_checkpoint = args.packed_checkpoint
         self.loaded_iter = None
         self.gaussians = gaussians
         
@@ -56,7 +57,7 @@ class Scene:
             scene_info = sceneLoadTypeCallbacks["nerfies"](args.source_path, False, args.eval)
             dataset_type="nerfies"
         elif os.path.exists(os.path.join(args.source_path,"train_meta.json")):
-            scene_info = sceneLoadTypeCallbacks["PanopticSports"](args.source_path)
+            scene_info = sceneLoadTypeCallbacks["PanopticSports"](args.source_path, args.device)
             dataset_type="PanopticSports"
         elif os.path.exists(os.path.join(args.source_path,"points3D_multipleview.ply")):
             scene_info = sceneLoadTypeCallbacks["MultipleView"](args.source_path)
@@ -81,7 +82,10 @@ class Scene:
             # breakpoint()
             scene_info = scene_info._replace(point_cloud=add_points(scene_info.point_cloud, xyz_max=xyz_max, xyz_min=xyz_min))
         self.gaussians._deformation.deformation_net.set_aabb(xyz_max,xyz_min)
-        if self.loaded_iter:
+        if self.loaded_iter and os.path.exists(self.packed_path(self.loaded_iter)):
+            # single-file checkpoint written by scripts/pack_checkpoint.py or compress_model.py
+            self.gaussians.load_packed(self.packed_path(self.loaded_iter))
+        elif self.loaded_iter:
             self.gaussians.load_ply(os.path.join(self.model_path,
                                                            "point_cloud",
                                                            "iteration_" + str(self.loaded_iter),
@@ -93,6 +97,9 @@ class Scene:
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent, self.maxtime)
 
+    def packed_path(self, iteration):
+        return os.path.join(self.model_path, "point_cloud", "iteration_" + str(iteration), self.packed_checkpoint)
+
     def save(self, iteration, stage):
         if stage == "coarse":
             point_cloud_path = os.path.join(self.model_path, "point_cloud/coarse_iteration_{}".format(iteration))
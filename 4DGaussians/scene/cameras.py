@@ -14,6 +14,19 @@ from torch import nn
 import numpy as np
 from utils.graphics_utils import getWorld2View2, getProjectionMatrix
 
+def device_matrices(camera, device):
+    """world_view_transform, full_proj_transform and camera_center of camera on device.
+
+    Uploaded on first use and kept on the camera, so rendering it again copies nothing;
+    assigning new matrices to the camera uploads them again.
+    """
+    matrices = (camera.world_view_transform, camera.full_proj_transform, camera.camera_center)
+    cached = getattr(camera, "_device_matrices", None)
+    if cached is None or any(a is not b for a, b in zip(cached[0], matrices)) or cached[1][0].device != device:
+        cached = (matrices, tuple(matrix.to(device) for matrix in matrices))
+        camera._device_matrices = cached
+    return cached[1]
+
 class Camera(nn.Module):
     def __init__(self, colmap_id, R, T, FoVx, FoVy, image, gt_alpha_mask,
                  image_name, uid,
@@ -34,8 +47,8 @@ class Camera(nn.Module):
             self.data_device = torch.device(data_device)
         except Exception as e:
             print(e)
-            print(f"[Warning] Custom device {data_device} failed, fallback to default cuda device" )
-            self.data_device = torch.device("cuda")
+            print(f"[Warning] Custom device {data_device} failed, fallback to default device" )
+            self.data_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.original_image = image.clamp(0.0, 1.0)[:3,:,:]
         # breakpoint()
         # .to(self.data_device)
@@ -37,7 +37,7 @@ class FourDGSdataset(Dataset):
     
                 mask = caminfo.mask
             return Camera(colmap_id=index,R=R,T=T,FoVx=FovX,FoVy=FovY,image=image,gt_alpha_mask=None,
-                              image_name=f"{index}",uid=index,data_device=torch.device("cuda"),time=time,
+                              image_name=f"{index}",uid=index,data_device=torch.device(self.args.data_device),time=time,
                               mask=mask)
         else:
             return self.dataset[index]
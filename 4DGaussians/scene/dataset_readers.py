@@ -25,7 +25,7 @@ import numpy as np
 import torch
 import json
 from pathlib import Path
-from plyfile import PlyData, PlyElement
+from utils.ply_utils import read_ply, write_ply
 from utils.sh_utils import SH2RGB
 from scene.gaussian_model import BasicPointCloud
 from utils.general_utils import PILtoTorch
@@ -122,30 +122,17 @@ def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder):
     return cam_infos
 
 def fetchPly(path):
-    plydata = PlyData.read(path)
-    vertices = plydata['vertex']
+    vertices = read_ply(path)
     positions = np.vstack([vertices['x'], vertices['y'], vertices['z']]).T
     colors = np.vstack([vertices['red'], vertices['green'], vertices['blue']]).T / 255.0
     normals = np.vstack([vertices['nx'], vertices['ny'], vertices['nz']]).T
     return BasicPointCloud(points=positions, colors=colors, normals=normals)
 
 def storePly(path, xyz, rgb):
-    # Define the dtype for the structured array
-    dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
-            ('nx', 'f4'), ('ny', 'f4'), ('nz', 'f4'),
-            ('red', 'f4'), ('green', 'f4'), ('blue', 'f4')]
-    
+    names = ['x', 'y', 'z', 'nx', 'ny', 'nz', 'red', 'green', 'blue']
     normals = np.zeros_like(xyz)
-
-    elements = np.empty(xyz.shape[0], dtype=dtype)
-    # breakpoint()
     attributes = np.concatenate((xyz, normals, rgb), axis=1)
-    elements[:] = list(map(tuple, attributes))
-
-    # Create the PlyData object and write to file
-    vertex_element = PlyElement.describe(elements, 'vertex')
-    ply_data = PlyData([vertex_element])
-    ply_data.write(path)
+    write_ply(path, attributes.astype(np.float32), names)
 
 def readColmapSceneInfo(path, images, eval, llffhold=8):
     try:
@@ -481,23 +468,26 @@ def readdynerfInfo(datadir,use_bg_points,eval):
                            )
     return scene_info
 
-def setup_camera(w, h, k, w2c, near=0.01, far=100):
-    from diff_gaussian_rasterization import GaussianRasterizationSettings as Camera
+def setup_camera(w, h, k, w2c, near=0.01, far=100, device=None):
+    # rasterizer settings on device, the one of the Gaussians (--device)
+    from gaussian_renderer import GaussianRasterizationSettings as Camera
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
     fx, fy, cx, cy = k[0][0], k[1][1], k[0][2], k[1][2]
-    w2c = torch.tensor(w2c).cuda().float()
+    w2c = torch.tensor(w2c).to(device).float()
     cam_center = torch.inverse(w2c)[:3, 3]
     w2c = w2c.unsqueeze(0).transpose(1, 2)
     opengl_proj = torch.tensor([[2 * fx / w, 0.0, -(w - 2 * cx) / w, 0.0],
                                 [0.0, 2 * fy / h, -(h - 2 * cy) / h, 0.0],
                                 [0.0, 0.0, far / (far - near), -(far * near) / (far - near)],
-                                [0.0, 0.0, 1.0, 0.0]]).cuda().float().unsqueeze(0).transpose(1, 2)
+                                [0.0, 0.0, 1.0, 0.0]]).to(device).float().unsqueeze(0).transpose(1, 2)
     full_proj = w2c.bmm(opengl_proj)
     cam = Camera(
         image_height=h,
         image_width=w,
         tanfovx=w / (2 * fx),
         tanfovy=h / (2 * fy),
-        bg=torch.tensor([0, 0, 0], dtype=torch.float32, device="cuda"),
+        bg=torch.tensor([0, 0, 0], dtype=torch.float32, device=device),
         scale_modifier=1.0,
         viewmatrix=w2c,
         projmatrix=full_proj,
@@ -533,7 +523,7 @@ def plot_camera_orientations(cam_list, xyz):
     ax.set_zlabel('Z Axis')
     plt.savefig("output.png")
     # breakpoint()
-def readPanopticmeta(datadir, json_path):
+def readPanopticmeta(datadir, json_path, device=None):
     with open(os.path.join(datadir,json_path)) as f:
         test_meta = json.load(f)
     w = test_meta['w']
@@ -553,7 +543,7 @@ def readPanopticmeta(datadir, json_path):
             image = Image.open(os.path.join(datadir,"ims",fn))
             im_data = np.array(image.convert("RGBA"))
             im_data = PILtoTorch(im_data,None)[:3,:,:]
-            camera = setup_camera(w, h, focal, w2c)
+            camera = setup_camera(w, h, focal, w2c, device=device)
             cam_infos.append({
                 "camera":camera,
                 "time":time,
@@ -563,9 +553,9 @@ def readPanopticmeta(datadir, json_path):
     scene_radius = 1.1 * np.max(np.linalg.norm(cam_centers - np.mean(cam_centers, 0)[None], axis=-1))
     return cam_infos, max_time, scene_radius 
 
-def readPanopticSportsinfos(datadir):
-    train_cam_infos, max_time, scene_radius = readPanopticmeta(datadir, "train_meta.json")
-    test_cam_infos,_, _ = readPanopticmeta(datadir, "test_meta.json")
+def readPanopticSportsinfos(datadir, device=None):
+    train_cam_infos, max_time, scene_radius = readPanopticmeta(datadir, "train_meta.json", device)
+    test_cam_infos,_, _ = readPanopticmeta(datadir, "test_meta.json", device)
     nerf_normalization = {
         "radius":scene_radius,
         "translate":torch.tensor([0,0,0])
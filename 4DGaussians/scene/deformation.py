@@ -13,6 +13,56 @@ from utils.graphics_utils import apply_rotation, batch_quaternion_multiply
 from scene.hexplane import HexPlaneField
 from scene.grid import DenseGrid
 # from scene.grid import HashHexPlane
+class FusedDeformationHeads(nn.Module):
+    """Deformation heads Sequential(ReLU, Linear(W, W), ReLU, Linear(W, out)) on a shared input, fused.
+
+    The k first layers are concatenated into one Linear(W, k * W) and the second layers
+    are applied as one block-diagonal matmul over the k * W hidden units, so a forward
+    is two GEMMs instead of 2k. The second-layer weights stay separate parameters so the
+    off-diagonal blocks never receive gradients.
+    """
+    def __init__(self, heads):
+        super(FusedDeformationHeads, self).__init__()
+        self.names = list(heads.keys())
+        self.out_dims = [head[3].out_features for head in heads.values()]
+        width = heads[self.names[0]][1].in_features
+        # filled from the heads below, skip_init leaves the random number stream untouched
+        self.linear = nn.utils.skip_init(nn.Linear, width, width * len(heads))
+        self.weights2 = nn.ParameterList([nn.Parameter(head[3].weight.detach().clone()) for head in heads.values()])
+        self.bias2 = nn.Parameter(torch.cat([head[3].bias.detach() for head in heads.values()]))
+        with torch.no_grad():
+            self.linear.weight.copy_(torch.cat([head[1].weight for head in heads.values()]))
+            self.linear.bias.copy_(torch.cat([head[1].bias for head in heads.values()]))
+
+    def forward(self, hidden):
+        hidden = F.relu(self.linear(F.relu(hidden)))
+        out = F.linear(hidden, torch.block_diag(*self.weights2), self.bias2)
+        return dict(zip(self.names, out.split(self.out_dims, dim=-1)))
+
+    def pack_state_dict(self, state_dict, prefix):
+        """Moves the per-head <name>.1.* / <name>.3.* entries under prefix into the fused layout."""
+        if not all(prefix + name + ".1.weight" in state_dict for name in self.names):
+            return
+        first = [(state_dict.pop(prefix + name + ".1.weight"), state_dict.pop(prefix + name + ".1.bias")) for name in self.names]
+        second = [(state_dict.pop(prefix + name + ".3.weight"), state_dict.pop(prefix + name + ".3.bias")) for name in self.names]
+        state_dict[prefix + "fused_heads.linear.weight"] = torch.cat([weight for weight, _ in first])
+        state_dict[prefix + "fused_heads.linear.bias"] = torch.cat([bias for _, bias in first])
+        for i, (weight, _) in enumerate(second):
+            state_dict[prefix + "fused_heads.weights2." + str(i)] = weight
+        state_dict[prefix + "fused_heads.bias2"] = torch.cat([bias for _, bias in second])
+
+    def unpack_state_dict(self, state_dict, prefix):
+        """Inverse of pack_state_dict, so checkpoints keep the per-head layout."""
+        first_weights = state_dict.pop(prefix + "fused_heads.linear.weight").chunk(len(self.names))
+        first_biases = state_dict.pop(prefix + "fused_heads.linear.bias").chunk(len(self.names))
+        second_biases = state_dict.pop(prefix + "fused_heads.bias2").split(self.out_dims)
+        for i, name in enumerate(self.names):
+            state_dict[prefix + name + ".1.weight"] = first_weights[i]
+            state_dict[prefix + name + ".1.bias"] = first_biases[i]
+            state_dict[prefix + name + ".3.weight"] = state_dict.pop(prefix + "fused_heads.weights2." + str(i))
+            state_dict[prefix + name + ".3.bias"] = second_biases[i]
+
+
 class Deformation(nn.Module):
     def __init__(self, D=8, W=256, input_ch=27, input_ch_time=9, grid_pe=0, skips=[], args=None):
         super(Deformation, self).__init__()
@@ -63,6 +113,31 @@ class Deformation(nn.Module):
         self.rotations_deform = nn.Sequential(nn.ReLU(),nn.Linear(self.W,self.W),nn.ReLU(),nn.Linear(self.W, 4))
         self.opacity_deform = nn.Sequential(nn.ReLU(),nn.Linear(self.W,self.W),nn.ReLU(),nn.Linear(self.W, 1))
         self.shs_deform = nn.Sequential(nn.ReLU(),nn.Linear(self.W,self.W),nn.ReLU(),nn.Linear(self.W, 16*3))
+        self.inference_plan = self.build_inference_plan()
+        self.fused_heads = None
+    def fuse_heads(self):
+        """Replaces the enabled heads by FusedDeformationHeads built from their current weights.
+
+        Called once the heads are initialized (deform_network), so a fused network starts
+        from exactly the weights of an unfused one.
+        """
+        if self.fused_heads is None and len(self.inference_plan) > 1:
+            # state_dict() and load_state_dict() convert from/to the per-head layout so
+            # checkpoints stay interchangeable
+            names = [name for _, name in self.inference_plan]
+            self.fused_heads = FusedDeformationHeads({name: getattr(self, name) for name in names})
+            for name in names:
+                delattr(self, name)
+            self._register_state_dict_hook(lambda module, state_dict, prefix, local_metadata:
+                                           module.fused_heads.unpack_state_dict(state_dict, prefix))
+            self._register_load_state_dict_pre_hook(lambda module, state_dict, prefix, *args:
+                                                    module.fused_heads.pack_state_dict(state_dict, prefix),
+                                                    with_module=True)
+    def head_deltas(self, hidden):
+        """Outputs of the heads of the inference plan, by head name."""
+        if self.fused_heads is not None:
+            return self.fused_heads(hidden)
+        return {name: getattr(self, name)(hidden) for _, name in self.inference_plan}
 
     def query_time(self, rays_pts_emb, scales_emb, rotations_emb, time_feature, time_emb):
 
@@ -96,6 +171,66 @@ class Deformation(nn.Module):
         return rays_pts_emb[:, :3] + dx
     def forward_dynamic(self,rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb, time_feature, time_emb):
         hidden = self.query_time(rays_pts_emb, scales_emb, rotations_emb, time_feature, time_emb)
+        return self.deform_from_hidden(hidden, rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb)
+    def forward_multi_time(self, rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb, times):
+        """Deforms the same N Gaussians at each of times (shape [T]) in one pass.
+
+        The outputs are [T * N, ...] in time-major order. The spatial grid features are
+        computed once for the N points, only the time planes and the MLPs see all T * N rows.
+        """
+        num_times = times.shape[0]
+        if self.no_grid:
+            time_emb = times.repeat_interleave(rays_pts_emb.shape[0])[:, None]
+            return self.forward_dynamic(rays_pts_emb.repeat(num_times, 1), scales_emb.repeat(num_times, 1),
+                                        rotations_emb.repeat(num_times, 1), opacity_emb.repeat(num_times, 1),
+                                        shs_emb.repeat(num_times, 1, 1), None, time_emb)
+        grid_feature = self.grid.get_density_multi_time(rays_pts_emb[:,:3], times)
+        if self.grid_pe > 1:
+            grid_feature = poc_fre(grid_feature,self.grid_pe)
+        hidden = self.feature_out(grid_feature)
+        deform_from_hidden = self.deform_from_hidden if torch.is_grad_enabled() else self.deform_from_hidden_lean
+        return deform_from_hidden(hidden, rays_pts_emb[:,:3].repeat(num_times, 1), scales_emb[:,:3].repeat(num_times, 1),
+                                  rotations_emb[:,:4].repeat(num_times, 1), opacity_emb[:,:1].repeat(num_times, 1),
+                                  shs_emb.repeat(num_times, 1, 1))
+    def build_inference_plan(self):
+        """(output index, head name) of the deformations enabled by the no_d* switches, the other outputs pass through."""
+        heads = [(0, self.args.no_dx, "pos_deform"),
+                 (1, self.args.no_ds, "scales_deform"),
+                 (2, self.args.no_dr, "rotations_deform"),
+                 (3, self.args.no_do, "opacity_deform"),
+                 (4, self.args.no_dshs, "shs_deform")]
+        return [(index, name) for index, disabled, name in heads if not disabled]
+    def forward_lean(self, pts, scales, rotations, opacity, shs, time):
+        """forward_dynamic for inference, on the raw attributes instead of their encodings.
+
+        Only the [:, :3] / [:, :4] columns of the encodings are ever read, so they are not
+        built; only the heads of the inference plan run.
+        """
+        hidden = self.query_time(pts, scales, rotations, None, time)
+        return self.deform_from_hidden_lean(hidden, pts, scales, rotations, opacity, shs)
+    def deform_from_hidden_lean(self, hidden, pts, scales, rotations, opacity, shs):
+        # same outputs as deform_from_hidden, without the all-ones mask and placeholder tensors
+        if self.args.static_mlp:
+            mask = self.static_mlp(hidden)
+        elif self.args.empty_voxel:
+            mask = self.empty_voxel(pts)
+        else:
+            mask = None
+        outputs = [pts, scales, rotations, opacity, shs]
+        deltas = self.head_deltas(hidden)
+        for index, name in self.inference_plan:
+            delta = deltas[name]
+            value = outputs[index]
+            if index == 2:
+                value = batch_quaternion_multiply(value, delta) if self.args.apply_rotation else value + delta
+            elif index == 4:
+                value = (value if mask is None else value * mask.unsqueeze(-1)) + delta.reshape([value.shape[0], 16, 3])[:, :value.shape[1]]
+            else:
+                value = (value if mask is None else value * mask) + delta
+            outputs[index] = value
+        return tuple(outputs)
+    def deform_from_hidden(self, hidden, rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb):
+        deltas = self.head_deltas(hidden)
         if self.args.static_mlp:
             mask = self.static_mlp(hidden)
         elif self.args.empty_voxel:
@@ -106,14 +241,14 @@ class Deformation(nn.Module):
         if self.args.no_dx:
             pts = rays_pts_emb[:,:3]
         else:
-            dx = self.pos_deform(hidden)
+            dx = deltas["pos_deform"]
             pts = torch.zeros_like(rays_pts_emb[:,:3])
             pts = rays_pts_emb[:,:3]*mask + dx
         if self.args.no_ds :
             
             scales = scales_emb[:,:3]
         else:
-            ds = self.scales_deform(hidden)
+            ds = deltas["scales_deform"]
 
             scales = torch.zeros_like(scales_emb[:,:3])
             scales = scales_emb[:,:3]*mask + ds
@@ -121,7 +256,7 @@ class Deformation(nn.Module):
         if self.args.no_dr :
             rotations = rotations_emb[:,:4]
         else:
-            dr = self.rotations_deform(hidden)
+            dr = deltas["rotations_deform"]
 
             rotations = torch.zeros_like(rotations_emb[:,:4])
             if self.args.apply_rotation:
@@ -132,14 +267,15 @@ class Deformation(nn.Module):
         if self.args.no_do :
             opacity = opacity_emb[:,:1] 
         else:
-            do = self.opacity_deform(hidden) 
+            do = deltas["opacity_deform"]
           
             opacity = torch.zeros_like(opacity_emb[:,:1])
             opacity = opacity_emb[:,:1]*mask + do
         if self.args.no_dshs:
             shs = shs_emb
         else:
-            dshs = self.shs_deform(hidden).reshape([shs_emb.shape[0],16,3])
+            # the Gaussians may only carry the active SH bands during training
+            dshs = deltas["shs_deform"].reshape([shs_emb.shape[0],16,3])[:, :shs_emb.shape[1]]
 
             shs = torch.zeros_like(shs_emb)
             # breakpoint()
@@ -180,9 +316,16 @@ class deform_network(nn.Module):
         self.register_buffer('rotation_scaling_poc', torch.FloatTensor([(2**i) for i in range(scale_rotation_pe)]))
         self.register_buffer('opacity_poc', torch.FloatTensor([(2**i) for i in range(opacity_pe)]))
         self.apply(initialize_weights)
+        if args.fused_heads:
+            self.deformation_net.fuse_heads()
+        # Without autograd (render.py, exports) skip the positional encodings and the
+        # disabled heads, see Deformation.forward_lean.
+        self.lean_inference = True
         # print(self)
 
     def forward(self, point, scales=None, rotations=None, opacity=None, shs=None, times_sel=None):
+        if self.lean_inference and not torch.is_grad_enabled():
+            return self.deformation_net.forward_lean(point, scales, rotations, opacity, shs, times_sel)
         return self.forward_dynamic(point, scales, rotations, opacity, shs, times_sel)
     @property
     def get_aabb(self):
@@ -210,6 +353,18 @@ class deform_network(nn.Module):
                                                 None,
                                                 times_sel)
         return means3D, scales, rotations, opacity, shs
+    def forward_multi_time(self, point, scales, rotations, opacity, shs, times):
+        """Same as forward_dynamic at each of times ([T]) for the same Gaussians.
+
+        The positional encodings are computed once; the outputs are [T * N, ...] in
+        time-major order.
+        """
+        if self.lean_inference and not torch.is_grad_enabled():
+            return self.deformation_net.forward_multi_time(point, scales, rotations, opacity, shs, times)
+        point_emb = poc_fre(point,self.pos_poc)
+        scales_emb = poc_fre(scales,self.rotation_scaling_poc)
+        rotations_emb = poc_fre(rotations,self.rotation_scaling_poc)
+        return self.deformation_net.forward_multi_time(point_emb, scales_emb, rotations_emb, opacity, shs, times)
     def get_mlp_parameters(self):
         return self.deformation_net.get_mlp_parameters() + list(self.timenet.parameters())
     def get_grid_parameters(self):
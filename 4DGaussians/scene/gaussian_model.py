@@ -16,14 +16,26 @@ from torch import nn
 import os
 import open3d as o3d
 from utils.system_utils import mkdir_p
-from plyfile import PlyData, PlyElement
+from utils.ply_utils import read_ply, write_ply, ply_columns
 from random import randint
 from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
+try:
+    from simple_knn._C import distCUDA2
+except ImportError:
+    distCUDA2 = None
 from utils.graphics_utils import BasicPointCloud
-from utils.general_utils import strip_symmetric, build_scaling_rotation
+from utils.general_utils import strip_symmetric, build_scaling_rotation, mean_knn_dist2
 from scene.deformation import deform_network
 from scene.regulation import compute_plane_smoothness
+from utils.cache_utils import DeformedStateCache
+from utils.render_workspace import RenderWorkspace
+from scene.trajectory import GaussianTrajectory
+from utils.packed_checkpoint import PackedCheckpoint, save_packed, sub_state_dict
+from utils.compression import decompress_sections
+from utils.capacity_utils import CapacityBuffer
+from utils.sparse_adam import SparseGaussianAdam
+from scene.spatial_index import SpatialIndex
+from scene.lod import GaussianLOD
 class GaussianModel:
 
     def setup_functions(self):
@@ -44,7 +56,8 @@ class GaussianModel:
         self.rotation_activation = torch.nn.functional.normalize
 
 
-    def __init__(self, sh_degree : int, args):
+    def __init__(self, sh_degree : int, args, device="cuda"):
+        self.device = torch.device(device)
         self.active_sh_degree = 0
         self.max_sh_degree = sh_degree  
         self._xyz = torch.empty(0)
@@ -61,6 +74,15 @@ class GaussianModel:
         self.percent_dense = 0
         self.spatial_lr_scale = 0
         self._deformation_table = torch.empty(0)
+        self._deformation_accum = torch.empty(0)
+        self._deformation_accum_count = 0
+        self._state_cache = DeformedStateCache(args.state_cache_mb * 1024 * 1024)
+        self._trajectory = None
+        self._capacity_buffers = None
+        self._cull_radius = None
+        self._spatial_index = None
+        self._lod = None
+        self._workspace = RenderWorkspace()
         self.setup_functions()
 
     def capture(self):
@@ -100,6 +122,8 @@ class GaussianModel:
         opt_dict, 
         self.spatial_lr_scale) = model_args
         self._deformation.load_state_dict(deform_state)
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
         self.training_setup(training_args)
         self.xyz_gradient_accum = xyz_gradient_accum
         self.denom = denom
@@ -119,6 +143,9 @@ class GaussianModel:
 
     @property
     def get_features(self):
+        if not torch.is_grad_enabled():
+            # a view of the contiguous copy in the render workspace, no concatenation per render
+            return self._workspace.features(self._features_dc, self._features_rest)
         features_dc = self._features_dc
         features_rest = self._features_rest
         return torch.cat((features_dc, features_rest), dim=1)
@@ -130,44 +157,155 @@ class GaussianModel:
     def get_covariance(self, scaling_modifier = 1):
         return self.covariance_activation(self.get_scaling, scaling_modifier, self._rotation)
 
+    @property
+    def state_cache(self):
+        return self._state_cache
+
+    @property
+    def workspace(self):
+        return self._workspace
+
+    @property
+    def trajectory(self):
+        # distilled trajectories only describe the Gaussians they were fitted on
+        if self._trajectory is None or self._trajectory.num_points != self.get_xyz.shape[0]:
+            return None
+        return self._trajectory
+
+    def clear_state_cache(self):
+        # Cached deformed states are only valid for the parameters they were computed from.
+        self._state_cache.clear()
+        # so are the level-of-detail hierarchy and the features of the render workspace
+        self._lod = None
+        self._workspace.invalidate()
+
+    def build_lod(self, levels=16, min_cell_size=None):
+        """Level-of-detail hierarchy merging the Gaussians bottom-up, see scene/lod.py."""
+        self._lod = GaussianLOD.build(self, levels, min_cell_size)
+        return self._lod
+
+    @property
+    def lod(self):
+        if self._lod is None or self._lod.num_leaves != self.get_xyz.shape[0]:
+            self.build_lod()
+        return self._lod
+
+    def invalidate_spatial_index(self):
+        self._cull_radius = None
+        self._spatial_index = None
+
+    @torch.no_grad()
+    def build_spatial_index(self, times=None, resolution=64):
+        """Frustum culling grid over the canonical Gaussians, see scene/spatial_index.py.
+
+        Each Gaussian is bounded by a sphere around its canonical position: the largest
+        displacement plus 3 sigma of the largest scale the deformation field gives it at
+        times (16 uniform timestamps in [0, 1] by default). The bounds are the ones observed
+        now, build again after further training. Densify / prune carry them over.
+        """
+        if times is None:
+            times = torch.linspace(0, 1, 16).tolist()
+        xyz = self.get_xyz.detach()
+        displacement = torch.zeros(xyz.shape[0], device=xyz.device)
+        extent = self.get_scaling.max(dim=1).values
+        for _, (means3D, scales, _, _, _) in self.states_at_times(times):
+            displacement = torch.maximum(displacement, (means3D - xyz).norm(dim=1))
+            extent = torch.maximum(extent, self.scaling_activation(scales).max(dim=1).values)
+        self._cull_radius = displacement + 3 * extent
+        self._spatial_index = SpatialIndex(xyz, self._cull_radius, resolution)
+
+    @property
+    def spatial_index(self):
+        # None until build_spatial_index() (or after loading other Gaussians): deforming the
+        # model at 16 timestamps does not belong in a render, callers build it up front
+        num_points = self.get_xyz.shape[0]
+        if self._cull_radius is None or self._cull_radius.shape[0] != num_points:
+            return None
+        if self._spatial_index is None or self._spatial_index.num_points != num_points:
+            # Gaussians were densified / pruned: only the grid is rebuilt, from the carried bounds
+            self._spatial_index = SpatialIndex(self.get_xyz, self._cull_radius)
+        return self._spatial_index
+
     def oneupSHdegree(self):
         if self.active_sh_degree < self.max_sh_degree:
             self.active_sh_degree += 1
+            self._grow_features_rest()
+
+    def _grow_features_rest(self):
+        """Appends zeroed coefficients to _features_rest (and its Adam moments) up to active_sh_degree.
+
+        Training starts with the bands of active_sh_degree only; the higher ones would get
+        zero gradients and zero Adam updates until activated, so adding them as zeros when
+        the degree goes up trains exactly the same.
+        """
+        old_shape = self._features_rest.shape
+        extra = (self.active_sh_degree + 1) ** 2 - 1 - old_shape[1]
+        if extra <= 0:
+            return
+        def pad(tensor):
+            return torch.cat((tensor, tensor.new_zeros((tensor.shape[0], extra) + tuple(tensor.shape[2:]))), dim=1)
+        with torch.no_grad():
+            features_rest = nn.Parameter(pad(self._features_rest.detach()).requires_grad_(True))
+        if self.optimizer is not None:
+            for group in self.optimizer.param_groups:
+                if group["name"] != "f_rest":
+                    continue
+                stored_state = self.optimizer.state.pop(group['params'][0], None)
+                if stored_state is not None:
+                    for key in self._row_state_keys(stored_state):
+                        if stored_state[key].shape == old_shape:
+                            stored_state[key] = pad(stored_state[key])
+                    self.optimizer.state[features_rest] = stored_state
+                group["params"][0] = features_rest
+        self._features_rest = features_rest
+        self.clear_state_cache()
+
+    def padded_features_rest(self):
+        """_features_rest with the not yet active bands as zeros, the layout of the saved models."""
+        extra = (self.max_sh_degree + 1) ** 2 - 1 - self._features_rest.shape[1]
+        features_rest = self._features_rest.detach()
+        return torch.cat((features_rest, features_rest.new_zeros((features_rest.shape[0], extra, 3))), dim=1)
 
     def create_from_pcd(self, pcd : BasicPointCloud, spatial_lr_scale : float, time_line: int):
         self.spatial_lr_scale = spatial_lr_scale
         # breakpoint()
-        fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().cuda()
-        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().cuda())
-        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().cuda()
+        fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().to(self.device)
+        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().to(self.device))
+        # only the bands of active_sh_degree, oneupSHdegree adds the others
+        features = torch.zeros((fused_color.shape[0], 3, (self.active_sh_degree + 1) ** 2)).float().to(self.device)
         features[:, :3, 0 ] = fused_color
         features[:, 3:, 1:] = 0.0
 
         print("Number of points at initialisation : ", fused_point_cloud.shape[0])
 
-        dist2 = torch.clamp_min(distCUDA2(torch.from_numpy(np.asarray(pcd.points)).float().cuda()), 0.0000001)
+        points = torch.from_numpy(np.asarray(pcd.points)).float().to(self.device)
+        dist2 = torch.clamp_min(distCUDA2(points) if distCUDA2 is not None and points.is_cuda else mean_knn_dist2(points), 0.0000001)
         scales = torch.log(torch.sqrt(dist2))[...,None].repeat(1, 3)
-        rots = torch.zeros((fused_point_cloud.shape[0], 4), device="cuda")
+        rots = torch.zeros((fused_point_cloud.shape[0], 4), device=self.device)
         rots[:, 0] = 1
 
-        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
+        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device=self.device))
 
         self._xyz = nn.Parameter(fused_point_cloud.requires_grad_(True))
-        self._deformation = self._deformation.to("cuda") 
-        # self.grid = self.grid.to("cuda")
+        self._deformation = self._deformation.to(self.device)
+        # self.grid = self.grid.to(self.device)
         self._features_dc = nn.Parameter(features[:,:,0:1].transpose(1, 2).contiguous().requires_grad_(True))
         self._features_rest = nn.Parameter(features[:,:,1:].transpose(1, 2).contiguous().requires_grad_(True))
         self._scaling = nn.Parameter(scales.requires_grad_(True))
         self._rotation = nn.Parameter(rots.requires_grad_(True))
         self._opacity = nn.Parameter(opacities.requires_grad_(True))
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
-        self._deformation_table = torch.gt(torch.ones((self.get_xyz.shape[0]),device="cuda"),0)
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)
+        self._deformation_table = torch.gt(torch.ones((self.get_xyz.shape[0]),device=self.device),0)
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
     def training_setup(self, training_args):
         self.percent_dense = training_args.percent_dense
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0],3),device="cuda")
-        
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
+        self._deformation_accum = torch.zeros((self.get_xyz.shape[0],3),device=self.device)
+        self._deformation_accum_count = 0
+        self.capacity_growth = training_args.capacity_growth
+        self._capacity_buffers = {} if self.capacity_growth > 0 else None
 
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
@@ -181,7 +319,10 @@ class GaussianModel:
             
         ]
 
-        self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        if training_args.sparse_adam:
+            self.optimizer = SparseGaussianAdam(l, ["xyz", "f_dc", "f_rest", "opacity", "scaling", "rotation"], lr=0.0, eps=1e-15)
+        else:
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
         self.xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init*self.spatial_lr_scale,
                                                     lr_final=training_args.position_lr_final*self.spatial_lr_scale,
                                                     lr_delay_mult=training_args.position_lr_delay_mult,
@@ -216,7 +357,7 @@ class GaussianModel:
         # All channels except the 3 DC
         for i in range(self._features_dc.shape[1]*self._features_dc.shape[2]):
             l.append('f_dc_{}'.format(i))
-        for i in range(self._features_rest.shape[1]*self._features_rest.shape[2]):
+        for i in range(3 * (self.max_sh_degree + 1) ** 2 - 3):
             l.append('f_rest_{}'.format(i))
         l.append('opacity')
         for i in range(self._scaling.shape[1]):
@@ -232,39 +373,85 @@ class GaussianModel:
 
     def load_model(self, path):
         print("loading model from exists{}".format(path))
-        weight_dict = torch.load(os.path.join(path,"deformation.pth"),map_location="cuda")
+        weight_dict = torch.load(os.path.join(path,"deformation.pth"),map_location=self.device)
         self._deformation.load_state_dict(weight_dict)
-        self._deformation = self._deformation.to("cuda")
-        self._deformation_table = torch.gt(torch.ones((self.get_xyz.shape[0]),device="cuda"),0)
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0],3),device="cuda")
+        self._deformation = self._deformation.to(self.device)
+        self._deformation_table = torch.gt(torch.ones((self.get_xyz.shape[0]),device=self.device),0)
+        self._deformation_accum = torch.zeros((self.get_xyz.shape[0],3),device=self.device)
+        self._deformation_accum_count = 0
         if os.path.exists(os.path.join(path, "deformation_table.pth")):
-            self._deformation_table = torch.load(os.path.join(path, "deformation_table.pth"),map_location="cuda")
+            self._deformation_table = torch.load(os.path.join(path, "deformation_table.pth"),map_location=self.device)
         if os.path.exists(os.path.join(path, "deformation_accum.pth")):
-            self._deformation_accum = torch.load(os.path.join(path, "deformation_accum.pth"),map_location="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+            self._deformation_accum = torch.load(os.path.join(path, "deformation_accum.pth"),map_location=self.device)
+        self._trajectory = None
+        if os.path.exists(os.path.join(path, "trajectory.pth")):
+            self._trajectory = GaussianTrajectory.load(os.path.join(path, "trajectory.pth"), self.device)
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
         # print(self._deformation.deformation_net.grid.)
     def save_deformation(self, path):
         torch.save(self._deformation.state_dict(),os.path.join(path, "deformation.pth"))
         torch.save(self._deformation_table,os.path.join(path, "deformation_table.pth"))
         torch.save(self._deformation_accum,os.path.join(path, "deformation_accum.pth"))
+    def save_packed(self, path):
+        """Gaussians, deformation network and tables in one memory-mappable file, see utils/packed_checkpoint.py."""
+        mkdir_p(os.path.dirname(path))
+        tensors = {"xyz": self._xyz, "features_dc": self._features_dc, "features_rest": self.padded_features_rest(),
+                   "opacity": self._opacity, "scaling": self._scaling, "rotation": self._rotation,
+                   "deformation_table": self._deformation_table, "deformation_accum": self._deformation_accum}
+        for name, value in self._deformation.state_dict().items():
+            tensors["deformation/" + name] = value
+        metadata = {"active_sh_degree": self.active_sh_degree, "max_sh_degree": self.max_sh_degree}
+        if self._trajectory is not None:
+            tensors["trajectory/coefficients"] = self._trajectory.coefficients
+            metadata["trajectory"] = {"basis": self._trajectory.basis, "degree": self._trajectory.degree}
+        save_packed(path, tensors, metadata)
+    def load_packed(self, path):
+        """load_ply + load_model from a file written by save_packed or compress_model.py.
+
+        On the CPU the Gaussian parameters and tables stay backed by the mapped file
+        (.to() is a no-op there): a render reads the pages it uses, training copies
+        the pages the optimizer updates, the rest is never read. Elsewhere each section
+        is copied to the device once. Compressed files are decoded into memory.
+        """
+        print("loading packed model from {}".format(path))
+        checkpoint = PackedCheckpoint(path)
+        metadata = checkpoint.metadata
+        if "compression" in metadata:
+            # written by compress_model.py: decode the codebooks and quantized sections
+            checkpoint = decompress_sections(checkpoint)
+        self._xyz = nn.Parameter(checkpoint["xyz"].to(self.device).requires_grad_(True))
+        self._features_dc = nn.Parameter(checkpoint["features_dc"].to(self.device).requires_grad_(True))
+        self._features_rest = nn.Parameter(checkpoint["features_rest"].to(self.device).requires_grad_(True))
+        self._opacity = nn.Parameter(checkpoint["opacity"].to(self.device).requires_grad_(True))
+        self._scaling = nn.Parameter(checkpoint["scaling"].to(self.device).requires_grad_(True))
+        self._rotation = nn.Parameter(checkpoint["rotation"].to(self.device).requires_grad_(True))
+        self.active_sh_degree = metadata.get("active_sh_degree", self.max_sh_degree)
+        self._deformation.load_state_dict(sub_state_dict(checkpoint, "deformation/"))
+        self._deformation = self._deformation.to(self.device)
+        self._deformation_table = checkpoint["deformation_table"].to(self.device)
+        self._deformation_accum = checkpoint["deformation_accum"].to(self.device)
+        self._deformation_accum_count = 0
+        self._trajectory = None
+        if "trajectory" in metadata:
+            self._trajectory = GaussianTrajectory(checkpoint["trajectory/coefficients"].to(self.device), **metadata["trajectory"])
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
     def save_ply(self, path):
         mkdir_p(os.path.dirname(path))
 
         xyz = self._xyz.detach().cpu().numpy()
         normals = np.zeros_like(xyz)
         f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
+        f_rest = self.padded_features_rest().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
         opacities = self._opacity.detach().cpu().numpy()
         scale = self._scaling.detach().cpu().numpy()
         rotation = self._rotation.detach().cpu().numpy()
         
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
-
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
         attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+        write_ply(path, attributes.astype(np.float32), self.construct_list_of_attributes())
         
     def reset_opacity(self):
         opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
@@ -272,46 +459,38 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
 
     def load_ply(self, path):
-        plydata = PlyData.read(path)
+        vertices = read_ply(path)
+        property_names = vertices.dtype.names
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
+        xyz = ply_columns(vertices, ["x", "y", "z"])
+        opacities = ply_columns(vertices, ["opacity"])
 
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
+        features_dc = ply_columns(vertices, ["f_dc_0", "f_dc_1", "f_dc_2"])[..., np.newaxis]
 
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
+        extra_f_names = [name for name in property_names if name.startswith("f_rest_")]
         extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
         assert len(extra_f_names)==3*(self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
+        features_extra = ply_columns(vertices, extra_f_names)
         # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
         features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
 
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
+        scale_names = [name for name in property_names if name.startswith("scale_")]
         scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
+        scales = ply_columns(vertices, scale_names)
 
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
+        rot_names = [name for name in property_names if name.startswith("rot")]
         rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        rots = ply_columns(vertices, rot_names)
+
+        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device=self.device).requires_grad_(True))
+        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device=self.device).transpose(1, 2).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device=self.device).transpose(1, 2).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device=self.device).requires_grad_(True))
+        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device=self.device).requires_grad_(True))
+        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device=self.device).requires_grad_(True))
         self.active_sh_degree = self.max_sh_degree
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
 
     def replace_tensor_to_optimizer(self, tensor, name):
         optimizable_tensors = {}
@@ -326,8 +505,44 @@ class GaussianModel:
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
+        self.clear_state_cache()
         return optimizable_tensors
 
+    def _capacity_buffer(self, key):
+        if key not in self._capacity_buffers:
+            self._capacity_buffers[key] = CapacityBuffer(self.capacity_growth)
+        return self._capacity_buffers[key]
+
+    def _extend(self, key, tensor, rows):
+        """tensor followed by rows, appended in place to the capacity buffer of key when capacity_growth > 0."""
+        if self._capacity_buffers is None:
+            return torch.cat((tensor, rows), dim=0)
+        buffer = self._capacity_buffer(key)
+        buffer.adopt(tensor, rows.shape[0])
+        return buffer.append(rows)
+
+    def _select(self, key, tensor, mask):
+        """tensor[mask], compacted in place in the capacity buffer of key when capacity_growth > 0."""
+        if self._capacity_buffers is None:
+            return tensor[mask]
+        buffer = self._capacity_buffer(key)
+        buffer.adopt(tensor)
+        return buffer.compact(mask)
+
+    def _zeros(self, key, shape):
+        if self._capacity_buffers is None:
+            return torch.zeros(shape, device=self.device)
+        return self._capacity_buffer(key).zeros(shape, device=self.device)
+
+    @staticmethod
+    def _row_state_keys(stored_state):
+        # per-Gaussian optimizer state: the Adam moments, and the row step counts of SparseGaussianAdam
+        return [key for key, value in stored_state.items() if torch.is_tensor(value) and value.dim() > 0]
+
+    @staticmethod
+    def _new_rows(state, count):
+        return state.new_zeros((count,) + tuple(state.shape[1:]))
+
     def _prune_optimizer(self, mask):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
@@ -335,16 +550,16 @@ class GaussianModel:
                 continue
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+                for key in self._row_state_keys(stored_state):
+                    stored_state[key] = self._select(group["name"] + "." + key, stored_state[key], mask)
 
                 del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+                group["params"][0] = nn.Parameter((self._select(group["name"], group["params"][0], mask).requires_grad_(True)))
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
+                group["params"][0] = nn.Parameter(self._select(group["name"], group["params"][0], mask).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
         return optimizable_tensors
 
@@ -358,11 +573,14 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
-        self._deformation_accum = self._deformation_accum[valid_points_mask]
-        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
-        self._deformation_table = self._deformation_table[valid_points_mask]
-        self.denom = self.denom[valid_points_mask]
-        self.max_radii2D = self.max_radii2D[valid_points_mask]
+        self._deformation_accum = self._select("deformation_accum", self._deformation_accum, valid_points_mask)
+        self.xyz_gradient_accum = self._select("xyz_gradient_accum", self.xyz_gradient_accum, valid_points_mask)
+        self._deformation_table = self._select("deformation_table", self._deformation_table, valid_points_mask)
+        self.denom = self._select("denom", self.denom, valid_points_mask)
+        self.max_radii2D = self._select("max_radii2D", self.max_radii2D, valid_points_mask)
+        if self._cull_radius is not None:
+            self._cull_radius = self._cull_radius[valid_points_mask]
+        self.clear_state_cache()
 
     def cat_tensors_to_optimizer(self, tensors_dict):
         optimizable_tensors = {}
@@ -373,16 +591,16 @@ class GaussianModel:
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
 
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
+                for key in self._row_state_keys(stored_state):
+                    stored_state[key] = self._extend(group["name"] + "." + key, stored_state[key], self._new_rows(stored_state[key], extension_tensor.shape[0]))
 
                 del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                group["params"][0] = nn.Parameter(self._extend(group["name"], group["params"][0], extension_tensor).requires_grad_(True))
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                group["params"][0] = nn.Parameter(self._extend(group["name"], group["params"][0], extension_tensor).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
 
         return optimizable_tensors
@@ -406,16 +624,20 @@ class GaussianModel:
         self._rotation = optimizable_tensors["rotation"]
         # self._deformation = optimizable_tensors["deformation"]
         
-        self._deformation_table = torch.cat([self._deformation_table,new_deformation_table],-1)
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0], 3), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self._deformation_table = self._extend("deformation_table", self._deformation_table, new_deformation_table)
+        self.xyz_gradient_accum = self._zeros("xyz_gradient_accum", (self.get_xyz.shape[0], 1))
+        self._deformation_accum = self._zeros("deformation_accum", (self.get_xyz.shape[0], 3))
+        self._deformation_accum_count = 0
+        self.denom = self._zeros("denom", (self.get_xyz.shape[0], 1))
+        self.max_radii2D = self._zeros("max_radii2D", (self.get_xyz.shape[0],))
+        # the new Gaussians have no culling bounds yet
+        self.invalidate_spatial_index()
+        self.clear_state_cache()
 
     def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
         n_init_points = self.get_xyz.shape[0]
         # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
+        padded_grad = torch.zeros((n_init_points), device=self.device)
         padded_grad[:grads.shape[0]] = grads.squeeze()
         selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
 
@@ -425,7 +647,7 @@ class GaussianModel:
         if not selected_pts_mask.any():
             return
         stds = self.get_scaling[selected_pts_mask].repeat(N,1)
-        means =torch.zeros((stds.size(0), 3),device="cuda")
+        means =torch.zeros((stds.size(0), 3),device=self.device)
         samples = torch.normal(mean=means, std=stds)
         rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N,1,1)
         new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
@@ -437,7 +659,7 @@ class GaussianModel:
         new_deformation_table = self._deformation_table[selected_pts_mask].repeat(N)
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacity, new_scaling, new_rotation, new_deformation_table)
 
-        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
+        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device=self.device, dtype=bool)))
         self.prune_points(prune_filter)
 
     def densify_and_clone(self, grads, grad_threshold, scene_extent, density_threshold=20, displacement_scale=20, model_path=None, iteration=None, stage=None):
@@ -498,6 +720,168 @@ class GaussianModel:
         self.prune_points(prune_mask)
 
         torch.cuda.empty_cache()
+    def _assemble(self, key, tensor, keep, rows):
+        """cat(tensor[keep], rows), built in place in the capacity buffer of key when capacity_growth > 0."""
+        if self._capacity_buffers is None:
+            return torch.cat((tensor[keep], rows), dim=0)
+        return self._extend(key, self._select(key, tensor, keep), rows)
+
+    def _prune_mask(self, opacity, scaling, min_opacity, extent, max_screen_size, radii=None):
+        prune_mask = (self.opacity_activation(opacity) < min_opacity).squeeze(-1)
+        if max_screen_size:
+            prune_mask = torch.logical_or(prune_mask, self.scaling_activation(scaling).max(dim=1).values > 0.1 * extent)
+            if radii is not None:
+                prune_mask = torch.logical_or(prune_mask, radii > max_screen_size)
+        return prune_mask
+
+    def bytes_per_gaussian(self):
+        """Training memory of one Gaussian: parameters with the full SH width and two Adam
+        moments each, plus the densification statistics and the deformation table."""
+        params = 3 + 3 * (self.max_sh_degree + 1) ** 2 + 1 + 3 + 4
+        return 4 * (3 * params + 1 + 1 + 1 + 3) + 1
+
+    def gaussian_budget(self, max_gaussians, max_bytes=0):
+        if max_bytes > 0:
+            return min(max_gaussians, max_bytes // self.bytes_per_gaussian())
+        return max_gaussians
+
+    def importance(self, max_grad):
+        """Per-Gaussian score for the budget: opacity times screen footprint (max_radii2D
+        squared, at least a pixel), raised by the accumulated position gradient."""
+        grads = (self.xyz_gradient_accum / self.denom).nan_to_num(0.0).norm(dim=-1)
+        return self.get_opacity.squeeze(-1) * self.max_radii2D.clamp_min(1) ** 2 * (1 + grads / max_grad)
+
+    def _apply_budget(self, budget, turnover, max_grad, grads, clone_mask, split_mask, prune_mask, N):
+        """Limits clone, split and prune masks to end with at most budget Gaussians.
+
+        Candidates are admitted by decreasing gradient; a split costs N - 1 Gaussians. When
+        the budget leaves less room than turnover * budget, the least important remaining
+        Gaussians (see importance) are pruned to make that room, and to come back under the
+        budget when there are already more (points added outside densification).
+        """
+        base = int((~prune_mask).sum())
+        candidates = (clone_mask | split_mask).nonzero(as_tuple=True)[0]
+        cost = torch.where(split_mask[candidates], N - 1, 1)
+        wanted = int(cost.sum())
+        if base + wanted <= budget:
+            return clone_mask, split_mask, prune_mask
+        room = max(budget - base, min(wanted, int(turnover * budget)), 0)
+        excess = base + room - budget
+        if excess > 0:
+            score = self.importance(max_grad)
+            # never the pruned ones or the candidates
+            score[prune_mask | clone_mask | split_mask] = float("inf")
+            excess = min(excess, int(score.isfinite().sum()))
+            prune_mask = prune_mask.clone()
+            prune_mask[score.topk(excess, largest=False).indices] = True
+            room = budget - int((~prune_mask).sum())
+        order = grads[candidates].argsort(descending=True)
+        admitted = torch.zeros_like(clone_mask)
+        admitted[candidates[order[cost[order].cumsum(0) <= room]]] = True
+        return clone_mask & admitted, split_mask & admitted, prune_mask
+
+    @torch.no_grad()
+    def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size, densify=True, prune=True, N=2,
+                          budget=None, budget_turnover=0.0, min_points=None):
+        """densify() followed by prune() with a single rebuild of every tensor.
+
+        The clone, split and prune masks are computed up front (prune judges the clones and
+        split children by the attributes they get), then each parameter and Adam moment is
+        assembled as cat(kept rows, new rows) once. The result is the one of the sequential
+        calls, Gaussians in the same order; like there, densifying resets max_radii2D, so the
+        screen-size criterion only applies when prune runs alone. With a budget, the masks
+        are limited to end with at most that many Gaussians (_apply_budget). With min_points,
+        prune only runs when densify leaves more Gaussians than that, as the sequential
+        calls checked the count in between.
+        """
+        max_scaling = self.get_scaling.max(dim=1).values
+        no_points = torch.zeros_like(max_scaling, dtype=torch.bool)
+        clone_mask, split_mask = no_points, no_points
+        grads = (self.xyz_gradient_accum / self.denom).nan_to_num(0.0).norm(dim=-1)
+        if densify:
+            selected_pts_mask = grads >= max_grad
+            clone_mask = torch.logical_and(selected_pts_mask, max_scaling <= self.percent_dense * extent)
+            split_mask = torch.logical_and(selected_pts_mask, max_scaling > self.percent_dense * extent)
+        if prune and min_points is not None:
+            densified_clone, densified_split, densified_prune = clone_mask, split_mask, no_points
+            if budget is not None:
+                densified_clone, densified_split, densified_prune = self._apply_budget(
+                    budget, budget_turnover, max_grad, grads, clone_mask, split_mask, no_points, N)
+            densified = int((~densified_prune).sum()) + int(densified_clone.sum()) + (N - 1) * int(densified_split.sum())
+            prune = densified > min_points
+        if not densify and not prune and (budget is None or self.get_xyz.shape[0] <= budget):
+            return
+        prune_mask = no_points
+        if prune:
+            prune_mask = self._prune_mask(self._opacity, self._scaling, min_opacity, extent, max_screen_size,
+                                          None if densify else self.max_radii2D)
+        if budget is not None:
+            clone_mask, split_mask, prune_mask = self._apply_budget(budget, budget_turnover, max_grad, grads,
+                                                                    clone_mask, split_mask, prune_mask, N)
+        keep = torch.logical_not(torch.logical_or(split_mask, prune_mask))
+        clone_mask = torch.logical_and(clone_mask, torch.logical_not(prune_mask))
+
+        # split children, sampled as in densify_and_split
+        stds = self.get_scaling[split_mask].repeat(N, 1)
+        means = torch.zeros((stds.size(0), 3), device=self.device)
+        samples = torch.normal(mean=means, std=stds)
+        rots = build_rotation(self._rotation[split_mask]).repeat(N, 1, 1)
+        offsets = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1)
+        children = {"xyz": offsets + self.get_xyz[split_mask].repeat(N, 1),
+                    "f_dc": self._features_dc[split_mask].repeat(N, 1, 1),
+                    "f_rest": self._features_rest[split_mask].repeat(N, 1, 1),
+                    "opacity": self._opacity[split_mask].repeat(N, 1),
+                    "scaling": self.scaling_inverse_activation(self.get_scaling[split_mask].repeat(N, 1) / (0.8 * N)),
+                    "rotation": self._rotation[split_mask].repeat(N, 1),
+                    "deformation_table": self._deformation_table[split_mask].repeat(N)}
+        children_keep = torch.ones_like(children["deformation_table"], dtype=torch.bool)
+        if prune:
+            children_keep = torch.logical_not(self._prune_mask(children["opacity"], children["scaling"], min_opacity, extent, max_screen_size))
+
+        current = {"xyz": self._xyz, "f_dc": self._features_dc, "f_rest": self._features_rest, "opacity": self._opacity,
+                   "scaling": self._scaling, "rotation": self._rotation, "deformation_table": self._deformation_table}
+        rows = {name: torch.cat((value[clone_mask], children[name][children_keep]), dim=0) for name, value in current.items()}
+
+        for group in self.optimizer.param_groups:
+            if len(group["params"]) > 1:
+                continue
+            name = group["name"]
+            stored_state = self.optimizer.state.get(group['params'][0], None)
+            if stored_state is not None:
+                for key in self._row_state_keys(stored_state):
+                    stored_state[key] = self._assemble(name + "." + key, stored_state[key], keep, self._new_rows(stored_state[key], rows[name].shape[0]))
+                del self.optimizer.state[group['params'][0]]
+            group["params"][0] = nn.Parameter(self._assemble(name, group["params"][0], keep, rows[name]).requires_grad_(True))
+            if stored_state is not None:
+                self.optimizer.state[group['params'][0]] = stored_state
+            current[name] = group["params"][0]
+        self._xyz = current["xyz"]
+        self._features_dc = current["f_dc"]
+        self._features_rest = current["f_rest"]
+        self._opacity = current["opacity"]
+        self._scaling = current["scaling"]
+        self._rotation = current["rotation"]
+        self._deformation_table = self._assemble("deformation_table", self._deformation_table, keep, rows["deformation_table"])
+        if self._cull_radius is not None:
+            # culling bounds of the new Gaussians: their parent's, moved by the split offset
+            children_radius = self._cull_radius[split_mask].repeat(N) + offsets.norm(dim=1)
+            self._cull_radius = torch.cat((self._cull_radius[keep], self._cull_radius[clone_mask], children_radius[children_keep]))
+
+        num_points = self.get_xyz.shape[0]
+        if densify:
+            self.xyz_gradient_accum = self._zeros("xyz_gradient_accum", (num_points, 1))
+            self._deformation_accum = self._zeros("deformation_accum", (num_points, 3))
+            self._deformation_accum_count = 0
+            self.denom = self._zeros("denom", (num_points, 1))
+            self.max_radii2D = self._zeros("max_radii2D", (num_points,))
+        else:
+            self._deformation_accum = self._select("deformation_accum", self._deformation_accum, keep)
+            self.xyz_gradient_accum = self._select("xyz_gradient_accum", self.xyz_gradient_accum, keep)
+            self.denom = self._select("denom", self.denom, keep)
+            self.max_radii2D = self._select("max_radii2D", self.max_radii2D, keep)
+        self.clear_state_cache()
+        if prune:
+            torch.cuda.empty_cache()
     def densify(self, max_grad, min_opacity, extent, max_screen_size, density_threshold, displacement_scale, model_path=None, iteration=None, stage=None):
         grads = self.xyz_gradient_accum / self.denom
         grads[grads.isnan()] = 0.0
@@ -510,7 +894,7 @@ class GaussianModel:
         scales = self._scaling.detach()
         rotations = self._rotation.detach()
         opacity = self._opacity.detach()
-        time =  torch.tensor(0).to("cuda").repeat(means3D.shape[0],1)
+        time =  torch.tensor(0).to(self.device).repeat(means3D.shape[0],1)
         means3D_deform, scales_deform, rotations_deform, _ = self._deformation(means3D, scales, rotations, opacity, time)
         position_error = (means3D_deform - means3D)**2
         rotation_error = (rotations_deform - rotations)**2 
@@ -522,9 +906,79 @@ class GaussianModel:
         self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor[update_filter,:2], dim=-1, keepdim=True)
         self.denom[update_filter] += 1
     @torch.no_grad()
+    def add_deformation_stats(self, means3D_deformed):
+        # accumulate the per-axis displacement the deformation field applied in one render
+        self._deformation_accum += torch.abs(means3D_deformed.detach() - self._xyz.detach())
+        self._deformation_accum_count += 1
+    @property
+    def get_deformation_motion(self):
+        """Mean per-axis displacement of each Gaussian over the renders accumulated since the last reset."""
+        return self._deformation_accum / max(self._deformation_accum_count, 1)
+    @torch.no_grad()
     def update_deformation_table(self,threshold):
         # print("origin deformation point nums:",self._deformation_table.sum())
-        self._deformation_table = torch.gt(self._deformation_accum.max(dim=-1).values/100,threshold)
+        # Gaussians that are already static are no longer deformed and so never move again:
+        # the classification only turns dynamic Gaussians static.
+        if self._deformation_accum_count == 0:
+            return
+        self._deformation_table = torch.gt(self.get_deformation_motion.max(dim=-1).values,threshold)
+        self.clear_state_cache()
+    def deform(self, means3D, scales, rotations, opacity, shs, time, index=None, deformation_table=None):
+        """Runs the deformation field on the dynamic Gaussians of _deformation_table only.
+
+        Static Gaussians keep their canonical attributes; the deformed ones are scattered
+        back, so the returned tensors cover all Gaussians in the original order. When the
+        inputs are the subset index of the Gaussians, so are the outputs; other inputs
+        (level-of-detail nodes) come with their own deformation_table.
+        """
+        deformation_point = deformation_table
+        if deformation_point is None:
+            deformation_point = self._deformation_table if index is None else self._deformation_table[index]
+        canonical = (means3D, scales, rotations, opacity, shs)
+        if means3D.shape[0] == 0:
+            # the field cannot be queried on 0 rows (HexPlaneField.get_density)
+            return canonical
+        if deformation_point.shape[0] != means3D.shape[0] or deformation_point.all():
+            return self._deformation(means3D, scales, rotations, opacity, shs, time)
+        idx = deformation_point.nonzero(as_tuple=True)[0]
+        if idx.numel() == 0:
+            return canonical
+        deformed = self._deformation(means3D[idx], scales[idx], rotations[idx], opacity[idx], shs[idx], time[idx])
+        return tuple(value.index_put((idx,), value_deform) for value, value_deform in zip(canonical, deformed))
+    @torch.no_grad()
+    def states_at_times(self, times, chunk_size=1 << 21):
+        """Yields (time, (means3D, scales, rotations, opacity, shs)) for each of times.
+
+        The states are the same as deform() at that time (before activation). The
+        timestamps are evaluated in batches of about chunk_size Gaussian-time pairs,
+        one deformation pass per batch, with the positional encodings and spatial
+        plane features of the Gaussians computed once.
+        """
+        # the states outlive the render workspace features, copy them out
+        canonical = (self._xyz, self._scaling, self._rotation, self._opacity, self.get_features.clone())
+        deformation_point = self._deformation_table
+        idx = None
+        inputs = canonical
+        if deformation_point.shape[0] == self._xyz.shape[0] and not deformation_point.all():
+            idx = deformation_point.nonzero(as_tuple=True)[0]
+            inputs = tuple(value[idx] for value in canonical)
+        num_points = inputs[0].shape[0]
+        times = torch.as_tensor(times, dtype=torch.float32, device=self._xyz.device).reshape(-1)
+        if num_points == 0:
+            # nothing dynamic, every time has the canonical state
+            for time in times.tolist():
+                yield time, canonical
+            return
+        times_per_chunk = max(1, chunk_size // max(num_points, 1))
+        for start in range(0, times.shape[0], times_per_chunk):
+            chunk = times[start:start + times_per_chunk]
+            deformed = self._deformation.forward_multi_time(*inputs, chunk)
+            deformed = [value.view(chunk.shape[0], num_points, *value.shape[1:]) for value in deformed]
+            for i, time in enumerate(chunk.tolist()):
+                state = tuple(value[i] for value in deformed)
+                if idx is not None:
+                    state = tuple(value.index_put((idx,), value_deform) for value, value_deform in zip(canonical, state))
+                yield time, state
     def print_deformation_weight_grad(self):
         for name, weight in self._deformation.named_parameters():
             if weight.requires_grad:
@@ -1,5 +1,6 @@
 import itertools
 import logging as log
+import math
 from typing import Optional, Union, List, Dict, Sequence, Iterable, Collection, Callable
 
 import torch
@@ -45,6 +46,33 @@ def grid_sample_wrapper(grid: torch.Tensor, coords: torch.Tensor, align_corners:
     interp = interp.squeeze()  # [B?, n, feature_dim?]
     return interp
 
+def grid_sample_batched(grids: torch.Tensor, coords: torch.Tensor, align_corners: bool = True) -> torch.Tensor:
+    """Samples B same-shaped planes in one call.
+
+    grids: [B, feature_dim, H, W], coords: [B, n, 2]; returns [B, feature_dim, n].
+    Every batch entry is interpolated exactly like grid_sample_wrapper would.
+    """
+    B, feature_dim = grids.shape[:2]
+    interp = F.grid_sample(
+        grids, coords.unsqueeze(1),  # [B, 1, n, 2]
+        align_corners=align_corners,
+        mode='bilinear', padding_mode='border')
+    return interp.view(B, feature_dim, -1)
+
+
+def _stacked_planes(grid, plane_ids, stack_cache):
+    planes = [grid[ci] for ci in plane_ids]
+    if stack_cache is None or torch.is_grad_enabled():
+        return torch.cat(planes, dim=0)
+    key = tuple(p.data_ptr() for p in planes)
+    versions = tuple(p._version for p in planes)
+    cached = stack_cache.get(key, None)
+    if cached is None or cached[0] != versions:
+        cached = (versions, torch.cat(planes, dim=0))
+        stack_cache[key] = cached
+    return cached[1]
+
+
 def init_grid_param(
         grid_nd: int,
         in_dim: int,
@@ -70,22 +98,48 @@ def init_grid_param(
     return grid_coefs
 
 
-def interpolate_ms_features(pts: torch.Tensor,
-                            ms_grids: Collection[Iterable[nn.Module]],
-                            grid_dimensions: int,
-                            concat_features: bool,
-                            num_levels: Optional[int],
-                            ) -> torch.Tensor:
+def split_plane_ids(in_dim: int, grid_dimensions: int):
+    """Returns the indices of the purely spatial planes and of the planes spanning time."""
+    coo_combs = list(itertools.combinations(range(in_dim), grid_dimensions))
+    space_ids = [ci for ci, coo_comb in enumerate(coo_combs) if 3 not in coo_comb]
+    time_ids = [ci for ci, coo_comb in enumerate(coo_combs) if 3 in coo_comb]
+    return space_ids, time_ids
+
+
+def interpolate_ms_plane_products(pts: torch.Tensor,
+                                  ms_grids: Collection[Iterable[nn.Module]],
+                                  grid_dimensions: int,
+                                  num_levels: Optional[int],
+                                  plane_ids: Optional[Sequence[int]] = None,
+                                  in_dim: Optional[int] = None,
+                                  fused: bool = False,
+                                  stack_cache: Optional[Dict] = None,
+                                  ) -> List[torch.Tensor]:
+    """Per multires level, the product of the features interpolated on the planes in plane_ids (all planes by default).
+
+    in_dim is the dimension the plane ids refer to; it defaults to pts.shape[-1] but
+    can be larger when pts only carries the coordinates used by the selected planes.
+    With fused=True the planes of a level that share a resolution are stacked and
+    sampled in a single grid_sample call; the product is still taken plane by plane
+    in the same order, so the result is identical. stack_cache lets no-grad callers
+    keep the stacked planes between calls.
+    """
+    if fused:
+        return _interpolate_ms_plane_products_fused(pts, ms_grids, grid_dimensions, num_levels,
+                                                    plane_ids, in_dim, stack_cache)
     coo_combs = list(itertools.combinations(
-        range(pts.shape[-1]), grid_dimensions)
+        range(pts.shape[-1] if in_dim is None else in_dim), grid_dimensions)
     )
+    if plane_ids is None:
+        plane_ids = range(len(coo_combs))
     if num_levels is None:
         num_levels = len(ms_grids)
-    multi_scale_interp = [] if concat_features else 0.
+    products = []
     grid: nn.ParameterList
     for scale_id,  grid in enumerate(ms_grids[:num_levels]):
         interp_space = 1.
-        for ci, coo_comb in enumerate(coo_combs):
+        for ci in plane_ids:
+            coo_comb = coo_combs[ci]
             # interpolate in plane
             feature_dim = grid[ci].shape[1]  # shape of grid[ci]: 1, out_dim, *reso
             interp_out_plane = (
@@ -94,18 +148,113 @@ def interpolate_ms_features(pts: torch.Tensor,
             )
             # compute product over planes
             interp_space = interp_space * interp_out_plane
+        products.append(interp_space)
+    return products
 
-        # combine over scales
-        if concat_features:
-            multi_scale_interp.append(interp_space)
-        else:
-            multi_scale_interp = multi_scale_interp + interp_space
 
+def _interpolate_ms_plane_products_fused(pts, ms_grids, grid_dimensions, num_levels, plane_ids, in_dim, stack_cache):
+    coo_combs = list(itertools.combinations(
+        range(pts.shape[-1] if in_dim is None else in_dim), grid_dimensions)
+    )
+    if plane_ids is None:
+        plane_ids = range(len(coo_combs))
+    plane_ids = list(plane_ids)
+    if num_levels is None:
+        num_levels = len(ms_grids)
+    products = []
+    for scale_id, grid in enumerate(ms_grids[:num_levels]):
+        # group the planes of this level by resolution
+        groups = {}
+        for ci in plane_ids:
+            groups.setdefault(tuple(grid[ci].shape), []).append(ci)
+        interp_planes = {}
+        for group in groups.values():
+            coords = pts[..., torch.tensor([coo_combs[ci] for ci in group], device=pts.device)]  # [n, B, 2]
+            interp = grid_sample_batched(_stacked_planes(grid, group, stack_cache),
+                                         coords.transpose(0, 1).contiguous())
+            for b, ci in enumerate(group):
+                interp_planes[ci] = interp[b].transpose(0, 1)  # [n, feature_dim]
+        interp_space = 1.
+        for ci in plane_ids:
+            interp_space = interp_space * interp_planes[ci]
+        products.append(interp_space)
+    return products
+
+
+def slice_time_plane(grid: torch.Tensor, t: float, align_corners: bool = True) -> torch.Tensor:
+    """Linearly interpolates a [1, feature_dim, reso_t, reso_x] time plane at time t, giving a [reso_x, feature_dim] line."""
+    reso_t = grid.shape[2]
+    it = (t + 1) / 2 * (reso_t - 1) if align_corners else ((t + 1) * reso_t - 1) / 2
+    it = min(max(it, 0.), reso_t - 1.)  # padding_mode='border'
+    t0 = int(math.floor(it))
+    t1 = min(t0 + 1, reso_t - 1)
+    return torch.lerp(grid[0, :, t0], grid[0, :, t1], it - t0).t().contiguous()
+
+
+def interpolate_line(line: torch.Tensor, coords: torch.Tensor, align_corners: bool = True) -> torch.Tensor:
+    """1D counterpart of grid_sample_wrapper: samples a [reso, feature_dim] line at coords [n] in [-1, 1]."""
+    reso = line.shape[0]
+    if align_corners:
+        ix = (coords + 1) / 2 * (reso - 1)
+    else:
+        ix = ((coords + 1) * reso - 1) / 2
+    ix = ix.clamp(0, reso - 1)  # padding_mode='border'
+    i0 = ix.floor()
+    weight = (ix - i0).unsqueeze(-1)
+    i0 = i0.long()
+    i1 = (i0 + 1).clamp(max=reso - 1)
+    return torch.lerp(line.index_select(0, i0), line.index_select(0, i1), weight)
+
+
+def interpolate_ms_time_sliced(pts: torch.Tensor,
+                               t: float,
+                               ms_grids: Collection[Iterable[nn.Module]],
+                               grid_dimensions: int,
+                               num_levels: Optional[int],
+                               ) -> List[torch.Tensor]:
+    """Per level product of the time planes, for spatial pts [n, 3] that all share the time t.
+
+    Each xt/yt/zt plane is sliced once at t, so every point only needs a 1D lookup
+    instead of a bilinear grid_sample. Bilinear interpolation is separable, so this
+    matches the 2D lookup up to floating point rounding.
+    """
+    _, time_ids = split_plane_ids(4, grid_dimensions)
+    coo_combs = list(itertools.combinations(range(4), grid_dimensions))
+    if num_levels is None:
+        num_levels = len(ms_grids)
+    products = []
+    for scale_id, grid in enumerate(ms_grids[:num_levels]):
+        interp_space = 1.
+        for ci in time_ids:
+            space_axis = coo_combs[ci][0]
+            line = slice_time_plane(grid[ci], t)
+            interp_space = interp_space * interpolate_line(line, pts[:, space_axis])
+        products.append(interp_space)
+    return products
+
+
+def combine_ms_features(products: List[torch.Tensor], concat_features: bool) -> torch.Tensor:
     if concat_features:
-        multi_scale_interp = torch.cat(multi_scale_interp, dim=-1)
+        return torch.cat(products, dim=-1)
+    multi_scale_interp = 0.
+    for interp_space in products:
+        multi_scale_interp = multi_scale_interp + interp_space
     return multi_scale_interp
 
 
+def interpolate_ms_features(pts: torch.Tensor,
+                            ms_grids: Collection[Iterable[nn.Module]],
+                            grid_dimensions: int,
+                            concat_features: bool,
+                            num_levels: Optional[int],
+                            fused: bool = False,
+                            stack_cache: Optional[Dict] = None,
+                            ) -> torch.Tensor:
+    products = interpolate_ms_plane_products(pts, ms_grids, grid_dimensions, num_levels,
+                                             fused=fused, stack_cache=stack_cache)
+    return combine_ms_features(products, concat_features)
+
+
 class HexPlaneField(nn.Module):
     def __init__(
         self,
@@ -121,6 +270,18 @@ class HexPlaneField(nn.Module):
         self.grid_config =  [planeconfig]
         self.multiscale_res_multipliers = multires
         self.concat_features = True
+        # Inference-only cache of the time-invariant xy/xz/yz plane products, see get_space_features.
+        self.cache_space_features = True
+        self._space_cache = None
+        # Sample the same-resolution planes of a level in one batched grid_sample call. Only
+        # used for CUDA queries without autograd: the stacked planes are then kept between
+        # calls, and the gain is in kernel launches. With autograd the extra stack/split
+        # copies cost more than that, and on CPU there is nothing to gain.
+        self.fused_sampling = True
+        self._plane_stacks = {}
+        # Without autograd, queries whose points all share one time (a rendered frame) slice
+        # the time planes at that time and do 1D lookups, see interpolate_ms_time_sliced.
+        self.slice_time_planes = True
 
         # 1. Init planes
         self.grids = nn.ModuleList()
@@ -149,6 +310,8 @@ class HexPlaneField(nn.Module):
     @property
     def get_aabb(self):
         return self.aabb[0], self.aabb[1]
+    def _use_fused_sampling(self, pts):
+        return self.fused_sampling and pts.is_cuda and not torch.is_grad_enabled()
     def set_aabb(self,xyz_max, xyz_min):
         aabb = torch.tensor([
             xyz_max,
@@ -157,9 +320,42 @@ class HexPlaneField(nn.Module):
         self.aabb = nn.Parameter(aabb,requires_grad=False)
         print("Voxel Plane: set aabb=",self.aabb)
 
+    def _space_cache_key(self, space_ids):
+        planes = [grid[ci] for grid in self.grids for ci in space_ids] + [self.aabb]
+        return tuple((p.data_ptr(), p._version) for p in planes)
+
+    def get_space_features(self, pts: torch.Tensor):
+        """Per level products of the spatial planes at the (unnormalized) pts.
+
+        They do not depend on time, so under no_grad the result is kept and reused
+        for as long as the queried points, the spatial planes and the aabb are
+        unchanged; the version counters of the parameters catch in-place optimizer
+        steps and state_dict loads.
+        """
+        grid_dimensions = self.grid_config[0]["grid_dimensions"]
+        space_ids, _ = split_plane_ids(4, grid_dimensions)
+        use_cache = self.cache_space_features and not torch.is_grad_enabled()
+        if not use_cache:
+            self._space_cache = None
+        else:
+            key = self._space_cache_key(space_ids)
+            if self._space_cache is not None:
+                cached_key, cached_pts, cached_features = self._space_cache
+                if cached_key == key and cached_pts.shape == pts.shape and torch.equal(cached_pts, pts):
+                    return cached_features
+        features = interpolate_ms_plane_products(
+            normalize_aabb(pts, self.aabb), ms_grids=self.grids,
+            grid_dimensions=grid_dimensions, num_levels=None, plane_ids=space_ids, in_dim=4,
+            fused=self._use_fused_sampling(pts), stack_cache=self._plane_stacks)
+        if use_cache:
+            self._space_cache = (key, pts.clone(), features)
+        return features
+
     def get_density(self, pts: torch.Tensor, timestamps: Optional[torch.Tensor] = None):
         """Computes and returns the densities."""
         # breakpoint()
+        if not torch.is_grad_enabled() and timestamps is not None and (self.cache_space_features or self.slice_time_planes):
+            return self.get_density_inference(pts, timestamps)
         pts = normalize_aabb(pts, self.aabb)
         pts = torch.cat((pts, timestamps), dim=-1)  # [n_rays, n_samples, 4]
 
@@ -167,11 +363,66 @@ class HexPlaneField(nn.Module):
         features = interpolate_ms_features(
             pts, ms_grids=self.grids,  # noqa
             grid_dimensions=self.grid_config[0]["grid_dimensions"],
-            concat_features=self.concat_features, num_levels=None)
+            concat_features=self.concat_features, num_levels=None,
+            fused=self._use_fused_sampling(pts), stack_cache=self._plane_stacks)
+        if len(features) < 1:
+            features = torch.zeros((0, 1)).to(features.device)
+
+
+        return features
+
+    def get_time_features(self, pts: torch.Tensor, timestamps: torch.Tensor):
+        """Per level products of the time planes at the (unnormalized) pts and timestamps."""
+        grid_dimensions = self.grid_config[0]["grid_dimensions"]
+        _, time_ids = split_plane_ids(4, grid_dimensions)
+        pts = normalize_aabb(pts, self.aabb)
+        if self.slice_time_planes and not torch.is_grad_enabled() and len(timestamps) > 0:
+            t = timestamps.reshape(-1)[0]
+            if torch.all(timestamps == t):
+                return interpolate_ms_time_sliced(pts, t.item(), ms_grids=self.grids,
+                                                  grid_dimensions=grid_dimensions, num_levels=None)
+        pts = torch.cat((pts, timestamps), dim=-1)
+        pts = pts.reshape(-1, pts.shape[-1])
+        return interpolate_ms_plane_products(
+            pts, ms_grids=self.grids, grid_dimensions=grid_dimensions,
+            num_levels=None, plane_ids=time_ids,
+            fused=self._use_fused_sampling(pts), stack_cache=self._plane_stacks)
+
+    def get_density_inference(self, pts: torch.Tensor, timestamps: torch.Tensor):
+        """Same features as get_density, computed as (spatial planes) x (time planes).
+
+        The spatial part comes from the cache of get_space_features, the time part is
+        sliced per timestamp when all points share one.
+        """
+        space_features = self.get_space_features(pts)
+        time_features = self.get_time_features(pts, timestamps)
+        features = combine_ms_features(
+            [space * time for space, time in zip(space_features, time_features)],
+            self.concat_features)
         if len(features) < 1:
             features = torch.zeros((0, 1)).to(features.device)
+        return features
 
+    def get_density_multi_time(self, pts: torch.Tensor, times: torch.Tensor):
+        """Features of the same pts at each of times, [len(times) * N, feat_dim] in time-major order.
 
+        The spatial plane products are computed once for the N points and broadcast
+        over the timestamps, only the time planes are sampled for every timestamp
+        (sliced per timestamp without autograd).
+        """
+        num_times, num_points = times.shape[0], pts.shape[0]
+        space_features = self.get_space_features(pts)
+        if self.slice_time_planes and not torch.is_grad_enabled():
+            time_features = [self.get_time_features(pts, t.expand(num_points, 1)) for t in times]
+            time_features = [torch.cat(level) for level in zip(*time_features)]
+        else:
+            time_features = self.get_time_features(pts.repeat(num_times, 1), times.repeat_interleave(num_points)[:, None])
+        features = combine_ms_features(
+            [(time.view(num_times, num_points, -1) * space).view(num_times * num_points, -1)
+             for space, time in zip(space_features, time_features)],
+            self.concat_features)
+        if len(features) < 1:
+            features = torch.zeros((0, 1)).to(features.device)
         return features
 
     def forward(self,
@@ -0,0 +1,150 @@
+#
+# Level-of-detail hierarchy over the canonical Gaussians for distant and preview renders.
+#
+# The trained Gaussians are the leaves. Level by level, the current roots falling in the
+# same cell of a grid (cell size doubling per level) are merged into a parent Gaussian
+# with the moment-matched mean and covariance, a coverage-preserving opacity and the
+# weighted DC color. A frame renders the cut of nodes whose projected bounding sphere is
+# below the pixel error while their parent's is not.
+#
+import math
+import torch
+from utils.general_utils import build_rotation, inverse_sigmoid
+
+
+def rotation_to_quaternion(R):
+    """(w, x, y, z) quaternions of rotation matrices [N, 3, 3], the convention of build_rotation."""
+    m00, m11, m22 = R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]
+    w = (1 + m00 + m11 + m22).clamp_min(0).sqrt() / 2
+    x = torch.copysign((1 + m00 - m11 - m22).clamp_min(0).sqrt() / 2, R[:, 2, 1] - R[:, 1, 2])
+    y = torch.copysign((1 - m00 + m11 - m22).clamp_min(0).sqrt() / 2, R[:, 0, 2] - R[:, 2, 0])
+    z = torch.copysign((1 - m00 - m11 + m22).clamp_min(0).sqrt() / 2, R[:, 1, 0] - R[:, 0, 1])
+    return torch.nn.functional.normalize(torch.stack([w, x, y, z], dim=1))
+
+
+def _segment_sum(values, segment, num_segments):
+    return torch.zeros((num_segments,) + values.shape[1:], dtype=values.dtype, device=values.device).index_add_(0, segment, values)
+
+
+class GaussianLOD:
+    """Merge hierarchy of a GaussianModel, built with GaussianLOD.build.
+
+    Nodes 0..N-1 are the model's Gaussians, the merged parents follow. Per parent the
+    canonical attributes (pre-activation, like the model's) and dynamic flag are stored,
+    per node its parent (-1 for roots) and a bounding radius that contains its children's
+    spheres, which makes the projected size shrink from parents to children.
+    """
+    def __init__(self, leaf_xyz, xyz, scaling, rotation, opacity, features_dc, deformation_table, parent, radius):
+        self.leaf_xyz = leaf_xyz
+        self.num_leaves = leaf_xyz.shape[0]
+        self.xyz, self.scaling, self.rotation, self.opacity = xyz, scaling, rotation, opacity
+        self.features_dc, self.deformation_table = features_dc, deformation_table
+        self.parent, self.radius = parent, radius
+
+    @property
+    def num_nodes(self):
+        return self.parent.shape[0]
+
+    @classmethod
+    @torch.no_grad()
+    def build(cls, gaussians, levels=16, min_cell_size=None):
+        xyz = gaussians.get_xyz.detach()
+        num_leaves, device = xyz.shape[0], xyz.device
+        scales = gaussians.get_scaling.detach()
+        rotation = build_rotation(gaussians._rotation.detach())
+        # per node, activated: mean, covariance, opacity, DC color, dynamic flag, bounding radius
+        means = [xyz]
+        covariances = [rotation @ torch.diag_embed(scales ** 2) @ rotation.transpose(1, 2)]
+        alphas = [gaussians.get_opacity.detach().squeeze(-1)]
+        colors = [gaussians._features_dc.detach()]
+        dynamic = [gaussians._deformation_table.clone()]
+        radius = [3 * scales.max(dim=1).values]
+        node_parent = torch.full((num_leaves,), -1, dtype=torch.long, device=device)
+
+        low = xyz.min(dim=0).values
+        if min_cell_size is None:
+            # about two 1-sigma extents, a handful of Gaussians per cell at the first level
+            min_cell_size = 2 * scales.max(dim=1).values.median().item()
+        roots = torch.arange(num_leaves, device=device)
+        num_nodes, cell_size = num_leaves, min_cell_size
+        node_mean, node_cov, node_alpha = means[0], covariances[0], alphas[0]
+        node_color, node_dynamic, node_radius = colors[0], dynamic[0], radius[0]
+        for _ in range(levels):
+            if roots.shape[0] <= 1:
+                break
+            coords = ((node_mean[roots] - low) / cell_size).floor().long()
+            _, cluster, counts = torch.unique(coords, dim=0, return_inverse=True, return_counts=True)
+            merged = counts[cluster] > 1
+            cell_size *= 2
+            if not merged.any():
+                continue
+            members = roots[merged]
+            # renumber the clusters with more than one member
+            cluster_ids, segment = torch.unique(cluster[merged], return_inverse=True)
+            num_parents = cluster_ids.shape[0]
+
+            mean, cov, alpha = node_mean[members], node_cov[members], node_alpha[members]
+            area = torch.linalg.det(cov).clamp_min(1e-30) ** (1 / 3)
+            weight = alpha * area + 1e-12
+            total = _segment_sum(weight, segment, num_parents)
+            parent_mean = _segment_sum(weight[:, None] * mean, segment, num_parents) / total[:, None]
+            offset = mean - parent_mean[segment]
+            parent_cov = _segment_sum(weight[:, None, None] * (cov + offset[:, :, None] * offset[:, None, :]),
+                                      segment, num_parents) / total[:, None, None]
+            parent_area = torch.linalg.det(parent_cov).clamp_min(1e-30) ** (1 / 3)
+            # as much coverage as the children, never more than stacking them would give
+            coverage = _segment_sum(alpha * area, segment, num_parents) / parent_area
+            stacked = 1 - torch.exp(_segment_sum(torch.log1p(-alpha.clamp(max=1 - 1e-6)), segment, num_parents))
+            parent_alpha = torch.minimum(coverage, stacked)
+            parent_color = _segment_sum(weight[:, None, None] * node_color[members], segment, num_parents) / total[:, None, None]
+            parent_dynamic = _segment_sum(node_dynamic[members].long(), segment, num_parents) > 0
+            eigenvalues = torch.linalg.eigvalsh(parent_cov).clamp_min(0)
+            parent_radius = torch.maximum(3 * eigenvalues[:, -1].sqrt(), torch.zeros_like(total).scatter_reduce(
+                0, segment, offset.norm(dim=1) + node_radius[members], "amax", include_self=False))
+
+            parent_ids = torch.arange(num_nodes, num_nodes + num_parents, device=device)
+            node_parent = torch.cat([node_parent, torch.full((num_parents,), -1, dtype=torch.long, device=device)])
+            node_parent[members] = parent_ids[segment]
+            for store, value in [(means, parent_mean), (covariances, parent_cov), (alphas, parent_alpha),
+                                 (colors, parent_color), (dynamic, parent_dynamic), (radius, parent_radius)]:
+                store.append(value)
+            node_mean, node_cov, node_alpha = torch.cat(means), torch.cat(covariances), torch.cat(alphas)
+            node_color, node_dynamic, node_radius = torch.cat(colors), torch.cat(dynamic), torch.cat(radius)
+            roots = torch.cat([roots[~merged], parent_ids])
+            num_nodes += num_parents
+
+        # parents in the model's parameterization
+        cov = node_cov[num_leaves:]
+        eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+        eigenvectors = eigenvectors * torch.linalg.det(eigenvectors).sign()[:, None, None]
+        scaling = gaussians.scaling_inverse_activation(eigenvalues.clamp_min(1e-12).sqrt())
+        opacity = inverse_sigmoid(node_alpha[num_leaves:].clamp(1e-4, 1 - 1e-4))[:, None]
+        return cls(xyz, node_mean[num_leaves:], scaling, rotation_to_quaternion(eigenvectors), opacity,
+                   node_color[num_leaves:], node_dynamic[num_leaves:], node_parent, node_radius)
+
+    def cut(self, camera, pixel_error):
+        """Nodes to render: projected radius within pixel_error pixels (or a leaf), parent's above it."""
+        view = camera.world_view_transform.to(self.radius.device)
+        focal = camera.image_height / (2 * math.tan(camera.FoVy * 0.5))
+        centers = torch.cat([self.leaf_xyz, self.xyz])
+        depth = centers @ view[:3, 2] + view[3, 2]
+        # closest point of the bounding sphere, so a parent never looks smaller than its child
+        size = self.radius * focal / (depth - self.radius).clamp_min(camera.znear)
+        fine_enough = size <= pixel_error
+        fine_enough[:self.num_leaves] = True
+        parent_too_coarse = torch.ones_like(fine_enough)
+        has_parent = self.parent >= 0
+        parent_too_coarse[has_parent] = ~fine_enough[self.parent[has_parent]]
+        return (fine_enough & parent_too_coarse).nonzero(as_tuple=True)[0]
+
+    def attributes(self, nodes, means3D, scales, rotations, opacity, shs, deformation_table):
+        """Renderer inputs (pre-activation) and deformation table of nodes, leaves first.
+
+        The leaves are taken from the model's tensors passed in, the parents from the
+        hierarchy, with their DC color only. Also returns the leaf indices.
+        """
+        leaves, parents = nodes[nodes < self.num_leaves], nodes[nodes >= self.num_leaves] - self.num_leaves
+        parent_shs = torch.cat([self.features_dc[parents], shs.new_zeros((parents.shape[0], shs.shape[1] - 1, 3))], dim=1)
+        inputs = [(means3D, self.xyz[parents]), (scales, self.scaling[parents]), (rotations, self.rotation[parents]),
+                  (opacity, self.opacity[parents]), (shs, parent_shs), (deformation_table, self.deformation_table[parents])]
+        return tuple(torch.cat([leaf_value[leaves], parent_value]) for leaf_value, parent_value in inputs), leaves
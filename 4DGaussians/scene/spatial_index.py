@@ -0,0 +1,48 @@
+import torch
+
+
+def frustum_planes(full_proj_transform, margin=0.0):
+    """Left, right, bottom, top and near planes [5, 4] of a camera, normals pointing inside.
+
+    full_proj_transform is the transposed (row vector) projection of Camera; margin widens
+    the left/right/bottom/top planes by that much in normalized device coordinates.
+    """
+    m = full_proj_transform.T
+    planes = torch.stack([m[3] * (1 + margin) + m[0], m[3] * (1 + margin) - m[0],
+                          m[3] * (1 + margin) + m[1], m[3] * (1 + margin) - m[1], m[2]])
+    return planes / planes[:, :3].norm(dim=1, keepdim=True)
+
+
+class SpatialIndex:
+    """Uniform grid over bounding spheres (centers [N, 3], radii [N]) for frustum culling.
+
+    Every occupied cell keeps the axis-aligned bounds of the spheres of its points. query
+    returns the points of the cells whose bounds are not completely outside one of the
+    frustum planes, a superset of the points whose sphere intersects the frustum.
+    """
+    def __init__(self, centers, radii, resolution=64):
+        centers, radii = centers.detach(), radii.detach()
+        low, high = centers.min(dim=0).values, centers.max(dim=0).values
+        cell_size = (high - low).clamp_min(1e-6) / resolution
+        coords = ((centers - low) / cell_size).long().clamp(0, resolution - 1)
+        cell = (coords[:, 0] * resolution + coords[:, 1]) * resolution + coords[:, 2]
+        self.cells, self.cell_of_point = torch.unique(cell, return_inverse=True)
+        index = self.cell_of_point[:, None].expand(-1, 3)
+        inf = torch.full((self.cells.shape[0], 3), float("inf"), device=centers.device)
+        self.bounds_min = inf.scatter_reduce(0, index, centers - radii[:, None], "amin")
+        self.bounds_max = (-inf).scatter_reduce(0, index, centers + radii[:, None], "amax")
+
+    @property
+    def num_points(self):
+        return self.cell_of_point.shape[0]
+
+    def visible_cells(self, planes):
+        normals = planes[:, :3]
+        # per cell and plane the box corner furthest along the plane normal
+        corner = torch.where(normals[None] >= 0, self.bounds_max[:, None], self.bounds_min[:, None])
+        return ((corner * normals[None]).sum(dim=-1) + planes[None, :, 3] >= 0).all(dim=1)
+
+    def query(self, full_proj_transform, margin=0.0):
+        """Indices of the points that may be inside the frustum of the camera."""
+        planes = frustum_planes(full_proj_transform.to(self.bounds_min.device), margin)
+        return self.visible_cells(planes)[self.cell_of_point].nonzero(as_tuple=True)[0]
@@ -0,0 +1,85 @@
+import math
+import torch
+
+
+def trajectory_basis(times, basis, degree):
+    """Temporal basis of the closed-form trajectories evaluated at times in [0, 1].
+
+    polynomial: 1, s, ..., s^degree with s = 2t - 1 (centered for conditioning).
+    fourier:    1, cos(pi k t), sin(pi k t) for k = 1..degree. The period is twice the
+                sequence length so the first and last frame are not forced to coincide.
+    Returns a [T, num_basis] tensor.
+    """
+    times = times.reshape(-1, 1)
+    if basis == "polynomial":
+        return (2 * times - 1) ** torch.arange(degree + 1, device=times.device, dtype=times.dtype)
+    elif basis == "fourier":
+        phase = math.pi * times * torch.arange(1, degree + 1, device=times.device, dtype=times.dtype)
+        return torch.cat([torch.ones_like(times), phase.cos(), phase.sin()], dim=-1)
+    raise NotImplementedError(basis)
+
+
+def num_basis_functions(basis, degree):
+    return degree + 1 if basis == "polynomial" else 2 * degree + 1
+
+
+class GaussianTrajectory:
+    """Per-Gaussian closed-form trajectories distilled from the deformation field.
+
+    Position (3), scaling (3) and rotation (4) of every Gaussian are stored as
+    coefficients [num_basis, N, 10] of a small temporal basis, in the same
+    pre-activation space as the deform_network outputs. Evaluating a timestamp
+    is one [1, num_basis] x [num_basis, N * 10] matmul, no grid sampling.
+    """
+    def __init__(self, coefficients, basis="polynomial", degree=3):
+        assert coefficients.shape[0] == num_basis_functions(basis, degree)
+        self.coefficients = coefficients
+        self.basis = basis
+        self.degree = degree
+
+    @property
+    def num_points(self):
+        return self.coefficients.shape[1]
+
+    def to(self, device):
+        self.coefficients = self.coefficients.to(device)
+        return self
+
+    def __call__(self, time):
+        coefficients = self.coefficients
+        phi = trajectory_basis(torch.tensor([float(time)], device=coefficients.device), self.basis, self.degree)
+        state = (phi @ coefficients.flatten(1)).view(self.num_points, -1)
+        return state[:, :3], state[:, 3:6], state[:, 6:10]
+
+    @classmethod
+    @torch.no_grad()
+    def fit(cls, gaussians, timestamps, basis="polynomial", degree=3, ridge=1e-6):
+        """Least-squares fit to the deformation field sampled at the given timestamps.
+
+        The normal equations are accumulated one timestamp at a time (A^T A is only
+        num_basis x num_basis, A^T Y is [num_basis, N * 10]), so memory does not grow
+        with the number of timestamps.
+        """
+        num_basis = num_basis_functions(basis, degree)
+        assert len(timestamps) >= num_basis, \
+            f"{len(timestamps)} timestamps cannot determine {num_basis} basis functions"
+        xyz = gaussians.get_xyz
+        num_points = xyz.shape[0]
+        AtA = torch.zeros((num_basis, num_basis), device=xyz.device, dtype=torch.float64)
+        AtY = torch.zeros((num_basis, num_points * 10), device=xyz.device)
+        for t, (means3D, scales, rotations, _, _) in gaussians.states_at_times(timestamps):
+            state = torch.cat([means3D, scales, rotations], dim=-1)
+            phi = trajectory_basis(torch.tensor([t], device=xyz.device), basis, degree)[0]
+            AtA += torch.outer(phi, phi).double()
+            AtY.addr_(phi, state.flatten())
+        AtA += ridge * len(timestamps) * torch.eye(num_basis, device=xyz.device, dtype=torch.float64)
+        coefficients = (torch.linalg.inv(AtA).float() @ AtY).view(num_basis, num_points, 10)
+        return cls(coefficients, basis, degree)
+
+    def save(self, path):
+        torch.save({"basis": self.basis, "degree": self.degree, "coefficients": self.coefficients}, path)
+
+    @classmethod
+    def load(cls, path, device="cuda"):
+        data = torch.load(path, map_location=device)
+        return cls(data["coefficients"], data["basis"], data["degree"])
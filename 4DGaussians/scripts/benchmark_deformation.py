@@ -0,0 +1,170 @@
+#
+# Micro benchmarks of the deformation field (HexPlane + MLP) on random Gaussians.
+#
+#   python scripts/benchmark_deformation.py --bench space_cache --points 300000 --frames 300
+#
+import os
+import sys
+from argparse import ArgumentParser
+from time import time
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene.deformation import deform_network, FusedDeformationHeads
+from scene.hexplane import interpolate_ms_features, normalize_aabb
+from utils.bench_utils import hidden_params, random_gaussians, structure_planes
+
+
+def build_network(device, configs=None):
+    network = deform_network(hidden_params(configs)).to(device)
+    structure_planes(network.deformation_net.grid.grids)
+    return network
+
+
+def synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def timed(fn, device, repeat=1):
+    fn()
+    synchronize(device)
+    start = time()
+    for _ in range(repeat):
+        fn()
+    synchronize(device)
+    return (time() - start) / repeat
+
+
+@torch.no_grad()
+def bench_space_cache(network, gaussians, frames, device):
+    """A video render: every Gaussian deformed once per frame at increasing times."""
+    xyz, scales, rotations, opacity, shs = gaussians
+    grid = network.deformation_net.grid
+
+    def render_video():
+        for t in torch.linspace(0, 1, frames).tolist():
+            network(xyz, scales, rotations, opacity, shs, torch.full((xyz.shape[0], 1), t, device=device))
+
+    results = {}
+    for enabled in [False, True]:
+        grid.cache_space_features = enabled
+        results[enabled] = timed(render_video, device)
+        print(f"space feature cache {'on ' if enabled else 'off'}: {results[enabled]:.3f}s for {frames} frames "
+              f"({1000 * results[enabled] / frames:.2f} ms/frame)")
+    print(f"speedup: {results[False] / results[True]:.2f}x")
+
+
+@torch.no_grad()
+def bench_fused_sampling(network, gaussians, frames, device):
+    """One HexPlane query of every Gaussian, 24 grid_sample calls against one per plane resolution.
+
+    Timing only, scripts/check_fused_sampling.py checks that both give the same features.
+    """
+    grid = network.deformation_net.grid
+    pts = torch.cat((normalize_aabb(gaussians[0], grid.aabb), torch.rand_like(gaussians[0][:, :1])), dim=-1)
+    stack_cache = {}
+    for fused in [False, True]:
+        def query():
+            return interpolate_ms_features(pts, grid.grids, grid.grid_config[0]["grid_dimensions"],
+                                           grid.concat_features, None, fused=fused, stack_cache=stack_cache)
+        print(f"{'fused    ' if fused else 'per plane'}: {1000 * timed(query, device, repeat=5):.2f} ms")
+
+
+@torch.no_grad()
+def bench_time_slicing(network, gaussians, frames, device):
+    """Time planes of a single-timestamp query: 1D lookups on sliced planes against bilinear grid_sample.
+
+    Timing only, scripts/check_time_slicing.py checks that both give the same features.
+    """
+    xyz = gaussians[0]
+    grid = network.deformation_net.grid
+    timestamps = torch.full((xyz.shape[0], 1), 0.5, device=device)
+    for sliced in [False, True]:
+        grid.slice_time_planes = sliced
+        elapsed = timed(lambda: grid.get_time_features(xyz, timestamps), device, repeat=5)
+        print(f"{'sliced  ' if sliced else 'bilinear'}: {1000 * elapsed:.2f} ms")
+
+
+@torch.no_grad()
+def bench_multi_time(network, gaussians, frames, device, chunk_size=1 << 21):
+    """Exporting every frame: one deformation pass per timestamp against batched multi-time passes."""
+    xyz, scales, rotations, opacity, shs = gaussians
+    times = torch.linspace(0, 1, frames, device=device)
+    times_per_chunk = max(1, chunk_size // xyz.shape[0])
+
+    def per_frame():
+        return [network(xyz, scales, rotations, opacity, shs, torch.full((xyz.shape[0], 1), t, device=device))[0]
+                for t in times.tolist()]
+
+    def batched():
+        return [network.forward_multi_time(xyz, scales, rotations, opacity, shs, chunk)[0]
+                for chunk in times.split(times_per_chunk)]
+
+    reference = torch.stack(per_frame()).flatten(0, 1)
+    max_error = (torch.cat(batched()) - reference).abs().max().item()
+    print(f"max abs difference to the per-frame passes: {max_error:.3e}")
+    assert max_error < 1e-4, "batched deformation does not match the per-frame passes"
+    for name, fn in [("per frame", per_frame), ("batched  ", batched)]:
+        print(f"{name}: {timed(fn, device):.3f}s for {frames} frames")
+    print(f"{len(times.split(times_per_chunk))} batched passes of {times_per_chunk} timestamps")
+
+
+@torch.no_grad()
+def bench_lean_inference(network, gaussians, frames, device):
+    """One deformation call: the training forward against the lean inference plan."""
+    xyz, scales, rotations, opacity, shs = gaussians
+    timestamps = torch.full((xyz.shape[0], 1), 0.5, device=device)
+    print("inference plan:", [name for _, name in network.deformation_net.inference_plan])
+    outputs = {}
+    for lean in [False, True]:
+        network.lean_inference = lean
+        outputs[lean] = network(xyz, scales, rotations, opacity, shs, timestamps)
+        elapsed = timed(lambda: network(xyz, scales, rotations, opacity, shs, timestamps), device, repeat=5)
+        print(f"{'lean' if lean else 'full'}: {1000 * elapsed:.2f} ms")
+    print("identical outputs:", all(torch.equal(a, b) for a, b in zip(outputs[False], outputs[True])))
+
+
+@torch.no_grad()
+def bench_fused_heads(network, gaussians, frames, device):
+    """The deformation heads of one frame: one small MLP per head against FusedDeformationHeads."""
+    deformation_net = network.deformation_net
+    if deformation_net.fused_heads is not None:
+        print("network already built with fused_heads")
+        return
+    names = [name for _, name in deformation_net.inference_plan]
+    fused = FusedDeformationHeads({name: getattr(deformation_net, name) for name in names}).to(device)
+    hidden = torch.randn(gaussians[0].shape[0], deformation_net.W, device=device)
+    separate = deformation_net.head_deltas(hidden)
+    max_error = max((separate[name] - delta).abs().max().item() for name, delta in fused(hidden).items())
+    print(f"heads {names}, max abs difference: {max_error:.3e}")
+    for name, fn in [("per head", lambda: deformation_net.head_deltas(hidden)), ("fused   ", lambda: fused(hidden))]:
+        print(f"{name}: {1000 * timed(fn, device, repeat=10):.2f} ms")
+
+
+BENCHMARKS = {
+    "space_cache": bench_space_cache,
+    "fused_sampling": bench_fused_sampling,
+    "time_slicing": bench_time_slicing,
+    "multi_time": bench_multi_time,
+    "lean_inference": bench_lean_inference,
+    "fused_heads": bench_fused_heads,
+}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Deformation field benchmarks")
+    parser.add_argument("--bench", choices=list(BENCHMARKS.keys()), nargs="+", default=list(BENCHMARKS.keys()))
+    parser.add_argument("--points", type=int, default=300000)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--configs", type=str, default="")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    network = build_network(args.device, args.configs)
+    gaussians = random_gaussians(args.points, args.device)
+    print(f"{args.points} Gaussians on {args.device}")
+    for name in args.bench:
+        print(f"== {name}")
+        BENCHMARKS[name](network, gaussians, args.frames, args.device)
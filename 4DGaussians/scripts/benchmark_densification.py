@@ -0,0 +1,90 @@
+#
+# Benchmark of densify / prune rounds on random Gaussians, with the per-Gaussian
+# parameters and Adam moments reallocated every round (capacity_growth 0) or kept in
+# over-allocated capacity buffers (utils/capacity_utils.py).
+#
+#   python scripts/benchmark_densification.py --points 300000 --rounds 20 --capacity_growth 1.5
+#
+import os
+import sys
+from argparse import ArgumentParser
+from time import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from arguments import ModelHiddenParams, OptimizationParams
+from scene.gaussian_model import GaussianModel
+from utils.graphics_utils import BasicPointCloud
+
+
+def build_model(num_points, capacity_growth, device, seed=0):
+    parser = ArgumentParser()
+    hp, op = ModelHiddenParams(parser), OptimizationParams(parser)
+    args = parser.parse_args(["--capacity_growth", str(capacity_growth)])
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    gaussians = GaussianModel(3, hp.extract(args), device)
+    points = np.random.rand(num_points, 3) * 2 - 1
+    gaussians._deformation.deformation_net.set_aabb(points.max(0), points.min(0))
+    gaussians.create_from_pcd(BasicPointCloud(points=points, colors=np.random.rand(num_points, 3),
+                                              normals=np.zeros((num_points, 3))), 1.0, 1)
+    gaussians.training_setup(op.extract(args))
+    return gaussians
+
+
+def densification_round(gaussians, grad_threshold, prune_fraction):
+    # one optimizer step so the Adam moments exist, then the statistics densify reads
+    loss = sum(getattr(gaussians, name).sum() for name in
+               ["_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"])
+    gaussians.optimizer.zero_grad(set_to_none=True)
+    loss.backward()
+    gaussians.optimizer.step()
+    with torch.no_grad():
+        gaussians.xyz_gradient_accum += torch.rand_like(gaussians.xyz_gradient_accum) * grad_threshold / 0.9
+        gaussians.denom += 1
+        gaussians.densify(grad_threshold, 0.0, 1.0, None, 20, 20)
+        gaussians.prune_points(torch.rand(gaussians.get_xyz.shape[0], device=gaussians.get_xyz.device) < prune_fraction)
+
+
+def run(args, capacity_growth):
+    gaussians = build_model(args.points, capacity_growth, args.device)
+    # about a tenth of the Gaussians get cloned or split each round
+    grad_threshold, cuda = 0.95, gaussians.device.type == "cuda"
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        allocations = torch.cuda.memory_stats().get("allocation.all.allocated", 0)
+    start = time()
+    for _ in range(args.rounds):
+        densification_round(gaussians, grad_threshold, args.prune_fraction)
+    if cuda:
+        torch.cuda.synchronize()
+    line = f"capacity_growth {capacity_growth}: {1000 * (time() - start) / args.rounds:.1f} ms/round, " \
+           f"{gaussians.get_xyz.shape[0]} Gaussians"
+    if cuda:
+        allocations = torch.cuda.memory_stats().get("allocation.all.allocated", 0) - allocations
+        line += f", {allocations / args.rounds:.0f} allocations/round, peak {torch.cuda.max_memory_allocated() / 2**20:.0f} MB"
+    if gaussians._capacity_buffers is not None:
+        buffers = gaussians._capacity_buffers.values()
+        line += f", {sum(b.allocations for b in buffers)} buffer reallocations, " \
+                f"{sum(b.storage.numel() * b.storage.element_size() for b in buffers) / 2**20:.0f} MB reserved"
+    print(line)
+    return gaussians
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Densification benchmark")
+    parser.add_argument("--points", type=int, default=300000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--prune_fraction", type=float, default=0.05)
+    parser.add_argument("--capacity_growth", type=float, default=1.5)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    reference = run(args, 0.0)
+    buffered = run(args, args.capacity_growth)
+    max_error = max((getattr(reference, name) - getattr(buffered, name)).abs().max().item()
+                    for name in ["_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"])
+    print(f"max abs difference of the parameters: {max_error:.3e}")
@@ -0,0 +1,55 @@
+#
+# Check that fused_heads only changes how the deformation heads run: a fused and an
+# unfused deform_network built from the same seed have the same state_dict(), leave the
+# random number stream in the same state and give the same deformations.
+#
+#   python scripts/check_fused_heads.py --points 4096
+#
+import os
+import sys
+from argparse import ArgumentParser
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene.deformation import deform_network
+from utils.bench_utils import hidden_params, random_gaussians, structure_planes
+
+
+def build_network(fused_heads, seed, configs=None):
+    torch.manual_seed(seed)
+    network = deform_network(hidden_params(configs, fused_heads=fused_heads))
+    # the next random number shows whether both builds drew the same amount of them
+    return network, torch.rand(1).item()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="fused_heads initialization and output check")
+    parser.add_argument("--points", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--configs", type=str, default="")
+    args = parser.parse_args()
+
+    (unfused, unfused_next), (fused, fused_next) = [build_network(flag, args.seed, args.configs) for flag in (False, True)]
+    ok = fused.deformation_net.fused_heads is not None
+    print("fused heads built:", ok)
+
+    unfused_state, fused_state = unfused.state_dict(), fused.state_dict()
+    same_keys = set(unfused_state) == set(fused_state)
+    same_values = same_keys and all(torch.equal(unfused_state[key], fused_state[key]) for key in unfused_state)
+    print("same state_dict keys:", same_keys, " same values:", same_values)
+    print("same random number stream after the build:", unfused_next == fused_next)
+    ok = ok and same_values and unfused_next == fused_next
+
+    generator = torch.Generator().manual_seed(args.seed + 1)
+    inputs = random_gaussians(args.points, "cpu", generator) + (torch.rand(args.points, 1, generator=generator),)
+    for network in (unfused, fused):
+        torch.manual_seed(args.seed + 2)
+        structure_planes(network.deformation_net.grid.grids)
+    with torch.no_grad():
+        error = max((a - b).abs().max().item() for a, b in zip(unfused(*inputs), fused(*inputs)))
+    print(f"max abs difference of the deformations: {error:.3e}")
+    ok = ok and error < 1e-5
+
+    print("fused heads", "OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
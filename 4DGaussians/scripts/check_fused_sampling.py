@@ -0,0 +1,44 @@
+#
+# Check that the batched HexPlane sampling (one grid_sample per plane resolution,
+# HexPlaneField.fused_sampling) gives the features of the per-plane grid_sample calls,
+# on random planes and points. Exits non-zero when they differ; needs only torch.
+#
+#   python scripts/check_fused_sampling.py --points 100000
+#
+import os
+import sys
+from argparse import ArgumentParser
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.bench_utils import hidden_params, load_module, structure_planes
+
+# the module alone: importing the scene package pulls in the dataset readers
+hexplane = load_module("hexplane", "scene", "hexplane.py")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Fused against per-plane HexPlane sampling")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atol", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    hp = hidden_params()
+    torch.manual_seed(args.seed)
+    grid = hexplane.HexPlaneField(hp.bounds, hp.kplanes_config, hp.multires).to(args.device)
+    structure_planes(grid.grids)
+    with torch.no_grad():
+        xyz = (torch.rand(args.points, 3, device=args.device) * 2 - 1) * 1.5
+        pts = torch.cat((hexplane.normalize_aabb(xyz, grid.aabb), torch.rand_like(xyz[:, :1])), dim=-1)
+        outputs = {fused: hexplane.interpolate_ms_features(pts, grid.grids, grid.grid_config[0]["grid_dimensions"],
+                                                           grid.concat_features, None, fused=fused, stack_cache={})
+                   for fused in (False, True)}
+
+    error = (outputs[False] - outputs[True]).abs().max().item()
+    ok = outputs[False].shape == outputs[True].shape and torch.allclose(outputs[False], outputs[True], rtol=0, atol=args.atol)
+    print(f"{args.points} points on {args.device}, features {tuple(outputs[True].shape)}, max abs difference {error:.3e}")
+    print("fused sampling", "OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
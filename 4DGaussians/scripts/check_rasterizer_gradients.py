@@ -0,0 +1,121 @@
+#
+# Gradient parity check of the PyTorch rasterizer (gaussian_renderer/cpu_rasterizer.py)
+# on a tiny random scene: autograd gradients of every input against central finite
+# differences in double precision, and against the CUDA extension when it is installed
+# and a GPU is available (skipped otherwise). Exits non-zero when a relative error is
+# above --tolerance; needs only torch and numpy.
+#
+#   python scripts/check_rasterizer_gradients.py --gaussians 24 --size 40
+#
+import math
+import os
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.bench_utils import load_module
+from utils.graphics_utils import getProjectionMatrix, getWorld2View2
+
+# the module alone: importing the gaussian_renderer package pulls in the whole scene stack
+cpu_rasterizer = load_module("cpu_rasterizer", "gaussian_renderer", "cpu_rasterizer.py")
+GaussianRasterizer, GaussianRasterizationSettings = cpu_rasterizer.GaussianRasterizer, cpu_rasterizer.GaussianRasterizationSettings
+
+INPUTS = ["means3D", "means2D", "opacities", "shs", "scales", "rotations"]
+
+
+def make_scene(num_gaussians, size, sh_degree, dtype, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    rand = lambda *shape: torch.rand(*shape, generator=generator, dtype=dtype)
+    fov = 0.9
+    view = torch.tensor(getWorld2View2(np.eye(3), np.array([0, 0, 3.0]))).transpose(0, 1).to(dtype)
+    projection = view @ getProjectionMatrix(0.01, 100, fov, fov).transpose(0, 1).to(dtype)
+    settings = GaussianRasterizationSettings(size, size, math.tan(fov / 2), math.tan(fov / 2), torch.tensor([0.1, 0.2, 0.3], dtype=dtype),
+                                             1.0, view, projection, sh_degree, torch.inverse(view.T)[:3, 3], False, False)
+    inputs = {"means3D": rand(num_gaussians, 3) * 1.6 - 0.8,
+              "means2D": torch.zeros(num_gaussians, 3, dtype=dtype),
+              "opacities": rand(num_gaussians, 1) * 0.8 + 0.1,
+              "shs": (rand(num_gaussians, (sh_degree + 1) ** 2, 3) - 0.5) * 0.6,
+              "scales": rand(num_gaussians, 3) * 0.15 + 0.05,
+              "rotations": torch.nn.functional.normalize(rand(num_gaussians, 4) - 0.5, dim=-1)}
+    # fixed random weights make every pixel and channel count in the loss
+    weights = rand(4, size, size)
+    return settings, inputs, weights
+
+
+def loss_of(rasterizer, inputs, weights):
+    image, radii, depth = rasterizer(**inputs)
+    return (image * weights[:3]).sum() + 0.1 * (depth * weights[3:]).sum()
+
+
+def autograd_gradients(rasterizer, inputs, weights):
+    inputs = {name: value.clone().requires_grad_(True) for name, value in inputs.items()}
+    loss_of(rasterizer, inputs, weights).backward()
+    return {name: value.grad for name, value in inputs.items()}
+
+
+@torch.no_grad()
+def finite_differences(rasterizer, inputs, weights, name, entries, eps):
+    gradient = []
+    for entry in entries:
+        values = []
+        for sign in (1, -1):
+            shifted = dict(inputs)
+            shifted[name] = inputs[name].clone()
+            shifted[name].view(-1)[entry] += sign * eps
+            values.append(loss_of(rasterizer, shifted, weights))
+        gradient.append((values[0] - values[1]) / (2 * eps))
+    return torch.stack(gradient)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Gradient parity check of the PyTorch rasterizer")
+    parser.add_argument("--gaussians", type=int, default=24)
+    parser.add_argument("--size", type=int, default=40)
+    parser.add_argument("--sh_degree", type=int, default=1)
+    parser.add_argument("--entries", type=int, default=24, help="checked entries per input")
+    parser.add_argument("--eps", type=float, default=1e-6)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--cuda_tolerance", type=float, default=1e-2, help="float32 comparison with the CUDA rasterizer")
+    args = parser.parse_args()
+
+    settings, inputs, weights = make_scene(args.gaussians, args.size, args.sh_degree, torch.float64)
+    # with more than one thread the tiles are split into groups: the checkpointed, threaded path
+    rasterizer = GaussianRasterizer(settings, num_threads=args.threads)
+    gradients = autograd_gradients(rasterizer, inputs, weights)
+    generator = torch.Generator().manual_seed(1)
+    worst, worst_cuda = 0.0, 0.0
+    for name in INPUTS:
+        numel = inputs[name].numel()
+        entries = torch.randperm(numel, generator=generator)[:args.entries]
+        numeric = finite_differences(rasterizer, inputs, weights, name, entries, args.eps)
+        analytic = gradients[name].reshape(-1)[entries]
+        error = ((analytic - numeric).abs() / (numeric.abs().max() + 1e-12)).max().item()
+        worst = max(worst, error)
+        print(f"{name:10s} max |grad| {numeric.abs().max().item():.3e}  relative error vs finite differences {error:.2e}")
+
+    try:
+        from diff_gaussian_rasterization import GaussianRasterizer as CUDARasterizer
+    except ImportError:
+        CUDARasterizer = None
+    if CUDARasterizer is not None and torch.cuda.is_available():
+        settings, inputs, weights = make_scene(args.gaussians, args.size, args.sh_degree, torch.float32)
+        to_cuda = lambda value: value.cuda() if torch.is_tensor(value) else value
+        cuda_settings = settings._replace(**{key: to_cuda(value) for key, value in settings._asdict().items()})
+        inputs, weights = {name: value.cuda() for name, value in inputs.items()}, weights.cuda()
+        reference = autograd_gradients(CUDARasterizer(raster_settings=cuda_settings), inputs, weights)
+        ours = autograd_gradients(GaussianRasterizer(cuda_settings), inputs, weights)
+        for name in INPUTS:
+            error = ((ours[name] - reference[name]).abs().max() / (reference[name].abs().max() + 1e-12)).item()
+            # float32 on both sides, against the float64 finite differences above
+            worst_cuda = max(worst_cuda, error)
+            print(f"{name:10s} relative error vs CUDA rasterizer {error:.2e}")
+    else:
+        print("CUDA rasterizer not available, skipped the comparison with it")
+    ok = worst < args.tolerance and worst_cuda < args.cuda_tolerance
+
+    print("gradient parity", "OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
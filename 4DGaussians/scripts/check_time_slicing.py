@@ -0,0 +1,57 @@
+#
+# Check that the sliced time planes of single-timestamp queries (HexPlaneField.slice_time_planes,
+# 1D lookups on planes sliced once per timestamp) give the features of the bilinear grid_sample
+# path, on random planes and points at several timestamps including both ends. Exits non-zero
+# when they differ; needs only torch.
+#
+#   python scripts/check_time_slicing.py --points 100000
+#
+import os
+import sys
+from argparse import ArgumentParser
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.bench_utils import hidden_params, load_module, random_gaussians, structure_planes
+
+# the module alone: importing the scene package pulls in the dataset readers
+hexplane = load_module("hexplane", "scene", "hexplane.py")
+
+
+@torch.no_grad()
+def features(grid, xyz, t, sliced):
+    grid.slice_time_planes = sliced
+    timestamps = torch.full((xyz.shape[0], 1), t, device=xyz.device)
+    return grid.get_time_features(xyz, timestamps), grid(xyz, timestamps)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Sliced against bilinear time-plane sampling")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--times", type=int, default=7)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atol", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    hp = hidden_params()
+    torch.manual_seed(args.seed)
+    grid = hexplane.HexPlaneField(hp.bounds, hp.kplanes_config, hp.multires).to(args.device)
+    structure_planes(grid.grids)
+    # the spatial feature cache is another path of the same query, keep it out of the comparison
+    grid.cache_space_features = False
+    xyz = random_gaussians(args.points, args.device)[0]
+
+    ok = True
+    for t in torch.linspace(0, 1, args.times).tolist():
+        (bilinear_levels, bilinear), (sliced_levels, sliced) = [features(grid, xyz, t, flag) for flag in (False, True)]
+        pairs = list(zip(bilinear_levels, sliced_levels)) + [(bilinear, sliced)]
+        error = max((a - b).abs().max().item() for a, b in pairs)
+        same = all(a.shape == b.shape and torch.allclose(a, b, rtol=0, atol=args.atol) for a, b in pairs)
+        print(f"t = {t:.3f}: max abs difference {error:.3e}")
+        ok = ok and same
+
+    print(f"{args.points} points on {args.device}, features {tuple(sliced.shape)}")
+    print("time slicing", "OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,50 @@
+#
+# Convert a trained iteration (point_cloud.ply, deformation.pth, deformation_table.pth,
+# deformation_accum.pth and trajectory.pth if present) into the single-file model.pack
+# that Scene loads in their place.
+#
+#   python scripts/pack_checkpoint.py --model_path output/dnerf/lego --configs arguments/dnerf/lego.py
+#
+import os
+import sys
+from argparse import ArgumentParser
+from time import time
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from arguments import ModelParams, ModelHiddenParams, get_combined_args
+from scene.gaussian_model import GaussianModel
+from utils.packed_checkpoint import PackedCheckpoint
+from utils.system_utils import searchForMaxIteration
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Pack a trained model into one memory-mappable file")
+    model = ModelParams(parser, sentinel=True)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--configs", type=str)
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+
+    iteration = args.iteration
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(args.model_path, "point_cloud"))
+    path = os.path.join(args.model_path, "point_cloud", "iteration_" + str(iteration))
+    dataset = model.extract(args)
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, hyperparam.extract(args), dataset.device)
+        gaussians.load_ply(os.path.join(path, "point_cloud.ply"))
+        gaussians.load_model(path)
+        packed_path = os.path.join(path, "model.pack")
+        gaussians.save_packed(packed_path)
+    print(f"saved {packed_path} ({os.path.getsize(packed_path) / 2**20:.1f} MB)")
+
+    start = time()
+    checkpoint = PackedCheckpoint(packed_path)
+    xyz = checkpoint["xyz"]
+    print(f"opened and mapped {xyz.shape[0]} positions in {1000 * (time() - start):.1f} ms")
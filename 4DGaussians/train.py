@@ -14,7 +14,7 @@ import os, sys
 import torch
 from random import randint
 from utils.loss_utils import l1_loss, ssim, l2_loss, lpips_loss
-from gaussian_renderer import render, network_gui
+from gaussian_renderer import render, render_batch, camera_time, network_gui
 import sys
 from scene import Scene, GaussianModel
 from utils.general_utils import safe_state
@@ -24,8 +24,8 @@ from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams, ModelHiddenParams
 from torch.utils.data import DataLoader
-from utils.timer import Timer
-from utils.loader_utils import FineSampler, get_stamp_list
+from utils.timer import Timer, timing_event
+from utils.loader_utils import FineSampler, TimeGroupedBatchSampler, get_stamp_list, get_times
 import lpips
 from utils.scene_utils import render_training_image
 from time import time
@@ -51,15 +51,15 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             # process is in the coarse stage, but start from fine stage
             return
         if stage in checkpoint: 
-            (model_params, first_iter) = torch.load(checkpoint)
+            (model_params, first_iter) = torch.load(checkpoint, map_location=dataset.device)
             gaussians.restore(model_params, opt)
 
 
     bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    background = torch.tensor(bg_color, dtype=torch.float32, device=dataset.device)
 
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
+    iter_start = timing_event(dataset.device)
+    iter_end = timing_event(dataset.device)
 
     viewpoint_stack = None
     ema_loss_for_log = 0.0
@@ -88,6 +88,11 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             sampler = FineSampler(viewpoint_stack)
             viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=batch_size,sampler=sampler,num_workers=16,collate_fn=list)
             random_loader = False
+        elif opt.batch_timestamps > 0:
+            # reshuffled every epoch, so it stays in place of the random loader
+            sampler = TimeGroupedBatchSampler(get_times(viewpoint_stack), batch_size, opt.batch_timestamps)
+            viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_sampler=sampler,num_workers=16,collate_fn=list)
+            random_loader = True
         else:
             viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=batch_size,shuffle=True,num_workers=16,collate_fn=list)
             random_loader = True
@@ -123,7 +128,8 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                     viewpoint = video_cams[viewpoint_index]
                     custom_cam.time = viewpoint.time
                     # print(custom_cam.time, viewpoint_index, count)
-                    net_image = render(custom_cam, gaussians, pipe, background, scaling_modifer, stage=stage, cam_type=scene.dataset_type)["render"]
+                    with torch.no_grad():
+                        net_image = render(custom_cam, gaussians, pipe, background, scaling_modifer, stage=stage, cam_type=scene.dataset_type)["render"]
 
                     net_image_bytes = memoryview((torch.clamp(net_image, min=0, max=1.0) * 255).byte().permute(1, 2, 0).contiguous().cpu().numpy())
                 network_gui.send(net_image_bytes, dataset.source_path)
@@ -157,10 +163,18 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         else:
             idx = 0
             viewpoint_cams = []
+            batch_times = set()
 
             while idx < batch_size :    
-                    
-                viewpoint_cam = viewpoint_stack.pop(randint(0,len(viewpoint_stack)-1))
+                candidates = None
+                if opt.batch_timestamps > 0 and len(batch_times) >= opt.batch_timestamps:
+                    # time-grouped batch: the rest comes from the timestamps already drawn while they last
+                    candidates = [i for i, cam in enumerate(viewpoint_stack) if camera_time(cam, scene.dataset_type) in batch_times]
+                if candidates:
+                    viewpoint_cam = viewpoint_stack.pop(candidates[randint(0,len(candidates)-1)])
+                else:
+                    viewpoint_cam = viewpoint_stack.pop(randint(0,len(viewpoint_stack)-1))
+                batch_times.add(camera_time(viewpoint_cam, scene.dataset_type))
                 if not viewpoint_stack :
                     viewpoint_stack =  temp_list.copy()
                 viewpoint_cams.append(viewpoint_cam)
@@ -177,19 +191,22 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         radii_list = []
         visibility_filter_list = []
         viewspace_point_tensor_list = []
-        for viewpoint_cam in viewpoint_cams:
-            render_pkg = render(viewpoint_cam, gaussians, pipe, background, stage=stage,cam_type=scene.dataset_type)
+        means3D_list = []
+        # cameras sharing a timestamp share one deformation of the Gaussians
+        render_pkgs = render_batch(viewpoint_cams, gaussians, pipe, background, stage=stage,cam_type=scene.dataset_type)
+        for viewpoint_cam, render_pkg in zip(viewpoint_cams, render_pkgs):
             image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
             images.append(image.unsqueeze(0))
             if scene.dataset_type!="PanopticSports":
-                gt_image = viewpoint_cam.original_image.cuda()
+                gt_image = viewpoint_cam.original_image.to(image.device)
             else:
-                gt_image  = viewpoint_cam['image'].cuda()
+                gt_image  = viewpoint_cam['image'].to(image.device)
             
             gt_images.append(gt_image.unsqueeze(0))
             radii_list.append(radii.unsqueeze(0))
             visibility_filter_list.append(visibility_filter.unsqueeze(0))
             viewspace_point_tensor_list.append(viewspace_point_tensor)
+            means3D_list.append(render_pkg["means3D"])
         
 
         radii = torch.cat(radii_list,0).max(dim=0).values
@@ -260,6 +277,13 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                 # Keep track of max radii in image-space for pruning
                 gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
                 gaussians.add_densification_stats(viewspace_point_tensor_grad, visibility_filter)
+                if stage == "fine" and opt.static_threshold > 0:
+                    # measure how far the deformation field moves each Gaussian, and stop deforming
+                    # those that barely move; densification resets the statistics, so classify first
+                    for means3D_deformed in means3D_list:
+                        gaussians.add_deformation_stats(means3D_deformed)
+                    if iteration > opt.static_from_iter and iteration % opt.densification_interval == 0:
+                        gaussians.update_deformation_table(opt.static_threshold)
 
                 if stage == "coarse":
                     opacity_threshold = opt.opacity_threshold_coarse
@@ -267,19 +291,18 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                 else:    
                     opacity_threshold = opt.opacity_threshold_fine_init - iteration*(opt.opacity_threshold_fine_init - opt.opacity_threshold_fine_after)/(opt.densify_until_iter)  
                     densify_threshold = opt.densify_grad_threshold_fine_init - iteration*(opt.densify_grad_threshold_fine_init - opt.densify_grad_threshold_after)/(opt.densify_until_iter )  
-                if  iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 and gaussians.get_xyz.shape[0]<360000:
+                # the Gaussian budget replaces fixed count limits: densification fills it by gradient
+                # priority and, once reached, swaps the least important Gaussians for new ones
+                budget = gaussians.gaussian_budget(opt.max_gaussians, opt.max_gaussian_bytes)
+                densify = iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0
+                prune = iteration > opt.pruning_from_iter and iteration % opt.pruning_interval == 0
+                if densify or prune:
                     size_threshold = 20 if iteration > opt.opacity_reset_interval else None
+                    # clone, split and prune in one pass, same result as densify() then prune()
+                    # pruning only above min_gaussians, counted after this round's densification
+                    gaussians.densify_and_prune(densify_threshold, opacity_threshold, scene.cameras_extent, size_threshold, densify, prune,
+                                                budget=budget, budget_turnover=opt.budget_turnover, min_points=opt.min_gaussians)
                     
-                    gaussians.densify(densify_threshold, opacity_threshold, scene.cameras_extent, size_threshold, 5, 5, scene.model_path, iteration, stage)
-                if  iteration > opt.pruning_from_iter and iteration % opt.pruning_interval == 0 and gaussians.get_xyz.shape[0]>200000:
-                    size_threshold = 20 if iteration > opt.opacity_reset_interval else None
-
-                    gaussians.prune(densify_threshold, opacity_threshold, scene.cameras_extent, size_threshold)
-                    
-                # if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 :
-                if iteration % opt.densification_interval == 0 and gaussians.get_xyz.shape[0]<360000 and opt.add_point:
-                    gaussians.grow(5,5,scene.model_path,iteration,stage)
-                    # torch.cuda.empty_cache()
                 if iteration % opt.opacity_reset_interval == 0:
                     print("reset opacity")
                     gaussians.reset_opacity()
@@ -288,7 +311,12 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
 
             # Optimizer step
             if iteration < opt.iterations:
-                gaussians.optimizer.step()
+                if opt.sparse_adam:
+                    gaussians.optimizer.step(visibility=visibility_filter)
+                else:
+                    gaussians.optimizer.step()
+                # the cached deformed states were computed from the parameters before the step
+                gaussians.clear_state_cache()
                 gaussians.optimizer.zero_grad(set_to_none = True)
 
             if (iteration in checkpoint_iterations):
@@ -297,7 +325,7 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
 def training(dataset, hyper, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, expname):
     # first_iter = 0
     tb_writer = prepare_output_and_logger(expname)
-    gaussians = GaussianModel(dataset.sh_degree, hyper)
+    gaussians = GaussianModel(dataset.sh_degree, hyper, dataset.device)
     dataset.model_path = args.model_path
     timer = Timer()
     scene = Scene(dataset, gaussians, load_coarse=None)
@@ -353,9 +381,9 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
                 for idx, viewpoint in enumerate(config['cameras']):
                     image = torch.clamp(renderFunc(viewpoint, scene.gaussians,stage=stage, cam_type=dataset_type, *renderArgs)["render"], 0.0, 1.0)
                     if dataset_type == "PanopticSports":
-                        gt_image = torch.clamp(viewpoint["image"].to("cuda"), 0.0, 1.0)
+                        gt_image = torch.clamp(viewpoint["image"].to(image.device), 0.0, 1.0)
                     else:
-                        gt_image = torch.clamp(viewpoint.original_image.to("cuda"), 0.0, 1.0)
+                        gt_image = torch.clamp(viewpoint.original_image.to(image.device), 0.0, 1.0)
                     try:
                         if tb_writer and (idx < 5):
                             tb_writer.add_images(stage + "/"+config['name'] + "_view_{}/render".format(viewpoint.image_name), image[None], global_step=iteration)
@@ -380,7 +408,7 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
             
             tb_writer.add_scalar(f'{stage}/total_points', scene.gaussians.get_xyz.shape[0], iteration)
             tb_writer.add_scalar(f'{stage}/deformation_rate', scene.gaussians._deformation_table.sum()/scene.gaussians.get_xyz.shape[0], iteration)
-            tb_writer.add_histogram(f"{stage}/scene/motion_histogram", scene.gaussians._deformation_accum.mean(dim=-1)/100, iteration,max_bins=500)
+            tb_writer.add_histogram(f"{stage}/scene/motion_histogram", scene.gaussians.get_deformation_motion.mean(dim=-1), iteration,max_bins=500)
         
         torch.cuda.empty_cache()
 def setup_seed(seed):
@@ -421,7 +449,7 @@ if __name__ == "__main__":
     print("Optimizing " + args.model_path)
 
     # Initialize system state (RNG)
-    safe_state(args.quiet)
+    safe_state(args.quiet, args.device)
 
     # Start GUI server, configure and run training
     network_gui.init(args.ip, args.port)
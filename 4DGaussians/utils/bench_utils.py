@@ -0,0 +1,53 @@
+import importlib.util
+import os
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelHiddenParams
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def load_module(name, *path):
+    """A module of the repository loaded from its file, without importing its package.
+
+    The scene and gaussian_renderer packages pull in the dataset readers on import, the
+    checks of scripts/ only need torch for the modules they test.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def hidden_params(configs="", **overrides):
+    """ModelHiddenParams defaults, merged with an mmcv config file when given, then overrides."""
+    parser = ArgumentParser()
+    hp = ModelHiddenParams(parser)
+    args = parser.parse_args([])
+    if configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        args = merge_hparams(args, mmcv.Config.fromfile(configs))
+    for name, value in overrides.items():
+        setattr(args, name, value)
+    return hp.extract(args)
+
+
+@torch.no_grad()
+def structure_planes(ms_grids):
+    """Give the planes of a HexPlaneField some structure instead of the constant time-plane initialisation."""
+    for grids in ms_grids:
+        for grid in grids:
+            grid.uniform_(0.1, 1.0)
+
+
+def random_gaussians(num_points, device, generator=None):
+    """Random (xyz, scales, rotations, opacity, shs) inside the default bounds, 16 SH coefficients."""
+    xyz = (torch.rand(num_points, 3, generator=generator) * 2 - 1) * 1.5
+    scales = torch.randn(num_points, 3, generator=generator) - 4
+    rotations = torch.nn.functional.normalize(torch.randn(num_points, 4, generator=generator))
+    opacity = torch.randn(num_points, 1, generator=generator)
+    shs = torch.randn(num_points, 16, 3, generator=generator)
+    return tuple(value.to(device) for value in (xyz, scales, rotations, opacity, shs))
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+def _state_nbytes(state):
+    return sum(t.numel() * t.element_size() for t in state if t is not None)
+
+
+class DeformedStateCache:
+    """LRU cache of deformed Gaussian states keyed by timestamp.
+
+    An entry is the tuple (means3D, scales, rotations, opacity, shs) that the
+    renderer hands to the rasterizer, i.e. already deformed and activated, so a
+    hit skips the HexPlane and MLP pass entirely. The total size of the cached
+    tensors is kept under max_bytes by evicting the least recently used
+    timestamps; max_bytes <= 0 disables the cache.
+    """
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        state = self.entries.get(key, None)
+        if state is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return state
+
+    def put(self, key, state):
+        size = _state_nbytes(state)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= _state_nbytes(self.entries.pop(key))
+        while self.entries and self.nbytes + size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= _state_nbytes(evicted)
+        self.entries[key] = state
+        self.nbytes += size
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
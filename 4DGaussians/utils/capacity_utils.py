@@ -0,0 +1,81 @@
+import torch
+
+
+class CapacityBuffer:
+    """Over-allocated [capacity, ...] storage of which the first count rows are live.
+
+    The live rows are handed out as a view (storage[:count]), so parameters and Adam
+    moments built on them are updated in place. Appending rows only reallocates when
+    the capacity is exceeded, and then grows it geometrically by growth; compact keeps
+    a subset of the rows by moving them to the front in place.
+    """
+    def __init__(self, growth=1.5):
+        self.growth = growth
+        self.storage = None
+        self.count = 0
+        self.allocations = 0
+
+    @property
+    def capacity(self):
+        return 0 if self.storage is None else self.storage.shape[0]
+
+    def view(self):
+        return self.storage[:self.count]
+
+    def holds(self, tensor):
+        """Whether tensor is the current live view of this buffer."""
+        return (self.storage is not None and tensor.shape[0] == self.count and tensor.dtype == self.storage.dtype
+                and tensor.shape[1:] == self.storage.shape[1:] and tensor.data_ptr() == self.storage.data_ptr())
+
+    @torch.no_grad()
+    def _allocate(self, rows, like):
+        capacity = max(rows, int(rows * self.growth))
+        storage = torch.empty((capacity,) + tuple(like.shape[1:]), dtype=like.dtype, device=like.device)
+        storage[:like.shape[0]] = like
+        self.storage, self.count = storage, like.shape[0]
+        self.allocations += 1
+
+    def adopt(self, tensor, extra=0):
+        """Makes tensor the live rows, copying it into new storage unless it already is."""
+        if not self.holds(tensor) or self.count + extra > self.capacity:
+            self._allocate(tensor.shape[0] + extra, tensor.detach())
+        return self.view()
+
+    @torch.no_grad()
+    def append(self, rows):
+        count = self.count + rows.shape[0]
+        if count > self.capacity:
+            self._allocate(count, self.view())
+        self.storage[self.count:count] = rows
+        self.count = count
+        return self.view()
+
+    @torch.no_grad()
+    def compact(self, mask, chunk_size=1 << 16):
+        """Keeps the live rows where mask is set, in order.
+
+        Kept row j comes from row index[j] >= j, so copying forward in chunks never
+        overwrites a row that is still to be read.
+        """
+        index = mask.nonzero(as_tuple=True)[0]
+        for start in range(0, index.shape[0], chunk_size):
+            rows = index[start:start + chunk_size]
+            self.storage[start:start + rows.shape[0]] = self.storage[rows]
+        self.count = index.shape[0]
+        return self.view()
+
+    @torch.no_grad()
+    def empty(self, shape, dtype=torch.float32, device="cuda"):
+        """An uninitialised view of shape, reusing the storage when it is large enough."""
+        device = torch.device(device)
+        if (self.storage is None or self.capacity < shape[0] or self.storage.dtype != dtype
+                or tuple(self.storage.shape[1:]) != tuple(shape[1:]) or self.storage.device.type != device.type
+                or device.index not in (None, self.storage.device.index)):
+            self._allocate(shape[0], torch.empty((0,) + tuple(shape[1:]), dtype=dtype, device=device))
+        self.count = shape[0]
+        return self.view()
+
+    @torch.no_grad()
+    def zeros(self, shape, dtype=torch.float32, device="cuda"):
+        """A zeroed view of shape, reusing the storage when it is large enough."""
+        return self.empty(shape, dtype, device).zero_()
@@ -0,0 +1,132 @@
+#
+# Lossy compression of a trained model into the packed checkpoint format
+# (utils/packed_checkpoint.py):
+#   - k-means codebooks for the SH rest coefficients (optionally scaling / rotation),
+#   - float16 or 8-bit quantized positions, opacity and the remaining attributes,
+#   - float16 or 8-bit (per channel) HexPlane grids.
+# decompress_sections turns such a checkpoint back into the float32 sections that
+# GaussianModel.load_packed reads.
+#
+import torch
+
+
+def kmeans(x, num_clusters, iterations=10, seed=0):
+    """Lloyd's k-means on the rows of x; returns (centers [K, D], assignment [N])."""
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    num_clusters = min(num_clusters, x.shape[0])
+    centers = x[torch.randperm(x.shape[0], generator=generator)[:num_clusters].to(x.device)].clone()
+    for _ in range(iterations):
+        assignment = nearest_center(x, centers)
+        sums = torch.zeros_like(centers).index_add_(0, assignment, x)
+        counts = torch.bincount(assignment, minlength=num_clusters)
+        nonempty = counts > 0
+        centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centers, nearest_center(x, centers)
+
+
+def nearest_center(x, centers):
+    # chunked so the distance matrix stays around 64M entries
+    chunk = max(1, (1 << 26) // centers.shape[0])
+    return torch.cat([torch.cdist(rows, centers).argmin(dim=1) for rows in x.split(chunk)])
+
+
+def encode(name, tensor, bits, axis=None):
+    """Sections and scheme storing tensor with 32 / 16 bit floats or 8 bit integers.
+
+    8 bit uses a min / scale pair per index of axis (per tensor if axis is None).
+    """
+    tensor = tensor.detach().float()
+    if bits == 32:
+        return {name: tensor}, {"bits": 32}
+    if bits == 16:
+        return {name: tensor.half()}, {"bits": 16}
+    assert bits == 8, f"unsupported bit width {bits}"
+    if axis is None:
+        low, high = tensor.min().reshape(1), tensor.max().reshape(1)
+        shape = [1] * tensor.dim()
+    else:
+        moved = tensor.transpose(0, axis).reshape(tensor.shape[axis], -1)
+        low, high = moved.min(dim=1).values, moved.max(dim=1).values
+        shape = [1] * tensor.dim()
+        shape[axis] = -1
+    scale = (high - low).clamp_min(1e-12) / 255
+    quantized = ((tensor - low.view(shape)) / scale.view(shape)).round().clamp(0, 255).to(torch.uint8)
+    return {name: quantized, name + ".min": low, name + ".scale": scale}, {"bits": 8, "axis": axis}
+
+
+def decode(sections, name, scheme):
+    tensor = sections[name]
+    if scheme.get("raw", False):
+        return tensor
+    if scheme["bits"] != 8:
+        return tensor.float()
+    shape = [1] * tensor.dim()
+    if scheme["axis"] is not None:
+        shape[scheme["axis"]] = -1
+    return tensor.float() * sections[name + ".scale"].view(shape) + sections[name + ".min"].view(shape)
+
+
+def encode_codebook(name, tensor, num_clusters, iterations, bits=16):
+    rows = tensor.detach().float().reshape(tensor.shape[0], -1)
+    centers, assignment = kmeans(rows, num_clusters, iterations)
+    index_dtype = torch.int16 if centers.shape[0] <= 2 ** 15 else torch.int32
+    sections, scheme = encode(name + ".codebook", centers, bits)
+    sections[name + ".index"] = assignment.to(index_dtype)
+    return sections, {"codebook": scheme, "shape": list(tensor.shape[1:])}
+
+
+def decode_codebook(sections, name, scheme):
+    centers = decode(sections, name + ".codebook", scheme["codebook"])
+    return centers[sections[name + ".index"].long()].reshape([-1] + scheme["shape"])
+
+
+@torch.no_grad()
+def compress_gaussians(gaussians, sh_codebook_size=4096, scale_rotation_codebook_size=0, kmeans_iterations=10,
+                       position_bits=16, opacity_bits=8, attribute_bits=16, grid_bits=16):
+    """Returns (sections, metadata) for utils.packed_checkpoint.save_packed."""
+    sections, schemes = {}, {}
+
+    def add(name, encoded):
+        sections.update(encoded[0])
+        schemes[name] = encoded[1]
+
+    add("xyz", encode("xyz", gaussians._xyz, position_bits))
+    add("opacity", encode("opacity", gaussians._opacity, opacity_bits))
+    add("features_dc", encode("features_dc", gaussians._features_dc, attribute_bits))
+    if gaussians._features_rest.shape[1] > 0 and sh_codebook_size > 0:
+        add("features_rest", encode_codebook("features_rest", gaussians._features_rest, sh_codebook_size, kmeans_iterations))
+    else:
+        add("features_rest", encode("features_rest", gaussians._features_rest, attribute_bits))
+    for name, value in [("scaling", gaussians._scaling), ("rotation", gaussians._rotation)]:
+        if scale_rotation_codebook_size > 0:
+            add(name, encode_codebook(name, value, scale_rotation_codebook_size, kmeans_iterations))
+        else:
+            add(name, encode(name, value, attribute_bits))
+    for key, value in gaussians._deformation.state_dict().items():
+        name = "deformation/" + key
+        if ".grid.grids." in key:
+            # planes are [1, C, H, W], quantized per feature channel
+            add(name, encode(name, value, grid_bits, axis=1))
+        elif value.is_floating_point():
+            add(name, encode(name, value, 32))
+        else:
+            add(name, ({name: value}, {"raw": True}))
+    add("deformation_table", ({"deformation_table": gaussians._deformation_table}, {"raw": True}))
+    metadata = {"active_sh_degree": gaussians.active_sh_degree, "max_sh_degree": gaussians.max_sh_degree,
+                "compression": schemes}
+    if gaussians._trajectory is not None:
+        add("trajectory/coefficients", encode("trajectory/coefficients", gaussians._trajectory.coefficients, 32))
+        metadata["trajectory"] = {"basis": gaussians._trajectory.basis, "degree": gaussians._trajectory.degree}
+    return sections, metadata
+
+
+def decompress_sections(checkpoint):
+    """The float32 sections of GaussianModel.save_packed from a compressed checkpoint."""
+    sections = {}
+    for name, scheme in checkpoint.metadata["compression"].items():
+        if "codebook" in scheme:
+            sections[name] = decode_codebook(checkpoint, name, scheme)
+        else:
+            sections[name] = decode(checkpoint, name, scheme)
+    sections["deformation_accum"] = torch.zeros((sections["xyz"].shape[0], 3))
+    return sections
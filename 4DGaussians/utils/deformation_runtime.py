@@ -0,0 +1,31 @@
+#
+# Runtime for deformation networks exported by export_deformation.py. Only needs torch,
+# none of the training code (scene, simple_knn, open3d, ...) is imported.
+#
+import json
+import torch
+
+
+class DeformationRuntime:
+    """Evaluates an exported TorchScript deformation network.
+
+    The module maps (xyz [N, 3], scales [N, 3], rotations [N, 4], opacity [N, 1],
+    shs [N, 16, 3], t [N, 1]) to the deformed tuple in the same layout and
+    pre-activation space as deform_network.forward.
+    """
+    def __init__(self, path, device="cpu"):
+        extra_files = {"config.json": ""}
+        self.module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        self.module.eval()
+        self.config = json.loads(extra_files["config.json"]) if extra_files["config.json"] else {}
+        self.device = torch.device(device)
+
+    @torch.no_grad()
+    def __call__(self, xyz, scales, rotations, opacity, shs, t):
+        if not torch.is_tensor(t) or t.dim() == 0:
+            t = torch.full((xyz.shape[0], 1), float(t), device=xyz.device)
+        return self.module(xyz, scales, rotations, opacity, shs, t)
+
+
+def load_deformation(path, device="cpu"):
+    return DeformationRuntime(path, device)
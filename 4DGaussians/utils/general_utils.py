@@ -68,7 +68,7 @@ def get_expon_lr_func(
     return helper
 
 def strip_lowerdiag(L):
-    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device="cuda")
+    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device=L.device)
 
     uncertainty[:, 0] = L[:, 0, 0]
     uncertainty[:, 1] = L[:, 0, 1]
@@ -86,7 +86,7 @@ def build_rotation(r):
 
     q = r / norm[:, None]
 
-    R = torch.zeros((q.size(0), 3, 3), device='cuda')
+    R = torch.zeros((q.size(0), 3, 3), device=r.device)
 
     r = q[:, 0]
     x = q[:, 1]
@@ -105,7 +105,7 @@ def build_rotation(r):
     return R
 
 def build_scaling_rotation(s, r):
-    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device="cuda")
+    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device=s.device)
     R = build_rotation(r)
 
     L[:,0,0] = s[:,0]
@@ -115,7 +115,17 @@ def build_scaling_rotation(s, r):
     L = R @ L
     return L
 
-def safe_state(silent):
+def mean_knn_dist2(points, k=3):
+    """Mean squared distance of each point to its k nearest neighbours, distCUDA2 of
+    simple_knn for devices it does not run on. Chunked brute force."""
+    chunk_size = max(1, 2 ** 25 // max(points.shape[0], 1))
+    dist2 = []
+    for chunk in points.split(chunk_size):
+        nearest = torch.cdist(chunk, points).topk(min(k + 1, points.shape[0]), dim=1, largest=False).values[:, 1:]
+        dist2.append((nearest ** 2).mean(dim=1))
+    return torch.cat(dist2)
+
+def safe_state(silent, device="cuda"):
     old_f = sys.stdout
     class F:
         def __init__(self, silent):
@@ -136,4 +146,5 @@ def safe_state(silent):
     random.seed(0)
     np.random.seed(0)
     torch.manual_seed(0)
-    torch.cuda.set_device(torch.device("cuda:0"))
+    if torch.device(device).type == "cuda" and torch.cuda.is_available():
+        torch.cuda.set_device(torch.device("cuda:0"))
@@ -17,6 +17,40 @@ def get_stamp_list(dataset, timestamp):
         raise IndexError("input timestamp bigger than total timestamp.")
     print("select index:",[i*frame_length+timestamp for i in range(len(dataset.dataset.poses))])
     return [dataset[i*frame_length+timestamp] for i in range(len(dataset.dataset.poses))]
+def get_times(dataset):
+    # timestamp of every camera of a FourDGSdataset, without loading the images
+    source = dataset.dataset
+    if hasattr(source, "image_times"):
+        return [float(time) for time in source.image_times]
+    if dataset.dataset_type == "PanopticSports":
+        return [float(dataset[i]['time']) for i in range(len(dataset))]
+    return [float(caminfo.time) for caminfo in source]
+class TimeGroupedBatchSampler(Sampler):
+    # batches of batch_size cameras drawn from about timestamps_per_batch timestamps (the
+    # cameras left over by each timestamp are pooled), reshuffled every epoch
+    def __init__(self, times, batch_size, timestamps_per_batch=1):
+        groups = {}
+        for index, time in enumerate(times):
+            groups.setdefault(time, []).append(index)
+        self.groups = list(groups.values())
+        self.batch_size = batch_size
+        self.timestamps_per_batch = timestamps_per_batch
+        self.chunk_size = -(-batch_size // timestamps_per_batch)
+    def __iter__(self):
+        chunks, rest = [], []
+        for group in self.groups:
+            group = [group[i] for i in torch.randperm(len(group)).tolist()]
+            full = len(group) // self.chunk_size * self.chunk_size
+            chunks += [group[i:i+self.chunk_size] for i in range(0, full, self.chunk_size)]
+            rest += group[full:]
+        chunks += [rest[i:i+self.chunk_size] for i in range(0, len(rest), self.chunk_size)]
+        chunks = [chunks[i] for i in torch.randperm(len(chunks)).tolist()]
+        for i in range(0, len(chunks), self.timestamps_per_batch):
+            yield sum(chunks[i:i+self.timestamps_per_batch], [])[:self.batch_size]
+    def __len__(self):
+        chunks = sum(len(group) // self.chunk_size for group in self.groups)
+        chunks += -(-sum(len(group) % self.chunk_size for group in self.groups) // self.chunk_size)
+        return -(-chunks // self.timestamps_per_batch)
 class FineSampler(Sampler):
     def __init__(self, dataset):
         self.len_dataset = len(dataset) 
@@ -0,0 +1,87 @@
+#
+# Single-file checkpoint of named tensor sections:
+#
+#   b"4DGSPACK" | uint64 header size | JSON header | padding | section | padding | section ...
+#
+# The header lists every section's dtype, shape and offset (relative to the first
+# section); sections start on ALIGNMENT-byte boundaries so they can be memory-mapped
+# and viewed in place. Opening a file only reads the header, a section is mapped the
+# first time it is accessed.
+#
+import json
+import numpy as np
+import torch
+
+MAGIC = b"4DGSPACK"
+ALIGNMENT = 64
+_DTYPES = {torch.float32: "float32", torch.float16: "float16", torch.float64: "float64",
+           torch.int64: "int64", torch.int32: "int32", torch.int16: "int16", torch.uint8: "uint8", torch.bool: "bool"}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_packed(path, tensors, metadata=None):
+    """Writes the dict name -> tensor as one aligned, memory-mappable file."""
+    arrays = {name: tensor.detach().cpu().contiguous() for name, tensor in tensors.items()}
+    sections = {}
+    offset = 0
+    for name, tensor in arrays.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        sections[name] = {"dtype": _DTYPES[tensor.dtype], "shape": list(tensor.shape), "offset": offset, "nbytes": nbytes}
+        offset = _align(offset + nbytes)
+    header = json.dumps({"version": 1, "metadata": metadata or {}, "sections": sections}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, tensor in arrays.items():
+            f.write(b"\0" * (data_start + sections[name]["offset"] - f.tell()))
+            f.write(tensor.numpy().tobytes())
+
+
+class PackedCheckpoint:
+    """Lazily loaded view of a file written by save_packed.
+
+    checkpoint["xyz"] maps only that section and returns a CPU tensor backed by the
+    file: its pages are read on first access and copied privately on first write
+    (mmap copy-on-write), the file is never modified. .to(device) copies it over.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            assert f.read(len(MAGIC)) == MAGIC, f"{path} is not a packed checkpoint"
+            header_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_size).decode("utf-8"))
+        self.metadata = header["metadata"]
+        self.sections = header["sections"]
+        self.data_start = _align(len(MAGIC) + 8 + header_size)
+        self._tensors = {}
+
+    def keys(self):
+        return self.sections.keys()
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def __getitem__(self, name):
+        if name not in self._tensors:
+            section = self.sections[name]
+            if section["nbytes"] == 0:
+                array = np.empty(section["shape"], dtype=section["dtype"])
+            else:
+                count = section["nbytes"] // np.dtype(section["dtype"]).itemsize
+                array = np.memmap(self.path, dtype=section["dtype"], mode="c", shape=(count,),
+                                  offset=self.data_start + section["offset"]).reshape(section["shape"])
+            self._tensors[name] = torch.from_numpy(array)
+        return self._tensors[name]
+
+    def state_dict(self, prefix):
+        return sub_state_dict(self, prefix)
+
+
+def sub_state_dict(sections, prefix):
+    """The sections named prefix + key, as a state dict keyed by key."""
+    return {name[len(prefix):]: sections[name] for name in sections.keys() if name.startswith(prefix)}
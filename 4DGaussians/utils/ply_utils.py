@@ -0,0 +1,91 @@
+#
+# Binary little-endian PLY reader/writer for single-element files of scalar properties,
+# the layout of every PLY this repo writes. Rows are written and read as one block
+# (tobytes / np.memmap) instead of one Python tuple per point; the header is the one
+# plyfile writes, so files are byte-identical to the PlyData([...]).write output.
+#
+import numpy as np
+
+_PLY_TYPES = {"i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort",
+              "i4": "int", "u4": "uint", "f4": "float", "f8": "double"}
+_PLY_TYPE_ALIASES = {"char": "i1", "uchar": "u1", "short": "i2", "ushort": "u2", "int": "i4", "uint": "u4",
+                     "float": "f4", "double": "f8", "int8": "i1", "uint8": "u1", "int16": "i2",
+                     "uint16": "u2", "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8"}
+
+
+def _ply_header(dtype, count, element="vertex"):
+    lines = ["ply", "format binary_little_endian 1.0", f"element {element} {count}"]
+    for name in dtype.names:
+        lines.append(f"property {_PLY_TYPES[dtype[name].str[1:]]} {name}")
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def write_ply_elements(path, elements, element="vertex"):
+    """Writes the structured array elements, one property per field, in one block."""
+    dtype = np.dtype([(name, elements.dtype[name].newbyteorder("<")) for name in elements.dtype.names])
+    elements = np.ascontiguousarray(elements, dtype=dtype)
+    with open(path, "wb") as f:
+        f.write(_ply_header(dtype, len(elements), element))
+        f.write(elements.data)
+
+
+def write_ply(path, data, names, element="vertex"):
+    """Writes the [N, len(names)] matrix data as one property per column, all of data's dtype."""
+    data = np.ascontiguousarray(data, dtype=np.dtype(data.dtype).newbyteorder("<"))
+    assert data.ndim == 2 and data.shape[1] == len(names)
+    dtype = np.dtype([(name, data.dtype) for name in names])
+    with open(path, "wb") as f:
+        f.write(_ply_header(dtype, data.shape[0], element))
+        f.write(data.data)
+
+
+def _read_header(f):
+    header = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY header without end_header")
+        line = line.decode("ascii").strip()
+        header.append(line)
+        if line == "end_header":
+            return header, f.tell()
+
+
+def read_ply(path):
+    """First element (the vertices) of a PLY file as a structured array.
+
+    binary_little_endian files with a single element of scalar properties are
+    memory-mapped, no copy is made; everything else (ascii, big endian, list
+    properties, several elements) is read through plyfile.
+    """
+    with open(path, "rb") as f:
+        header, offset = _read_header(f)
+    elements = [line.split() for line in header if line.startswith("element")]
+    properties = [line.split() for line in header if line.startswith("property")]
+    simple = ("format binary_little_endian 1.0" in header and len(elements) == 1
+              and all(len(p) == 3 and p[1] in _PLY_TYPE_ALIASES for p in properties))
+    if not simple:
+        from plyfile import PlyData
+        return PlyData.read(path).elements[0].data
+    dtype = np.dtype([(p[2], "<" + _PLY_TYPE_ALIASES[p[1]]) for p in properties])
+    count = int(elements[0][2])
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def ply_columns(elements, names, dtype=np.float32):
+    """[N, len(names)] matrix of the given fields.
+
+    When every field has the requested dtype the rows are viewed as a plain matrix,
+    a contiguous run of names is then a view and any other selection one gather.
+    """
+    fields = list(elements.dtype.names)
+    if all(elements.dtype[name] == np.dtype(dtype) for name in fields):
+        matrix = elements.view(dtype).reshape(len(elements), len(fields))
+        index = [fields.index(name) for name in names]
+        if index == list(range(index[0], index[0] + len(index))):
+            return matrix[:, index[0]:index[0] + len(index)]
+        return matrix[:, index]
+    return np.stack([np.asarray(elements[name], dtype=dtype) for name in names], axis=1)
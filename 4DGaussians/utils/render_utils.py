@@ -1,18 +1,18 @@
 import torch
 @torch.no_grad()
 def get_state_at_time(pc,viewpoint_camera):    
-    means3D = pc.get_xyz
-    time = torch.tensor(viewpoint_camera.time).to(means3D.device).repeat(means3D.shape[0],1)
-    opacity = pc._opacity
-    shs = pc.get_features
+    _, (means3D_final, scales_final, rotations_final, opacity_final, shs_final) = next(pc.states_at_times([viewpoint_camera.time]))
 
-    # If precomputed 3d covariance is provided, use it. If not, then it will be computed from
-    # scaling / rotation by the rasterizer.
-    scales = pc._scaling
-    rotations = pc._rotation
-    cov3D_precomp = None
-    means3D_final, scales_final, rotations_final, opacity_final, shs_final = pc._deformation(means3D, scales, 
-                                                                 rotations, opacity, shs,
-                                                                 time)
+    return means3D_final, scales_final, rotations_final, pc._opacity, shs_final
 
-    return means3D_final, scales_final, rotations_final, opacity, shs_final
\ No newline at end of file
+def get_camera_times(cameras):
+    """Timestamps of a FourDGSdataset in index order, read without loading the images where the loader allows it."""
+    dataset = cameras.dataset
+    if hasattr(dataset, "image_times"):
+        # dynerf, multipleview
+        return list(dataset.image_times)
+    if hasattr(dataset, "all_time"):
+        # nerfies / hypernerf
+        indices = {"train": dataset.i_train, "test": dataset.i_test}.get(dataset.split, range(len(dataset)))
+        return [dataset.all_time[i] for i in indices]
+    return [cam.time if hasattr(cam, "time") else cam["time"] for cam in dataset]
@@ -0,0 +1,69 @@
+import torch
+from utils.capacity_utils import CapacityBuffer
+
+
+class RenderWorkspace:
+    """Input buffers of render() reused across renders without autograd.
+
+    screenspace_points and time are CapacityBuffers holding one row per Gaussian (or per
+    culled / LOD node): only reallocated when densification or loading grows the model
+    beyond their capacity, a prune hands out a shorter view of the same storage.
+
+    Two of them leave render(): viewspace_points is the screenspace_points view, which
+    only ever holds zeros, and get_features is the features buffer, refreshed in place
+    after a parameter update like the parameters themselves, and given new storage when
+    the number of Gaussians or SH bands changes. Anything kept across parameter updates
+    (state cache, states_at_times) copies out of the workspace, see owns().
+    """
+    def __init__(self, growth=1.25):
+        self.growth = growth
+        self.buffers = {}
+        self._features = None
+        self.features_valid = False
+        self.feature_allocations = 0
+
+    def _buffer(self, key):
+        if key not in self.buffers:
+            self.buffers[key] = CapacityBuffer(self.growth)
+        return self.buffers[key]
+
+    @property
+    def allocations(self):
+        return sum(buffer.allocations for buffer in self.buffers.values()) + self.feature_allocations
+
+    def invalidate(self):
+        # the parameters changed, the features are copied again on next use
+        self.features_valid = False
+
+    def owns(self, tensor):
+        """Whether tensor shares storage with one of the buffers."""
+        storages = [buffer.storage for buffer in self.buffers.values() if buffer.storage is not None]
+        if self._features is not None:
+            storages.append(self._features)
+        # address ranges rather than Tensor.untyped_storage(), which torch 1.13 lacks
+        pointer = tensor.data_ptr()
+        return any(storage.data_ptr() <= pointer < storage.data_ptr() + storage.numel() * storage.element_size()
+                   for storage in storages)
+
+    def screenspace_points(self, like):
+        """Zero means2D for the rasterizer, which only reads it without autograd."""
+        return self._buffer("screenspace_points").zeros(like.shape, like.dtype, like.device)
+
+    def time(self, time_value, like):
+        """[N, 1] column of time_value, the time input of the deformation field."""
+        return self._buffer("time").empty((like.shape[0], 1), like.dtype, like.device).fill_(time_value)
+
+    def features(self, features_dc, features_rest):
+        """Contiguous torch.cat((features_dc, features_rest), dim=1), copied once per parameter update."""
+        shape = (features_dc.shape[0], features_dc.shape[1] + features_rest.shape[1]) + tuple(features_dc.shape[2:])
+        features = self._features
+        if self.features_valid and tuple(features.shape) == shape:
+            return features
+        if (features is None or tuple(features.shape) != shape or features.dtype != features_dc.dtype
+                or features.device != features_dc.device):
+            # never reshaped in place, views handed out before keep their layout
+            features = torch.empty(shape, dtype=features_dc.dtype, device=features_dc.device)
+            self.feature_allocations += 1
+        torch.cat((features_dc.detach(), features_rest.detach()), dim=1, out=features)
+        self._features, self.features_valid = features, True
+        return features
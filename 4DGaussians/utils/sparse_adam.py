@@ -0,0 +1,79 @@
+import torch
+
+
+class SparseGaussianAdam(torch.optim.Adam):
+    """Adam whose per-Gaussian groups only update the rows visible in the current step.
+
+    The groups named in sparse_groups hold a single [N, ...] parameter. step(visibility=mask)
+    updates the moments and values of the rows where mask is set and leaves the others
+    untouched; each row counts its own steps ("row_step") for the bias correction, so a
+    row moves as dense Adam would have moved it over the steps it was visible in. Without
+    a mask, or when its size does not match the parameter (right after densification),
+    every row is updated. All other groups (deformation MLP and grid) take the dense step.
+    """
+    def __init__(self, params, sparse_groups, **kwargs):
+        super().__init__(params, **kwargs)
+        assert not any(group["amsgrad"] or group["maximize"] for group in self.param_groups)
+        self.sparse_groups = set(sparse_groups)
+
+    def step(self, closure=None, visibility=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        param_groups = self.param_groups
+        self.param_groups = [group for group in param_groups if group.get("name") not in self.sparse_groups]
+        try:
+            super().step()
+        finally:
+            self.param_groups = param_groups
+        rows = None
+        if visibility is not None and not visibility.all():
+            rows = visibility.nonzero(as_tuple=True)[0]
+        for group in param_groups:
+            if group.get("name") in self.sparse_groups:
+                self._sparse_step(group, visibility, rows)
+        return loss
+
+    @torch.no_grad()
+    def _sparse_step(self, group, visibility, rows):
+        beta1, beta2 = group["betas"]
+        for param in group["params"]:
+            if param.grad is None:
+                continue
+            state = self.state[param]
+            if len(state) == 0:
+                state["step"] = torch.tensor(0.0)
+                state["exp_avg"] = torch.zeros_like(param)
+                state["exp_avg_sq"] = torch.zeros_like(param)
+            if "row_step" not in state:
+                # e.g. restored from a dense Adam checkpoint: every row has seen every step
+                state["row_step"] = torch.full((param.shape[0],), float(state["step"]), device=param.device)
+            state["step"] += 1
+
+            param_rows = rows if visibility is not None and visibility.shape[0] == param.shape[0] else None
+            if param_rows is None:
+                # every row visible: update the state tensors in place
+                grad, value = param.grad, param
+                exp_avg, exp_avg_sq, row_step = state["exp_avg"], state["exp_avg_sq"], state["row_step"]
+            else:
+                grad, value = param.grad.index_select(0, param_rows), param.index_select(0, param_rows)
+                exp_avg, exp_avg_sq = state["exp_avg"].index_select(0, param_rows), state["exp_avg_sq"].index_select(0, param_rows)
+                row_step = state["row_step"].index_select(0, param_rows)
+            if group["weight_decay"] != 0:
+                grad = grad.add(value, alpha=group["weight_decay"])
+            exp_avg.lerp_(grad, 1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+            row_step += 1
+
+            shape = (-1,) + (1,) * (param.dim() - 1)
+            step_size = (group["lr"] / (1 - beta1 ** row_step)).view(shape)
+            bias_correction2_sqrt = (1 - beta2 ** row_step).sqrt().view(shape)
+            update = exp_avg_sq.sqrt().div_(bias_correction2_sqrt).add_(group["eps"])
+            torch.div(exp_avg, update, out=update)
+            value.sub_(update.mul_(step_size))
+            if param_rows is not None:
+                param.index_copy_(0, param_rows, value)
+                state["exp_avg"].index_copy_(0, param_rows, exp_avg)
+                state["exp_avg_sq"].index_copy_(0, param_rows, exp_avg_sq)
+                state["row_step"].index_copy_(0, param_rows, row_step)
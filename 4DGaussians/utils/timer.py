@@ -1,4 +1,19 @@
 import time
+import torch
+
+class Event:
+    """torch.cuda.Event(enable_timing=True) stand-in on the wall clock, for CPU runs."""
+    def record(self):
+        self.time = time.time()
+
+    def elapsed_time(self, end):
+        return 1000 * (end.time - self.time)
+
+def timing_event(device):
+    if torch.device(device).type == "cuda":
+        return torch.cuda.Event(enable_timing=True)
+    return Event()
+
 class Timer:
     def __init__(self):
         self.start_time = None